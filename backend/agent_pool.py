@@ -0,0 +1,117 @@
+import contextlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# --- Instance Pool Configuration ---
+AGENT_POOL_MAX_INSTANCES = int(os.getenv("AGENT_POOL_MAX_INSTANCES", "16"))
+AGENT_POOL_IDLE_SECONDS = int(os.getenv("AGENT_POOL_IDLE_SECONDS", "600"))
+AGENT_POOL_MAX_MB = int(os.getenv("AGENT_POOL_MAX_MB", "512"))
+
+
+class InstancePool:
+    """Keeps warm, reusable instances (LIDA Managers, PandasAI Agents) per dataset.
+
+    An instance is leased to one request at a time, so concurrent requests never share
+    mutable state. Factories build instances from a private copy of the dataset, never the
+    stored frame itself, and an instance is only pooled again while that copy still matches
+    the dataset; idle instances are evicted least-recently-used, after sitting idle too
+    long, or when the pool's estimated memory goes over its cap.
+    """
+
+    def __init__(self, max_instances=AGENT_POOL_MAX_INSTANCES, idle_seconds=AGENT_POOL_IDLE_SECONDS, max_mb=AGENT_POOL_MAX_MB):
+        self.max_instances = max(1, max_instances)
+        self.idle_seconds = idle_seconds
+        self.max_bytes = max_mb * 1024 * 1024
+        self._idle = OrderedDict() #(kind, key) -> deque of (instance, released_at, size_bytes), least recently used first
+        self._idle_count = 0
+        self._idle_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _pop_oldest(self):
+        pool_key, entries = next(iter(self._idle.items()))
+        _, _, size_bytes = entries.popleft()
+        if not entries:
+            del self._idle[pool_key]
+        self._idle_count -= 1
+        self._idle_bytes -= size_bytes
+        self.evictions += 1
+
+    def _evict(self):
+        #drop instances idle for too long, then the least recently used ones until within limits
+        cutoff = time.time() - self.idle_seconds
+        for pool_key in list(self._idle):
+            entries = self._idle[pool_key]
+            while entries and entries[0][1] < cutoff:
+                _, _, size_bytes = entries.popleft()
+                self._idle_count -= 1
+                self._idle_bytes -= size_bytes
+                self.evictions += 1
+            if not entries:
+                del self._idle[pool_key]
+        while self._idle and (self._idle_count > self.max_instances or self._idle_bytes > self.max_bytes):
+            self._pop_oldest()
+
+    def acquire(self, kind, key, factory):
+        #returns an idle instance for (kind, key), or a new one from factory() if none is free
+        pool_key = (kind, key)
+        with self._lock:
+            self._evict()
+            entries = self._idle.get(pool_key)
+            if entries:
+                instance, _, size_bytes = entries.pop() #most recently used instance is the warmest
+                if not entries:
+                    del self._idle[pool_key]
+                self._idle_count -= 1
+                self._idle_bytes -= size_bytes
+                self.hits += 1
+                return instance
+            self.misses += 1
+        return factory()
+
+    def release(self, kind, key, instance, size_bytes=0):
+        #returns a leased instance so the next request on the same dataset can reuse it
+        pool_key = (kind, key)
+        if size_bytes > self.max_bytes:
+            return #would push everything else out of the pool on its own
+        with self._lock:
+            entries = self._idle.setdefault(pool_key, deque())
+            entries.append((instance, time.time(), size_bytes))
+            self._idle.move_to_end(pool_key)
+            self._idle_count += 1
+            self._idle_bytes += size_bytes
+            self._evict()
+
+    def discard(self, key):
+        #drops every idle instance held for key, e.g. ones bound to a superseded dataset version
+        with self._lock:
+            for pool_key in [pool_key for pool_key in self._idle if pool_key[1] == key]:
+                entries = self._idle.pop(pool_key)
+                self._idle_count -= len(entries)
+                self._idle_bytes -= sum(size_bytes for _, _, size_bytes in entries)
+                self.evictions += len(entries)
+
+    @contextlib.contextmanager
+    def lease(self, kind, key, factory, size_bytes=0, reusable=None):
+        #instances whose use raised are dropped rather than returned, their state can't be trusted. so are
+        #those reusable(instance) rejects, e.g. ones whose copy of the dataset the request's code changed
+        instance = self.acquire(kind, key, factory)
+        yield instance
+        if reusable is None or reusable(instance):
+            self.release(kind, key, instance, size_bytes)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "idle_instances": self._idle_count,
+                "idle_mb": round(self._idle_bytes / (1024 * 1024), 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -1,38 +1,127 @@
-from flask import Flask, request, jsonify, g 
+from flask import Flask, request, jsonify, g
 from dotenv import load_dotenv
 import os
 import json
 import pandas as pd
+import numpy as np
 import io
 import contextlib
-from datetime import datetime 
-import sqlite3 
+import contextvars
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from lida import Manager, TextGenerationConfig, llm
+from lida.datamodel import Goal
+from lida.components.executor import preprocess_code
 import plotly.graph_objects as go
 import plotly.express as px
-import plotly.io as pio
 from pandasai import Agent
 from pandasai.llm.openai import OpenAI as PandasAiOpenAI
+from database import DATABASE, HistoryStore, HISTORY_PAGE_SIZE
+from dataset_store import DatasetStore, dataset_fingerprint
+from cache import summary_cache, code_cache, code_cache_key
+from jobs import JobQueue, JobStore, SHARED_JOBS, QueueFullError, JobCancelled, check_cancelled, ConcurrencyLimiter, ServerBusyError
+from speculative import SPECULATIVE_MODE, race, speculation_stats
+from fastpath import answer_locally
+from agent_pool import InstancePool
+from executor import CODE_EXECUTOR, CodeExecutor, SpoolError, referenced_columns
+from columnar import ColumnarDataset
+from profiler import SUMMARY_MODE, profile_dataframe, summarize_dataset, refresh_summary
+from wire import decode_dataframe, UnsupportedFormatError, PLOT_FORMATS
+from compression import compress_response
+from metrics import registry, stage, record_branch, start_trace, end_trace, current_trace, request_seconds, request_bytes, response_bytes, TIMING_HEADER
+from figure_reduce import serialize_figure
+from events import emit, listen, format_sse
+from router import IntentRouter, ROUTER_TRAINING_ROWS
 
 load_dotenv()
 app = Flask(__name__)
 
 # --- Database Configuration ---
-DATABASE = 'history.db'
-
-def get_db():
-    #opens a new database connection if there is none yet for the current application context.
-    if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
-    return g.db
-
-@app.teardown_appcontext
-def close_connection(exception):
-    #closes the database connection at the end of the request
-    db = g.pop('db', None)
-    if db is not None:
-        db.close()
+#creates or migrates history.db on startup; writes are batched by a background thread
+history_store = HistoryStore(DATABASE)
+
+# --- Dataset Store ---
+#datasets are uploaded once and referenced by content hash afterwards
+dataset_store = DatasetStore()
+
+def parse_data_json(data_json):
+    #parses a JSON records payload into a DataFrame
+    return pd.read_json(io.StringIO(data_json), orient='records')
+
+def read_request_payload():
+    #returns (fields, df) for either a JSON body with data_json or a multipart body with a binary 'data' part.
+    #df is None when the request carries no dataset (e.g. only a dataset_id)
+    if request.mimetype == 'multipart/form-data':
+        fields = request.form.to_dict()
+        data_file = request.files.get('data')
+        if data_file is None:
+            return fields, None
+        return fields, decode_dataframe(data_file.read(), data_file.mimetype)
+
+    fields = request.get_json(silent=True) or {}
+    if 'data_json' not in fields:
+        return fields, None
+    return fields, parse_data_json(fields['data_json'])
+
+# --- Job Queue ---
+#async /api/query submissions run on a bounded worker pool. with SHARED_JOBS on, their status is kept in the
+#cache database too, so a poll or cancel reaching another server process still finds the job
+job_queue = JobQueue(store=JobStore() if SHARED_JOBS == "on" else None)
+MAX_JOB_WAIT_SECONDS = 30
+RETRY_AFTER_SECONDS = 5 #Retry-After sent with 429 and 503 responses
+STREAM_KEEPALIVE_SECONDS = 15 #idle time before a streamed query sends a keep-alive comment
+
+# --- Batch Queries ---
+#several prompts about one dataset: it is parsed and stored once, and the prompts are answered side by side
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "10"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4")) #prompts answered at once across all synchronous batches
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch-worker")
+
+# --- LLM Concurrency ---
+#queries past the fast path hold one of LLM_CONCURRENCY slots while they call the LLMs, so a burst queues
+#here (and is turned away with 503 after LLM_SLOT_WAIT_SECONDS) instead of piling up on the provider
+llm_limiter = ConcurrencyLimiter()
+
+# --- Instance Pool ---
+#warm LIDA Managers and PandasAI Agents per dataset, leased to one request at a time
+instance_pool = InstancePool()
+
+def pool_key_for(df, dataset_id=None):
+    return dataset_id or dataset_fingerprint(df)
+
+def frame_unchanged(agent, df):
+    #False once a lease's generated code edited the agent's copy in place (dropna, retyped columns, ...),
+    #so the next request on the dataset gets a fresh agent instead of the edited rows
+    return agent.dfs[0].pandas_df.equals(df)
+
+def instance_size_bytes(df):
+    #rough memory estimate for a pooled instance: the DataFrame it holds on to
+    if isinstance(df, ColumnarDataset):
+        return 0 #instances hold a connector, or at most a copy of the dataset's small sample, not the rows
+    return int(df.memory_usage(index=True).sum())
+
+# --- Code Executor ---
+#LLM generated chart code runs in an isolated process pool, started on first use
+code_executor = None
+code_executor_lock = threading.Lock()
+
+def get_code_executor():
+    #returns the shared CodeExecutor, or None when chart code should run inline
+    global code_executor, CODE_EXECUTOR
+    if CODE_EXECUTOR != "process":
+        return None
+    with code_executor_lock:
+        if code_executor is None:
+            try:
+                code_executor = CodeExecutor()
+            except Exception as e:
+                print(f"Error starting code executor, running chart code inline: {e}")
+                CODE_EXECUTOR = "inline"
+        return code_executor
 
 # --- LLM Configuration ---
 openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -48,24 +137,583 @@ except Exception as e:
     text_gen_lida = None
     llm_pandasai = None
 
-#keywords to identify visualisation prompts
-VISUALIZATION_KEYWORDS = [
-    'plot', 'chart', 'graph', 'visualize', 'visualization',
-    'histogram', 'scatter', 'bar', 'line', 'pie', 'map',
-    'show me a plot', 'show me a chart', 'show me a graph',
-    'draw a plot', 'draw a chart', 'draw a graph',
-    'create a plot', 'create a chart', 'create a graph',
-    'generate a plot', 'generate a chart', 'generate a graph'
-]
+#simple aggregations are answered with pandas before any LLM is involved
+FAST_PATH_ENABLED = os.getenv("FAST_PATH", "on") == "on"
+
+#prompts that reach the LLMs are routed to LIDA, PandasAI or both by keyword rules and a classifier
+#trained on past outcomes, retrained in the background as history grows
+intent_router = IntentRouter(speculative=SPECULATIVE_MODE == "on")
+intent_router.train_from(lambda: history_store.outcomes(ROUTER_TRAINING_ROWS))
+
+#PandasAI's own code cache is a DuckDB file only one process can open, so serve.py turns it off when running
+#several workers. code_cache (shared through SQLite) still replays generated code across processes
+PANDASAI_CACHE = os.getenv("PANDASAI_CACHE", "on")
+
+#PandasAI plot results point at image files on disk, so only these result types are safe to replay
+CACHEABLE_PANDASAI_TYPES = ("string", "number", "dataframe")
+
+def execute_chart_code(code, df):
+    #runs LIDA generated plotly code against df in this process and returns the figure it builds, or None
+    if isinstance(df, ColumnarDataset):
+        #read only the columns the code names from disk, or all of them if it turns out to need more
+        columns = referenced_columns(code, list(df.columns))
+        if columns is not None:
+            try:
+                return build_figure(code, df.to_pandas(columns))
+            except Exception as e:
+                print(f"Chart code failed on the columns it names, retrying with all of them: {e}")
+        return build_figure(code, df.to_pandas())
+    return build_figure(code, df.copy())
+
+def build_figure(code, data):
+    #runs chart code against a private frame
+    #prints go to this call's own buffer, redirect_stdout would swap sys.stdout for every request thread
+    stdout_capture = io.StringIO()
+    local_vars = {"pd": pd, "px": px, "go": go, "data": data,
+                  "print": functools.partial(print, file=stdout_capture)}
+    exec(code, local_vars)
+
+    fig = None
+    if 'plot' in local_vars and callable(local_vars['plot']):
+         fig = local_vars['plot'](data)
+    elif 'fig' in local_vars:
+        fig = local_vars['fig']
+    elif 'chart' in local_vars:
+        fig = local_vars['chart']
+
+    return fig if isinstance(fig, go.Figure) else None
+
+def render_chart_code(code, df, dataset_id=None):
+    #runs generated chart code (isolated when the executor is enabled) and returns (figure JSON, reduction), or None
+    with stage("chart_render"):
+        executor = get_code_executor()
+        if executor is not None:
+            try:
+                return executor.run_chart_code(code, df, pool_key_for(df, dataset_id))
+            except SpoolError as e:
+                print(f"{e}. Running chart code inline.")
+        fig = execute_chart_code(code, df)
+        if fig is None:
+            return None
+    with stage("figure_serialize"):
+        return serialize_figure(fig)
+
+def plot_payload(chart_json, reduction=None):
+    #builds a plot response, flagging figures whose large traces were downsampled or aggregated
+    payload = {"response_type": "plot", "content": chart_json, "reduced": reduction is not None}
+    if reduction is not None:
+        payload["reduction"] = reduction
+    return payload
+
+def execute_pandasai_code(code, df):
+    #replays code PandasAI generated earlier: it reads dfs[0] (or queries execute_sql_query) and stores {"type", "value"} in result
+    if isinstance(df, ColumnarDataset):
+        environment = {"pd": pd, "np": np, "execute_sql_query": df.sql}
+    else:
+        environment = {"pd": pd, "np": np, "dfs": [df.copy()]}
+        environment["df"] = environment["dfs"][0]
+    exec(code, environment)
+    result = environment.get("result")
+    if not isinstance(result, dict) or result.get("type") not in CACHEABLE_PANDASAI_TYPES:
+        raise ValueError("Cached PandasAI code did not return a usable result")
+    return result["value"]
+
+def format_pandasai_response(response_pandasai):
+    #converts a PandasAI answer into a text response payload
+    if isinstance(response_pandasai, str):
+        return {"response_type": "text", "content": response_pandasai}
+    elif isinstance(response_pandasai, (pd.DataFrame, pd.Series)):
+         return {"response_type": "text", "content": response_pandasai.to_markdown()}
+    else:
+        return {"response_type": "text", "content": str(response_pandasai)}
+
+#one lock per summary cache key, so concurrent prompts on a dataset (e.g. a batch) summarize it once
+summary_locks = {}
+summary_locks_guard = threading.Lock()
+
+def summary_lock(cache_key):
+    with summary_locks_guard:
+        return summary_locks.setdefault(cache_key, threading.Lock())
+
+def summary_data(df):
+    #LIDA summarizes a fixed sample of out-of-core datasets, the chart itself uses every row
+    return df.sample() if isinstance(df, ColumnarDataset) else df
+
+def get_lida_summary(lida, df, dataset_id=None):
+    #the summary only depends on the dataset, so reuse it across visual prompts instead of building it again.
+    #SUMMARY_MODE picks the local profiler, the profiler plus an LLM pass over unclassified columns, or LIDA's LLM summary
+    cache_key = f"{SUMMARY_MODE}:{dataset_id or dataset_fingerprint(df)}"
+    summary = summary_cache.get(cache_key)
+    if summary is None:
+        with summary_lock(cache_key):
+            summary = summary_cache.get(cache_key) #filled in while this request waited for the lock
+            if summary is None:
+                with stage("lida_summarize"):
+                    summary = summarize_dataset(lida, summary_data(df), SUMMARY_MODE)
+                summary_cache.set(cache_key, summary)
+                emit("summary", cached=False)
+                return summary
+    emit("summary", cached=True)
+    return summary
+
+def supersede_dataset(parent_id, dataset_id, appended=None, replaced=None):
+    #a new version's summary is derived from its parent's cached one instead of being rebuilt, then what is cached
+    #for the parent version alone is dropped. generated code is keyed by schema, so it still replays on the new version
+    parent_key = f"{SUMMARY_MODE}:{parent_id}"
+    summary = summary_cache.get(parent_key)
+    if summary is not None:
+        try:
+            with stage("summary_refresh"):
+                summary = refresh_summary(summary, dataset_store.sketch(dataset_id), appended, replaced)
+            summary_cache.set(f"{SUMMARY_MODE}:{dataset_id}", summary)
+        except Exception as e:
+            print(f"Error refreshing summary for dataset {dataset_id}, it will be rebuilt on first use: {e}")
+        summary_cache.delete(parent_key)
+    instance_pool.discard(parent_id)
+    if code_executor is not None:
+        code_executor.discard(parent_id)
+
+
+# --- Query Pipeline ---
+def run_fast_path(prompt, df):
+    #returns a payload for prompts the local planner understands, or None to use the LLM path
+    try:
+        with stage("fast_path"):
+            result = answer_locally(prompt, df)
+    except Exception as e:
+        print(f"Error in fast path, falling back to LLM: {e}")
+        record_branch("fast_path", "error")
+        return None
+    if result is None:
+        record_branch("fast_path", "miss")
+        return None
+    record_branch("fast_path", "hit")
+    if isinstance(result, go.Figure):
+        with stage("figure_serialize"):
+            return plot_payload(*serialize_figure(result))
+    return format_pandasai_response(result)
+
+def run_lida_branch(prompt, df, dataset_id=None, cancel_event=None):
+    #returns a plot payload, or None if LIDA couldn't produce a figure
+    #replay chart code generated for the same question and schema before asking the LLM
+    lida_cache_key = code_cache_key("lida", prompt, df)
+    cached_code = code_cache.get(lida_cache_key)
+    if cached_code:
+        emit("code", branch="lida", cached=True, code=cached_code)
+        try:
+            rendered = render_chart_code(cached_code, df, dataset_id)
+            if rendered is not None:
+                record_branch("lida", "cached_code")
+                return plot_payload(*rendered)
+        except Exception as exec_error:
+            print(f"Error replaying cached LIDA code: {exec_error}")
+
+    #try visualising
+    check_cancelled(cancel_event)
+    try:
+        factory = lambda: Manager(text_gen=text_gen_lida)
+        with instance_pool.lease("lida", pool_key_for(df, dataset_id), factory, instance_size_bytes(df)) as lida:
+            summary = get_lida_summary(lida, df, dataset_id)
+            check_cancelled(cancel_event)
+            textgen_config = TextGenerationConfig(n=1, temperature=0.2, use_cache=True, model="gpt-4o-mini")
+
+            #only the code is generated here. visualize() would also run it in this process, unsandboxed,
+            #the code executor is the one place generated code runs
+            with stage("lida_generate"):
+                lida.check_textgen(config=textgen_config)
+                code_specs = lida.vizgen.generate(
+                    summary=summary,
+                    goal=Goal(question=prompt, visualization=prompt, rationale=""),
+                    textgen_config=textgen_config,
+                    text_gen=lida.text_gen,
+                    library="plotly"
+                )
+
+            if code_specs and code_specs[0].strip():
+                code_to_execute = preprocess_code(code_specs[0])
+                emit("code", branch="lida", cached=False, code=code_to_execute)
+                try:
+                    rendered = render_chart_code(code_to_execute, df, dataset_id)
+                    if rendered is not None:
+                        code_cache.set(lida_cache_key, code_to_execute) #only cache code that produced a figure
+                        record_branch("lida", "success")
+                        return plot_payload(*rendered)
+                    else:
+                         print("LIDA code executed but did not produce a recognized Plotly figure.")
+
+                except Exception as exec_error:
+                    print(f"Error executing LIDA generated code: {exec_error}")
+                    record_branch("lida", "code_error")
+                    return None
+
+    except JobCancelled:
+        raise
+    except Exception as lida_error:
+        print(f"Error during LIDA processing: {lida_error}")
+        record_branch("lida", "error")
+        return None
+    record_branch("lida", "no_figure")
+    return None
+
+def run_pandasai_branch(prompt, df, visual_intent=False, dataset_id=None, cancel_event=None):
+    #returns a text payload, or an error payload if PandasAI failed too
+    out_of_core = isinstance(df, ColumnarDataset)
+    #SQL written for an out-of-core dataset doesn't run on a DataFrame of the same schema, and vice versa
+    pandasai_cache_key = code_cache_key("pandasai_sql" if out_of_core else "pandasai", prompt, df)
+    cached_code = code_cache.get(pandasai_cache_key)
+    if cached_code:
+        emit("code", branch="pandasai", cached=True, code=cached_code)
+        try:
+            with stage("pandasai_replay"):
+                result = execute_pandasai_code(cached_code, df)
+            record_branch("pandasai", "cached_code")
+            return format_pandasai_response(result)
+        except Exception as exec_error:
+            print(f"Error replaying cached PandasAI code: {exec_error}")
+
+    check_cancelled(cancel_event)
+    try:
+        #a warm agent keeps its conversation memory, so follow-up questions on the same dataset have context
+        #out-of-core datasets are queried through DuckDB: PandasAI has the LLM write SQL instead of pandas code
+        if out_of_core:
+            factory = lambda: Agent(df.connector(), config={"llm": llm_pandasai, "direct_sql": True, "enable_cache": PANDASAI_CACHE == "on"})
+        else:
+            #generated code edits dfs[0] in place, so the agent gets a copy rather than the stored dataset every request shares
+            factory = lambda: Agent(df.copy(), config={"llm": llm_pandasai, "enable_cache": PANDASAI_CACHE == "on"})
+        reusable = None if out_of_core else lambda agent: frame_unchanged(agent, df)
+        with instance_pool.lease("pandasai", pool_key_for(df, dataset_id), factory, instance_size_bytes(df), reusable) as agent:
+            agent.last_result = None
+            agent.last_code_executed = None
+            with stage("pandasai_chat"):
+                response_pandasai = agent.chat(prompt)
+            if agent.last_code_executed:
+                emit("code", branch="pandasai", cached=False, code=agent.last_code_executed)
+
+            #chat() reports failures as text, so only cache code whose result made it through parsing
+            last_result = agent.last_result
+            if agent.last_code_executed and isinstance(last_result, dict) and last_result.get("type") in CACHEABLE_PANDASAI_TYPES:
+                code_cache.set(pandasai_cache_key, agent.last_code_executed)
+
+        record_branch("pandasai", "success")
+        return format_pandasai_response(response_pandasai)
+
+    except Exception as pandasai_error:
+         print(f"Error during PandasAI processing: {pandasai_error}")
+         record_branch("pandasai", "error")
+         error_msg = f"LIDA failed and PandasAI fallback also failed: {pandasai_error}" if visual_intent else f"PandasAI failed: {pandasai_error}"
+         return {"response_type": "error", "content": error_msg}
+
+@contextlib.contextmanager
+def llm_slot(cancel_event=None):
+    #holds one of this process's LLM slots, raising ServerBusyError if none frees up in time
+    with stage("llm_slot_wait"):
+        llm_limiter.acquire(cancel_event)
+    try:
+        yield
+    finally:
+        llm_limiter.release()
+
+def run_query_pipeline(prompt, df, dataset_id=None, cancel_event=None):
+    #answers a prompt with LIDA (visual prompts) or PandasAI and returns the response payload.
+    #cancel_event is checked before each LLM stage so queued/async jobs can be stopped early
+
+    if FAST_PATH_ENABLED:
+        response_payload = run_fast_path(prompt, df)
+        if response_payload:
+            emit("intent", route="fast_path", visual=response_payload.get("response_type") == "plot")
+            return response_payload
+
+    #intent detection
+    decision = intent_router.route(prompt)
+    visual_intent = decision.visual
+    record_branch("router", decision.route)
+    emit("intent", visual=visual_intent, **decision.to_dict())
+
+    #processing logic
+    if decision.route == "speculative":
+        #run both branches at once instead of paying for LIDA's failure before PandasAI starts. each branch holds
+        #its own LLM slot, so a losing branch still finishing its LLM call keeps counting against the limit
+        def lida_branch(cancel_event):
+            with llm_slot(cancel_event):
+                return run_lida_branch(prompt, df, dataset_id, cancel_event)
+
+        def pandasai_branch(cancel_event):
+            with llm_slot(cancel_event):
+                return run_pandasai_branch(prompt, df, visual_intent, dataset_id, cancel_event)
+
+        response_payload, speculation = race(("lida", lida_branch), ("pandasai", pandasai_branch), cancel_event=cancel_event)
+        response_payload["speculation"] = speculation
+        return response_payload
+
+    with llm_slot(cancel_event):
+        return run_sequential_branches(prompt, df, decision, dataset_id, cancel_event)
+
+def run_sequential_branches(prompt, df, decision, dataset_id=None, cancel_event=None):
+    #LIDA first for prompts routed to it, then PandasAI
+    visual_intent = decision.visual
+    if decision.route == "lida":
+        response_payload = run_lida_branch(prompt, df, dataset_id, cancel_event)
+        if response_payload:
+            return response_payload
+        record_branch("lida", "fallback_to_pandasai")
+        emit("fallback", source="lida", target="pandasai")
+
+    #use pandasai if LIDA failed OR if the router sent the prompt straight here
+    return run_pandasai_branch(prompt, df, visual_intent, dataset_id, cancel_event)
+
+def save_history(prompt, dataset_name, response_type):
+    #queues a prompt for the history table and returns its id, the insert itself happens off the request path
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with stage("history_insert"):
+        history_id = history_store.add(prompt, dataset_name, response_type, timestamp)
+    intent_router.observe()
+    return history_id
+
+def history_validators(dataset_name=None):
+    #weak ETag and Last-Modified for a dataset's history (or all of it), both change on every insert or feedback
+    version, updated_at = history_store.version(dataset_name)
+    last_modified = None
+    if updated_at:
+        last_modified = datetime.strptime(updated_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return f"v{version}", last_modified
+
+def set_history_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True) #weak, the body may be sent gzip or zstd encoded
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True #clients may keep it, but must revalidate before reuse
+    return response
+
+def embed_plot(response_payload, plot_format):
+    #"object" clients get the figure itself rather than its JSON string
+    if plot_format != "object" or response_payload.get("response_type") != "plot":
+        return response_payload
+    return dict(response_payload, content=json.loads(response_payload["content"]))
+
+def answer_query(prompt, df, dataset_name, dataset_id=None, plot_format="string", cancel_event=None):
+    #runs the pipeline, saves it to history and returns the /api/query response body with its status code
+    try:
+        response_payload = run_query_pipeline(prompt, df, dataset_id, cancel_event)
+    except ServerBusyError as e:
+        #not an answer, so it stays out of history; the client may retry
+        return {"response": {"response_type": "error", "content": str(e)}, "history_id": None, "dataset_id": dataset_id}, 503
+    history_id = None
+
+    # --- Save to History Database ---
+    if response_payload:
+        try:
+            history_id = save_history(prompt, dataset_name, response_payload.get("response_type", "unknown"))
+        except Exception as db_error:
+            print(f"Database Error saving history: {db_error}")
+
+    status_code = 500 if response_payload.get("response_type") == "error" else 200
+    return {"response": embed_plot(response_payload, plot_format), "history_id": history_id, "dataset_id": dataset_id}, status_code
+
+def run_query_job(prompt, df, dataset_name, dataset_id=None, plot_format="string", cancel_event=None):
+    #worker threads have no request, but history saving needs an application context
+    with app.app_context():
+        return answer_query(prompt, df, dataset_name, dataset_id, plot_format, cancel_event)
+
+def resolve_query_dataset(payload, df):
+    #returns (df, dataset_id, None) for the uploaded or referenced dataset, or (None, None, error response)
+    dataset_id = None
+    if df is None:
+        dataset_id = payload['dataset_id']
+        with stage("dataset_store"):
+            df = dataset_store.get(dataset_id)
+        if df is None:
+            return None, None, (jsonify({"response_type": "error", "content": f"Unknown dataset_id: {dataset_id}"}), 404)
+    elif not df.empty:
+        try:
+            with stage("dataset_store"):
+                dataset_id = dataset_store.register(df) #let the caller switch to dataset_id next time
+                df = dataset_store.get(dataset_id) #large uploads are queried from disk rather than from this copy
+        except Exception as e:
+            print(f"Error storing dataset: {e}")
+
+    if df.empty:
+        return None, None, (jsonify({"response_type": "error", "content": "Received empty dataset."}), 400)
+    return df, dataset_id, None
+
+def read_batch_prompts(payload):
+    #prompts arrive as a JSON list, or as a JSON encoded list in a multipart form field
+    prompts = payload.get('prompts')
+    if isinstance(prompts, str):
+        try:
+            prompts = json.loads(prompts)
+        except ValueError:
+            raise ValueError("prompts must be a JSON list of strings")
+    if not isinstance(prompts, list) or not prompts or not all(isinstance(p, str) and p.strip() for p in prompts):
+        raise ValueError("prompts must be a non-empty list of non-empty strings")
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        raise ValueError(f"At most {BATCH_MAX_PROMPTS} prompts per batch")
+    return prompts
+
+def run_batch_item(prompt, df, dataset_name, dataset_id, plot_format):
+    #one prompt of a synchronous batch, in the shape of a /api/query body
+    try:
+        body, status_code = run_query_job(prompt, df, dataset_name, dataset_id, plot_format)
+    except Exception as e:
+        print(f"Error answering batch prompt '{prompt}': {e}")
+        body = {"response": {"response_type": "error", "content": f"An unexpected server error occurred: {e}"}, "history_id": None}
+        status_code = 500
+    body.pop("dataset_id", None)
+    return dict(body, prompt=prompt, status=status_code)
+
+def stream_query(prompt, df, dataset_name, dataset_id, plot_format):
+    """Runs a query as a job and returns a Server-Sent Events response reporting its progress.
+
+    Events: parsed, intent, summary, code, fallback (as the pipeline emits them), then answer with
+    the /api/query body and its status, or error if the job failed or was cancelled. A client that
+    disconnects cancels the job at its next checkpoint.
+    """
+    progress = queue.Queue()
+
+    def run(cancel_event):
+        with listen(lambda event, data: progress.put((event, data))):
+            try:
+                return run_query_job(prompt, df, dataset_name, dataset_id, plot_format, cancel_event)
+            finally:
+                progress.put((None, None)) #no more events
+
+    try:
+        job = job_queue.submit(run)
+    except QueueFullError as e:
+        return jsonify({"response_type": "error", "content": str(e)}), 429, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+
+    def events():
+        try:
+            yield format_sse("parsed", {"job_id": job.id, "dataset_id": dataset_id, "rows": len(df), "columns": len(df.columns)})
+            while True:
+                try:
+                    event, data = progress.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    if job.finished: #cancelled before it started, so run() never reported
+                        break
+                    yield ": keep-alive\n\n" #comment line, stops proxies closing an idle stream
+                    continue
+                if event is None:
+                    break
+                yield format_sse(event, data)
+            job.finished_event.wait()
+            if job.status == "done":
+                body, status_code = job.result
+                yield format_sse("answer", dict(body, status=status_code))
+            else:
+                yield format_sse("error", {"status": job.status, "content": job.error or f"Query {job.status}"})
+        finally:
+            if not job.finished:
+                job_queue.cancel(job.id) #the client went away
+
+    return app.response_class(events(), mimetype="text/event-stream",
+                              headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def job_response(job):
+    #job status, plus the usual /api/query body once the job is done
+    body = job.to_dict()
+    if job.status == "done":
+        body.update(job.result[0])
+    return body
+
+
+# --- Metrics ---
+#component counters are read at scrape time rather than duplicated
+def cache_stat_snapshots():
+    return {"summary_cache": summary_cache.stats(), "code_cache": code_cache.stats(), "instance_pool": instance_pool.stats()}
+
+def cache_ratio_samples():
+    return [({"cache": name}, stats["hit_rate"]) for name, stats in cache_stat_snapshots().items()]
+
+def cache_lookup_samples():
+    samples = []
+    for name, stats in cache_stat_snapshots().items():
+        samples.append(({"cache": name, "result": "hit"}, stats["hits"]))
+        samples.append(({"cache": name, "result": "miss"}, stats["misses"]))
+    return samples
+
+def queue_samples():
+    return [({"state": state}, count) for state, count in job_queue.depth().items()]
+
+registry.callback("cache_hit_ratio", "gauge", "Hit rate of each cache since startup.", cache_ratio_samples)
+registry.callback("cache_lookups_total", "counter", "Cache lookups by result.", cache_lookup_samples)
+registry.callback("job_queue", "gauge", "Async query jobs by state, and the queue's capacity.", queue_samples)
+registry.callback("llm_slots", "gauge", "LLM concurrency slots in use, queries waiting for one, and the limit.",
+                  lambda: [({"state": state}, value) for state, value in llm_limiter.stats().items() if state != "rejected"])
+registry.callback("llm_slot_rejections_total", "counter", "Queries turned away after waiting too long for an LLM slot.",
+                  lambda: [({}, llm_limiter.stats()["rejected"])])
+registry.callback("speculation_wins_total", "counter", "Speculative races won by each branch.",
+                  lambda: [({"branch": branch}, wins) for branch, wins in speculation_stats.to_dict()["wins"].items()])
 
-def is_visualization_prompt(prompt: str) -> bool:
-    #checks if the prompt likely asks for a visualization.
-    prompt_lower = prompt.lower()
-    return any(keyword in prompt_lower for keyword in VISUALIZATION_KEYWORDS)
+
+# --- Serving ---
+#set once this process can answer queries, cleared while a server process drains. /api/ready reports it,
+#so a load balancer only routes to started workers while /api/health stays a plain liveness check
+server_ready = threading.Event()
+
+def warm_up():
+    #runs the local stages once on a tiny frame, so lazy imports and first-call setup in pandas, plotly and the
+    #profiler happen before the first request. serve.py calls it before forking, so every worker starts warm
+    start = time.perf_counter()
+    df = pd.DataFrame({"region": ["north", "south", "north"], "price": [1.0, 2.5, 4.0],
+                       "date": pd.to_datetime(["2024-01-01", "2024-02-01", "2024-03-01"])})
+    try:
+        run_fast_path("average price by region", df)
+        run_fast_path("bar chart of price by region", df)
+        chart = build_figure("fig = px.scatter(data, x='date', y='price', color='region')", df.copy())
+        serialize_figure(chart)
+        format_pandasai_response(df.describe())
+        profile_dataframe(df)
+    except Exception as e:
+        print(f"Error warming up, the first requests will be slower: {e}")
+    print(f"Backend warmed up in {time.perf_counter() - start:.2f}s")
+
+def after_fork():
+    #called in each worker forked from a preloaded server process, before it takes requests
+    server_ready.clear()
+    history_store.after_fork()
+    #the chart executor's process pool can't be inherited, so each worker starts its own off the request path
+    threading.Thread(target=get_code_executor, name="executor-start", daemon=True).start()
+    server_ready.set()
+
+def before_exit():
+    #called in a stopping worker once it has finished its requests
+    server_ready.clear()
+    history_store.flush()
+    if code_executor is not None:
+        code_executor.shutdown()
 
 
 #--- Flask Routes ---
 
+@app.after_request
+def compress(response):
+    return compress_response(response, request.accept_encodings)
+
+@app.before_request
+def start_request_trace():
+    g.request_start = time.perf_counter()
+    g.trace_token = start_trace()
+
+@app.after_request
+def record_request_metrics(response):
+    #registered after compress, so it runs first and sees the uncompressed body size
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    request_seconds.observe(time.perf_counter() - g.request_start, route=route, method=request.method, status=response.status_code)
+    request_bytes.observe(request.content_length or 0, route=route)
+    if not response.direct_passthrough and not response.is_streamed:
+        response_bytes.observe(response.calculate_content_length() or 0, route=route)
+    if TIMING_HEADER == "on" or request.headers.get("X-Timing") in ("1", "true"):
+        trace = current_trace()
+        if trace is not None and trace.server_timing():
+            response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+@app.teardown_request
+def end_request_trace(exception):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        end_trace(token)
+
 @app.route('/')
 def home():
     return jsonify({"message": "Welcome to the Data Query Viz Backend with LIDA & PandasAI"})
@@ -76,125 +724,168 @@ def health_check():
     llm_status = "initialized" if text_gen_lida and llm_pandasai else "initialization_failed"
     db_status = "connected"
     try:
-        get_db().cursor() # Try getting a cursor
+        history_store.reader().execute("SELECT 1")
     except Exception as e:
         db_status = f"connection_failed: {e}"
-    return jsonify({"status": "Backend is running", "llm_status": llm_status, "db_status": db_status})
+    return jsonify({"status": "Backend is running", "llm_status": llm_status, "db_status": db_status, "queue": job_queue.depth()})
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    #503 until this process has started (and while it drains), or if it couldn't take a query right now
+    checks = {"started": server_ready.is_set(), "llm": bool(text_gen_lida and llm_pandasai), "database": True}
+    try:
+        history_store.reader().execute("SELECT 1")
+    except Exception as e:
+        print(f"Database Error in readiness check: {e}")
+        checks["database"] = False
+    body = {"ready": all(checks.values()), "checks": checks, "pid": os.getpid(), "llm_slots": llm_limiter.stats(), "queue": job_queue.depth()}
+    return jsonify(body), 200 if body["ready"] else 503
+
+@app.route('/api/datasets', methods=['POST'])
+def register_dataset():
+    #stores a dataset once and returns the id to use in later queries
+    try:
+        with stage("read_payload"):
+            payload, df = read_request_payload()
+    except UnsupportedFormatError as e:
+        return jsonify({"error": str(e)}), 415
+    except Exception as e:
+        return jsonify({"error": f"Error processing dataset payload: {e}"}), 400
+
+    if df is None:
+        return jsonify({"error": "Missing required field (data_json or a binary 'data' part)"}), 400
+
+    if df.empty:
+        return jsonify({"error": "Received empty dataset."}), 400
+
+    try:
+        with stage("dataset_store"):
+            dataset_id = dataset_store.register(df)
+    except Exception as e:
+        print(f"Error storing dataset: {e}")
+        return jsonify({"error": f"Failed to store dataset: {e}"}), 500
+
+    return jsonify({"dataset_id": dataset_id, "rows": len(df), "columns": [str(col) for col in df.columns]}), 200
+
+@app.route('/api/datasets/<dataset_id>', methods=['GET'])
+def get_dataset_info(dataset_id):
+    #lets clients check whether a dataset_id is still known before querying with it
+    df = dataset_store.get(dataset_id)
+    if df is None:
+        return jsonify({"error": f"Unknown dataset_id: {dataset_id}"}), 404
+    version = dataset_store.version(dataset_id)
+    return jsonify({"dataset_id": dataset_id, "rows": len(df), "columns": [str(col) for col in df.columns],
+                    "version": version["version"], "parent_id": version["parent_id"]}), 200
+
+@app.route('/api/datasets/<dataset_id>/stats', methods=['GET'])
+def get_dataset_stats(dataset_id):
+    #per-column counts, nulls, approximate distinct values and numeric/date ranges, kept up to date across versions
+    if not dataset_store.exists(dataset_id):
+        return jsonify({"error": f"Unknown dataset_id: {dataset_id}"}), 404
+    try:
+        with stage("dataset_sketch"):
+            sketch = dataset_store.sketch(dataset_id)
+    except Exception as e:
+        print(f"Error computing statistics for dataset {dataset_id}: {e}")
+        return jsonify({"error": f"Failed to compute dataset statistics: {e}"}), 500
+    return jsonify(dict(sketch.stats(), dataset_id=dataset_id)), 200
+
+def update_dataset(dataset_id, operation):
+    #shared by the append and column routes: stores the change as a new version and returns its dataset_id
+    try:
+        with stage("read_payload"):
+            payload, df = read_request_payload()
+    except UnsupportedFormatError as e:
+        return jsonify({"error": str(e)}), 415
+    except Exception as e:
+        return jsonify({"error": f"Error processing dataset payload: {e}"}), 400
+
+    if df is None:
+        return jsonify({"error": "Missing required field (data_json or a binary 'data' part)"}), 400
+    if df.empty:
+        return jsonify({"error": "Received no rows." if operation == "append" else "Received no columns."}), 400
+    if not dataset_store.exists(dataset_id):
+        return jsonify({"error": f"Unknown dataset_id: {dataset_id}"}), 404
+
+    try:
+        with stage("dataset_update"):
+            if operation == "append":
+                new_id = dataset_store.append(dataset_id, df)
+            else:
+                new_id = dataset_store.replace_columns(dataset_id, df)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except KeyError:
+        return jsonify({"error": f"Unknown dataset_id: {dataset_id}"}), 404
+    except Exception as e:
+        print(f"Error updating dataset {dataset_id}: {e}")
+        return jsonify({"error": f"Failed to update dataset: {e}"}), 500
+
+    supersede_dataset(dataset_id, new_id, appended=df if operation == "append" else None,
+                      replaced=df if operation == "replace_columns" else None)
+    return get_dataset_info(new_id)
+
+@app.route('/api/datasets/<dataset_id>/rows', methods=['POST'])
+def append_dataset_rows(dataset_id):
+    #appends rows (same columns as the dataset, sent like an upload) and returns the new version's dataset_id.
+    #the old dataset_id stays queryable; its cached summary is carried over to the new version and then dropped
+    return update_dataset(dataset_id, "append")
+
+@app.route('/api/datasets/<dataset_id>/columns', methods=['POST'])
+def replace_dataset_columns(dataset_id):
+    #replaces or adds whole columns, one value per row in row order, and returns the new version's dataset_id
+    return update_dataset(dataset_id, "replace_columns")
 
 @app.route('/api/query', methods=['POST'])
 def query():
     if not text_gen_lida or not llm_pandasai:
          return jsonify({"response_type": "error", "content": "LLM not initialized. Check API key and backend logs."}), 500
 
-    history_id = None #initialize history_id
-    response_payload = {} #to store the final response content and type
+    dataset_id = None
 
     try:
-        payload = request.get_json()
-        if not payload or 'prompt' not in payload or 'data_json' not in payload:
-            return jsonify({"response_type": "error", "content": "Missing required fields (prompt and data_json)"}), 400
+        try:
+            with stage("read_payload"):
+                payload, df = read_request_payload()
+        except UnsupportedFormatError as e:
+            return jsonify({"response_type": "error", "content": str(e)}), 415
+        except Exception as e:
+             return jsonify({"response_type": "error", "content": f"Error processing dataset payload: {e}"}), 400
+
+        if 'prompt' not in payload or (df is None and 'dataset_id' not in payload):
+            return jsonify({"response_type": "error", "content": "Missing required fields (prompt and dataset_id, data_json or a binary 'data' part)"}), 400
 
         prompt = payload['prompt']
-        data_json = payload['data_json']
         dataset_name = payload.get('dataset_name', 'Unnamed Dataset')
+        plot_format = payload.get('plot_format', 'string')
+        if plot_format not in PLOT_FORMATS:
+            return jsonify({"response_type": "error", "content": f"Unsupported plot_format: {plot_format}"}), 400
 
         #data processing
-        try:
-            df = pd.read_json(io.StringIO(data_json), orient='records')
-        except Exception as e:
-             return jsonify({"response_type": "error", "content": f"Error processing data JSON: {e}"}), 400
-
-        if df.empty:
-             return jsonify({"response_type": "error", "content": "Received empty dataset."}), 400
+        df, dataset_id, error = resolve_query_dataset(payload, df)
+        if error:
+            return error
 
-        #intent detection
-        visual_intent = is_visualization_prompt(prompt)
-        lida_success = False #check if plot is usable
+        # --- Streaming ---
+        #clients accepting text/event-stream get progress events while the pipeline runs, then the answer
+        if request.accept_mimetypes.best_match(["application/json", "text/event-stream"]) == "text/event-stream":
+            return stream_query(prompt, df, dataset_name, dataset_id, plot_format)
 
-        #processing logic
-        if visual_intent:
-            #try visualising
+        # --- Async Submission ---
+        #async callers get a job id straight away and poll /api/jobs/<job_id> for the result
+        if str(payload.get('async', '')).lower() in ('true', '1'):
             try:
-                lida = Manager(text_gen=text_gen_lida)
-                summary = lida.summarize(df, summary_method="llm")
-                textgen_config = TextGenerationConfig(n=1, temperature=0.2, use_cache=True, model="gpt-4o-mini")
+                job = job_queue.submit(run_query_job, prompt, df, dataset_name, dataset_id, plot_format)
+            except QueueFullError as e:
+                return jsonify({"response_type": "error", "content": str(e)}), 429, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+            body = job.to_dict()
+            body.update({"dataset_id": dataset_id, "status_url": f"/api/jobs/{job.id}"})
+            return jsonify(body), 202
 
-                charts = lida.visualize(
-                    summary=summary,
-                    goal=prompt,
-                    library="plotly",
-                    textgen_config=textgen_config
-                )
-
-                if charts and charts[0].code:
-                    code_to_execute = charts[0].code
-                    local_vars = {"pd": pd, "px": px, "go": go, "data": df.copy()}
-                    stdout_capture = io.StringIO()
-                    try:
-                        with contextlib.redirect_stdout(stdout_capture):
-                            exec(code_to_execute, local_vars)
-
-                        fig = None
-                        if 'plot' in local_vars and callable(local_vars['plot']):
-                             fig = local_vars['plot'](df.copy())
-                        elif 'fig' in local_vars:
-                            fig = local_vars['fig']
-                        elif 'chart' in local_vars:
-                            fig = local_vars['chart']
-
-                        if fig and isinstance(fig, (go.Figure)):
-                            chart_json = pio.to_json(fig)
-                            lida_success = True #LIDA successful
-                            response_payload = {"response_type": "plot", "content": chart_json}
-                        else:
-                             print("LIDA code executed but did not produce a recognized Plotly figure.")
-
-                    except Exception as exec_error:
-                        print(f"Error executing LIDA generated code: {exec_error}")
-
-            except Exception as lida_error:
-                print(f"Error during LIDA processing: {lida_error}")
-
-        if not lida_success: #use pandasai if LIDA failed OR if intent wasn't visual
-            try:
-                agent = Agent(df, config={"llm": llm_pandasai})
-                response_pandasai = agent.chat(prompt)
-
-                if isinstance(response_pandasai, str):
-                    response_payload = {"response_type": "text", "content": response_pandasai}
-                elif isinstance(response_pandasai, (pd.DataFrame, pd.Series)):
-                     response_str = response_pandasai.to_markdown()
-                     response_payload = {"response_type": "text", "content": response_str}
-                else:
-                    response_payload = {"response_type": "text", "content": str(response_pandasai)}
-
-            except Exception as pandasai_error:
-                 print(f"Error during PandasAI processing: {pandasai_error}")
-                 error_msg = f"LIDA failed and PandasAI fallback also failed: {pandasai_error}" if visual_intent else f"PandasAI failed: {pandasai_error}"
-                 response_payload = {"response_type": "error", "content": error_msg}
-
-        # --- Save to History Database ---
-        if response_payload: 
-            try:
-                db = get_db()
-                cursor = db.cursor()
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                response_type = response_payload.get("response_type", "unknown")
-
-                cursor.execute('''
-                    INSERT INTO prompt_history (prompt, dataset_name, response_type, timestamp)
-                    VALUES (?, ?, ?, ?)
-                ''', (prompt, dataset_name, response_type, timestamp))
-                db.commit()
-                history_id = cursor.lastrowid #get the ID of the inserted row
-            except Exception as db_error:
-                print(f"Database Error saving history: {db_error}")
-
-        # --- Return Final Response ---
-        if response_payload.get("response_type") == "error":
-             return jsonify({"response": response_payload, "history_id": history_id}), 500
-        else:
-             return jsonify({"response": response_payload, "history_id": history_id}), 200
+        body, status_code = answer_query(prompt, df, dataset_name, dataset_id, plot_format)
+        if status_code == 503:
+            return jsonify(body), status_code, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+        return jsonify(body), status_code
 
 
     except Exception as e:
@@ -203,27 +894,118 @@ def query():
         return jsonify({"response": error_response, "history_id": None}), 500
 
 
+@app.route('/api/query/batch', methods=['POST'])
+def query_batch():
+    #answers several prompts about one dataset. the body is /api/query's with "prompts" (a list) instead of "prompt".
+    #results come back in prompt order; with async they are submitted as one job per prompt to poll individually
+    if not text_gen_lida or not llm_pandasai:
+         return jsonify({"response_type": "error", "content": "LLM not initialized. Check API key and backend logs."}), 500
+
+    try:
+        with stage("read_payload"):
+            payload, df = read_request_payload()
+    except UnsupportedFormatError as e:
+        return jsonify({"response_type": "error", "content": str(e)}), 415
+    except Exception as e:
+        return jsonify({"response_type": "error", "content": f"Error processing dataset payload: {e}"}), 400
+
+    if 'prompts' not in payload or (df is None and 'dataset_id' not in payload):
+        return jsonify({"response_type": "error", "content": "Missing required fields (prompts and dataset_id, data_json or a binary 'data' part)"}), 400
+    try:
+        prompts = read_batch_prompts(payload)
+    except ValueError as e:
+        return jsonify({"response_type": "error", "content": str(e)}), 400
+
+    dataset_name = payload.get('dataset_name', 'Unnamed Dataset')
+    plot_format = payload.get('plot_format', 'string')
+    if plot_format not in PLOT_FORMATS:
+        return jsonify({"response_type": "error", "content": f"Unsupported plot_format: {plot_format}"}), 400
+
+    df, dataset_id, error = resolve_query_dataset(payload, df)
+    if error:
+        return error
+
+    if str(payload.get('async', '')).lower() in ('true', '1'):
+        try:
+            jobs = job_queue.submit_many([(run_query_job, (prompt, df, dataset_name, dataset_id, plot_format), {}) for prompt in prompts])
+        except QueueFullError as e:
+            return jsonify({"response_type": "error", "content": str(e)}), 429, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+        return jsonify({
+            "dataset_id": dataset_id,
+            "jobs": [dict(job.to_dict(), prompt=prompt, status_url=f"/api/jobs/{job.id}") for prompt, job in zip(prompts, jobs)],
+        }), 202
+
+    #each prompt keeps the request's trace context, so its stages show up in Server-Timing
+    futures = [batch_executor.submit(contextvars.copy_context().run, run_batch_item, prompt, df, dataset_name, dataset_id, plot_format)
+               for prompt in prompts]
+    return jsonify({"dataset_id": dataset_id, "results": [future.result() for future in futures]}), 200
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    #polls an async query. ?wait=N long-polls for up to N seconds until the job finishes
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_JOB_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
+    job = job_queue.wait(job_id, wait)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found."}), 404
+    return jsonify(job_response(job)), 200
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found."}), 404
+    return jsonify(job_response(job)), 200
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    #hit/miss counters for the backend caches
+    return jsonify({"summary_cache": summary_cache.stats(), "code_cache": code_cache.stats(), "instance_pool": instance_pool.stats()}), 200
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_route():
+    #Prometheus text exposition of stage latencies, branch outcomes, cache hit rates and payload sizes
+    return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@app.route('/api/speculation/stats', methods=['GET'])
+def speculation_stats_route():
+    #which branch wins speculative LIDA/PandasAI races and the latency that saved
+    return jsonify(speculation_stats.to_dict()), 200
+
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    #retrieves prompt history, optionally filtered by dataset_name.
+    #retrieves prompt history newest first, optionally filtered by dataset_name.
+    #pages are ?limit=N long, pass the returned next_cursor as ?cursor= to get the next one.
+    #clients revalidate a cached page with If-None-Match or If-Modified-Since and get 304 if nothing changed
     dataset_filter = request.args.get('dataset_name')
     try:
-        db = get_db()
-        cursor = db.cursor()
-        if dataset_filter:
-            cursor.execute('''
-                SELECT id, prompt, dataset_name, timestamp, feedback FROM prompt_history
-                WHERE dataset_name = ? ORDER BY timestamp DESC
-            ''', (dataset_filter,))
+        limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        etag, last_modified = history_validators(dataset_filter)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
         else:
-             cursor.execute('''
-                SELECT id, prompt, dataset_name, timestamp, feedback FROM prompt_history
-                ORDER BY timestamp DESC LIMIT 100
-            ''') 
-
-        history_rows = cursor.fetchall()
-        history_list = [dict(row) for row in history_rows]
-        return jsonify({"history": history_list}), 200
+            not_modified = bool(last_modified and request.if_modified_since and last_modified <= request.if_modified_since)
+        if not_modified:
+            return set_history_validators(app.response_class(status=304), etag, last_modified)
+
+        with stage("history_read"):
+            history_list, next_cursor = history_store.page(dataset_filter, limit, request.args.get('cursor'))
+        response = jsonify({"history": history_list, "next_cursor": next_cursor})
+        return set_history_validators(response, etag, last_modified), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Database Error fetching history: {e}")
         return jsonify({"error": f"Failed to fetch history: {e}"}), 500
@@ -240,24 +1022,25 @@ def handle_feedback():
     feedback = payload['feedback']
 
     try:
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute('''
-            UPDATE prompt_history SET feedback = ? WHERE id = ?
-        ''', (feedback, history_id))
-        db.commit()
-
-        if cursor.rowcount == 0:
+        with stage("feedback_write"):
+            found = history_store.set_feedback(history_id, feedback)
+        if not found:
              return jsonify({"error": f"History ID {history_id} not found."}), 404
         else:
-             return jsonify({"message": "Feedback submitted successfully."}), 200
+             #returns the dataset history's new validators, so a client can patch its cached copy instead of refetching
+             dataset_name = history_store.get(history_id)["dataset_name"]
+             response = jsonify({"message": "Feedback submitted successfully.", "dataset_name": dataset_name})
+             return set_history_validators(response, *history_validators(dataset_name)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Database Error submitting feedback: {e}")
         return jsonify({"error": f"Failed to submit feedback: {e}"}), 500
 
 
+#imports, LLM clients and stores are set up
+server_ready.set()
+
 if __name__ == '__main__':
-    if not os.path.exists(DATABASE):
-        from database import init_db
-        init_db()
+    #development server; see serve.py for running with several preloaded worker processes
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,124 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dataset_store import schema_signature
+
+# --- Cache Configuration ---
+#lives next to history.db
+CACHE_DATABASE = os.getenv("CACHE_DATABASE", "cache.db")
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "256"))
+CODE_CACHE_MAX_ENTRIES = int(os.getenv("CODE_CACHE_MAX_ENTRIES", "2048"))
+
+
+class SQLiteCache:
+    """Size-bounded key/value cache persisted in SQLite. Least recently used entries are evicted first."""
+
+    def __init__(self, table, max_entries, database=CACHE_DATABASE):
+        self.table = table
+        self.max_entries = max(1, max_entries)
+        self.database = database
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock() #guards the counters
+        with self._connect() as conn:
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_used ON {self.table} (last_used)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        #commits on success and always closes the connection
+        conn = sqlite3.connect(self.database, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        #returns the cached value or None, refreshing the entry's position in the LRU order
+        try:
+            with self._connect() as conn:
+                row = conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            print(f"Cache Error reading {self.table}: {e}")
+            row = None
+        self._count(row is not None)
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key, value):
+        #values must be JSON serializable; anything else (e.g. timestamps) is stored as its string form
+        try:
+            with self._connect() as conn:
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO {self.table} (key, value, last_used) VALUES (?, ?, ?)
+                ''', (key, json.dumps(value, default=str), time.time()))
+                conn.execute(f'''
+                    DELETE FROM {self.table} WHERE key IN (
+                        SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_entries,))
+        except sqlite3.Error as e:
+            print(f"Cache Error writing {self.table}: {e}")
+
+    def delete(self, key):
+        #drops an entry that no longer applies, e.g. the summary of a superseded dataset version
+        try:
+            with self._connect() as conn:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            print(f"Cache Error deleting from {self.table}: {e}")
+
+    def stats(self) -> dict:
+        try:
+            with self._connect() as conn:
+                entries = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+
+def normalize_prompt(prompt: str) -> str:
+    #case, surrounding whitespace and trailing punctuation don't change what is being asked
+    return re.sub(r"\s+", " ", prompt.strip().lower()).rstrip(" ?.!")
+
+
+def code_cache_key(branch: str, prompt: str, df) -> str:
+    #generated code depends on the question and the schema, not on the row values
+    raw = json.dumps([branch, normalize_prompt(prompt), schema_signature(df)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+#LIDA dataset summaries keyed by summary method and dataset id (or fingerprint)
+summary_cache = SQLiteCache("lida_summaries", SUMMARY_CACHE_MAX_ENTRIES)
+#validated LIDA/PandasAI code keyed by branch, normalized prompt and schema
+code_cache = SQLiteCache("generated_code", CODE_CACHE_MAX_ENTRIES)
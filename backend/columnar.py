@@ -0,0 +1,282 @@
+import json
+import os
+import threading
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandasai.connectors.base import BaseConnector
+from pandasai.connectors.sql import SQLConnector, SqliteConnectorConfig
+from pandasai.exceptions import MaliciousQueryError
+
+from metrics import stage
+
+# --- Columnar Engine Configuration ---
+#datasets whose columns add up to more than this (uncompressed) stay in their parquet file and are queried
+#through DuckDB, instead of being held as a DataFrame and copied into every request. 0 keeps everything in memory
+OUT_OF_CORE_MB = int(os.getenv("OUT_OF_CORE_MB", "256"))
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "1GB") #DuckDB spills to DUCKDB_TEMP_DIR beyond this
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "4"))
+DUCKDB_TEMP_DIR = os.getenv("DUCKDB_TEMP_DIR", "duckdb_spill")
+SQL_RESULT_MAX_ROWS = int(os.getenv("SQL_RESULT_MAX_ROWS", "100000")) #rows a query may bring back into pandas
+OUT_OF_CORE_SAMPLE_ROWS = int(os.getenv("OUT_OF_CORE_SAMPLE_ROWS", "10000")) #rows LIDA summarizes for a large dataset
+
+SQL_TABLE_NAME = "dataset" #what queries, including PandasAI's generated SQL, call the dataset
+SAMPLE_SEED = 42 #the same sample every time, so summaries don't change between restarts
+
+
+def check_read_only(sql, conn):
+    #the engine is shared, so generated SQL must be exactly one SELECT, and may only read its own dataset:
+    #other datasets' views and table functions (read_csv, read_text, glob, ...) are rejected after parsing
+    statements = conn.extract_statements(sql)
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        raise MaliciousQueryError("Only a single read-only SELECT can run against a dataset")
+    parsed = json.loads(conn.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0])
+    if parsed["error"]:
+        raise MaliciousQueryError(f"Query couldn't be checked: {parsed['error_message']}")
+    check_relations(parsed["statements"][0]["node"], {SQL_TABLE_NAME})
+
+
+def check_relations(node, allowed):
+    #walks a json_serialize_sql tree, allowing only the names in allowed and the query's own CTEs in scope.
+    #a CTE's body sees the CTEs before it, not itself unless recursive, as a name DuckDB resolves elsewhere
+    #could otherwise be smuggled in under the CTE's name
+    if isinstance(node, list):
+        for item in node:
+            check_relations(item, allowed)
+        return
+    if not isinstance(node, dict):
+        return
+    if node.get("type") == "TABLE_FUNCTION":
+        raise MaliciousQueryError(f"Table functions can't be used against a dataset: {node['function'].get('function_name')}")
+    if node.get("type") == "BASE_TABLE":
+        if node["schema_name"] or node["catalog_name"] or node["table_name"].lower() not in allowed:
+            raise MaliciousQueryError(f"Only the {SQL_TABLE_NAME} table can be queried, not {node['table_name']}")
+        return
+    if node.get("type") == "RECURSIVE_CTE_NODE":
+        allowed = allowed | {node["cte_name"].lower()}
+    for cte in node.get("cte_map", {}).get("map", []):
+        check_relations(cte["value"], allowed)
+        allowed = allowed | {cte["key"].lower()}
+    for key, value in node.items():
+        if key != "cte_map":
+            check_relations(value, allowed)
+
+
+def quote_identifier(name) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def quote_literal(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def parquet_size_bytes(path) -> int:
+    #uncompressed size of a parquet file's columns, read from its footer
+    metadata = pq.read_metadata(path)
+    return sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+
+
+class ColumnarEngine:
+    """One in-process DuckDB database with a view per out-of-core dataset, shared by every request.
+
+    Queries scan the parquet files in place, so concurrent requests share DuckDB's buffer pool
+    rather than each holding a copy of the dataset.
+    """
+
+    def __init__(self, memory_limit=DUCKDB_MEMORY_LIMIT, threads=DUCKDB_THREADS, temp_dir=DUCKDB_TEMP_DIR):
+        os.makedirs(temp_dir, exist_ok=True)
+        self._conn = duckdb.connect(config={"memory_limit": memory_limit, "threads": max(1, threads), "temp_directory": temp_dir})
+        self._lock = threading.Lock()
+        self._views = set()
+
+    def view(self, dataset_id, path) -> str:
+        #creates the dataset's view on first use and returns its name
+        name = f"dataset_{dataset_id}"
+        with self._lock:
+            if name not in self._views:
+                self._conn.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet({quote_literal(os.path.abspath(path))})")
+                self._views.add(name)
+        return name
+
+    def drop_view(self, dataset_id):
+        #for a superseded version: the view is recreated if the old dataset_id is queried again
+        name = f"dataset_{dataset_id}"
+        with self._lock:
+            if name in self._views:
+                self._conn.execute(f"DROP VIEW IF EXISTS {name}")
+                self._views.discard(name)
+
+    def export(self, sql, path, frames=None):
+        """Writes the result of a query over the dataset views, and any DataFrames in frames by name, to a parquet file."""
+        cursor = self._conn.cursor()
+        try:
+            for name, frame in (frames or {}).items():
+                cursor.register(name, frame)
+            with stage("sql_export"):
+                cursor.execute(f"COPY ({sql}) TO {quote_literal(path)} (FORMAT parquet)")
+        finally:
+            cursor.close()
+
+    def query(self, view, sql, params=None, max_rows=SQL_RESULT_MAX_ROWS) -> pd.DataFrame:
+        """Runs a read-only query with the dataset available as SQL_TABLE_NAME, returning at most max_rows rows."""
+        #every query gets its own cursor: cursors share the database and its buffer pool but run concurrently,
+        #and the temp view naming this query's dataset is private to the cursor
+        cursor = self._conn.cursor()
+        try:
+            check_read_only(sql, cursor)
+            cursor.execute(f"CREATE TEMP VIEW {SQL_TABLE_NAME} AS SELECT * FROM {view}")
+            with stage("sql_query"):
+                relation = cursor.sql(sql.strip().rstrip(";"), params=params)
+                if max_rows:
+                    relation = relation.limit(max_rows)
+                return relation.df()
+        finally:
+            cursor.close()
+
+
+class ColumnarDataset:
+    """A stored dataset queried in place from its parquet file.
+
+    Covers the parts of the DataFrame interface the pipeline reads without touching rows (len,
+    columns, dtypes, empty); rows are only reached through SQL, a fixed sample or a projection
+    of the columns a piece of code needs.
+    """
+
+    def __init__(self, dataset_id, path, engine, distinct_counts=None):
+        self.dataset_id = dataset_id
+        self.path = path
+        self.engine = engine
+        self.num_rows = pq.read_metadata(path).num_rows
+        self._schema_frame = pq.read_schema(path).empty_table().to_pandas() #zero rows, same dtypes as read_parquet
+        self.view = engine.view(dataset_id, path)
+        self._sample = None
+        self._distinct = dict(distinct_counts or {}) #column -> approximate distinct count, seeded from the stored sketch
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.num_rows
+
+    @property
+    def columns(self):
+        return self._schema_frame.columns
+
+    @property
+    def dtypes(self):
+        return self._schema_frame.dtypes
+
+    @property
+    def empty(self):
+        return self.num_rows == 0 or len(self.columns) == 0
+
+    def schema_frame(self) -> pd.DataFrame:
+        return self._schema_frame
+
+    def sql(self, query, params=None, max_rows=SQL_RESULT_MAX_ROWS) -> pd.DataFrame:
+        return self.engine.query(self.view, query, params, max_rows)
+
+    def head(self, n=5) -> pd.DataFrame:
+        return self.sql(f"SELECT * FROM {SQL_TABLE_NAME} LIMIT {int(n)}")
+
+    def sample(self, rows=OUT_OF_CORE_SAMPLE_ROWS) -> pd.DataFrame:
+        #a fixed random sample, computed once and shared
+        with self._lock:
+            if self._sample is None:
+                if self.num_rows <= rows:
+                    self._sample = self.to_pandas()
+                else:
+                    self._sample = self.sql(f"SELECT * FROM {SQL_TABLE_NAME} USING SAMPLE reservoir({int(rows)} ROWS) REPEATABLE ({SAMPLE_SEED})",
+                                            max_rows=None)
+            return self._sample
+
+    def distinct_count(self, column) -> int:
+        #approximate, it's used to judge whether a column is a sensible thing to group by
+        with self._lock:
+            count = self._distinct.get(column)
+        if count is None:
+            count = int(self.sql(f"SELECT approx_count_distinct({quote_identifier(column)}) FROM {SQL_TABLE_NAME}").iloc[0, 0])
+            with self._lock:
+                self._distinct[column] = count
+        return count
+
+    def to_pandas(self, columns=None) -> pd.DataFrame:
+        """Reads the given columns (all by default) into a private DataFrame, from the memory-mapped file."""
+        with stage("column_scan"):
+            return pq.read_table(self.path, columns=columns, memory_map=True).to_pandas()
+
+    def write_arrow(self, path):
+        #streams the dataset into an Arrow IPC file batch by batch, never holding all of it in memory
+        parquet_file = pq.ParquetFile(self.path, memory_map=True)
+        schema = parquet_file.schema_arrow
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for batch in parquet_file.iter_batches():
+                writer.write_batch(batch)
+
+    def write_appended(self, rows: pd.DataFrame, path):
+        #a new version with rows after this one's, streamed file to file. UNION BY NAME lines the columns up
+        #and widens types where the new rows need it (e.g. nulls in an integer column)
+        self.engine.export(f"SELECT * FROM {self.view} UNION ALL BY NAME SELECT * FROM new_rows", path, {"new_rows": rows})
+
+    def write_replaced(self, columns: pd.DataFrame, path):
+        #a new version with whole columns replaced or added, matched to this one's rows by position
+        replaced = [column for column in columns.columns if column in self.columns]
+        added = [column for column in columns.columns if column not in self.columns]
+        select = "stored.*"
+        if replaced:
+            select += " REPLACE (" + ", ".join(f"new_columns.{quote_identifier(c)} AS {quote_identifier(c)}" for c in replaced) + ")"
+        select += "".join(f", new_columns.{quote_identifier(c)}" for c in added)
+        self.engine.export(f"SELECT {select} FROM {self.view} AS stored POSITIONAL JOIN new_columns", path, {"new_columns": columns})
+
+    def connector(self):
+        return DuckDBConnector(self)
+
+
+class DuckDBConnector(SQLConnector):
+    """PandasAI connector over a ColumnarDataset, for agents running with direct_sql.
+
+    PandasAI then has the LLM write SQL and runs it here through execute_sql_query,
+    so answers come back as query results instead of the whole table being loaded.
+    """
+
+    def __init__(self, dataset: ColumnarDataset, **kwargs):
+        #SQLConnector.__init__ opens a SQLAlchemy engine, DuckDB is queried directly instead
+        BaseConnector.__init__(self, SqliteConnectorConfig(dialect="duckdb", table=SQL_TABLE_NAME, database=dataset.path), **kwargs)
+        self.dataset = dataset
+        self.name = SQL_TABLE_NAME
+        self._rows_count = len(dataset)
+        self._columns_count = len(dataset.columns)
+
+    def _init_connection(self, config):
+        pass
+
+    def __del__(self):
+        pass
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} dataset={self.dataset.dataset_id} rows={len(self.dataset)}>"
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        return self.dataset.head(n)
+
+    def execute(self) -> pd.DataFrame:
+        #generated code reading dfs[0] would load the whole table, failing sends PandasAI's error prompt instead
+        raise ValueError(f"The dataset is too large to load as a DataFrame, query it with execute_sql_query on table {SQL_TABLE_NAME}")
+
+    def execute_direct_sql_query(self, sql_query):
+        return self.dataset.sql(sql_query)
+
+    @property
+    def path(self):
+        return f"duckdb://{self.dataset.path}"
+
+    @property
+    def cs_table_name(self):
+        return SQL_TABLE_NAME
+
+    @property
+    def type(self):
+        return "duckdb"
+
+    def equals(self, other):
+        return isinstance(other, DuckDBConnector) and other.dataset.dataset_id == self.dataset.dataset_id
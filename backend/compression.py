@@ -0,0 +1,55 @@
+import gzip
+import os
+
+import pyarrow as pa
+
+# --- Response Compression Configuration ---
+#"on" compresses JSON and text responses with the best encoding the client accepts, "off" sends them as is
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "on")
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("RESPONSE_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/")
+
+
+def _zstd(data: bytes) -> bytes:
+    #pyarrow's zstd codec writes standard zstd frames, so no extra dependency is needed
+    return pa.Codec("zstd", compression_level=ZSTD_LEVEL).compress(data, asbytes=True)
+
+
+def _gzip(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+#content codings in order of preference
+ENCODERS = {"zstd": _zstd, "gzip": _gzip}
+if not pa.Codec.is_available("zstd"):
+    del ENCODERS["zstd"]
+
+
+def choose_encoding(accept_encodings):
+    #returns the preferred coding the client accepts (werkzeug Accept object), or None
+    for encoding in ENCODERS:
+        if accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def compress_response(response, accept_encodings):
+    """after_request hook: compresses large JSON/text bodies using the negotiated Content-Encoding."""
+    if RESPONSE_COMPRESSION != "on" or not response.mimetype.startswith(COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    if response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers:
+        return response #streams and files are sent as they are produced
+
+    data = response.get_data()
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None or len(data) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+    response.set_data(ENCODERS[encoding](data))
+    response.headers["Content-Encoding"] = encoding
+    return response
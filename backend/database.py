@@ -1,15 +1,27 @@
 import sqlite3
 import os
+import atexit
+import base64
+import binascii
+import queue
+import threading
+import time
 
-DATABASE = 'history.db'
+DATABASE = os.getenv("HISTORY_DATABASE", 'history.db')
 
-def init_db():
-    # Check if DB exists, connect or create
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+# --- History Store Configuration ---
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "100")) #most writes grouped into one transaction
+HISTORY_FLUSH_SECONDS = float(os.getenv("HISTORY_FLUSH_SECONDS", "0.05")) #how long the writer waits to fill a batch
+HISTORY_ID_BLOCK_SIZE = int(os.getenv("HISTORY_ID_BLOCK_SIZE", "100")) #ids reserved per trip to the database
+PENDING_WAIT_FLUSHES = 4 #flush intervals to wait for a row another process reserved the id of
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+FEEDBACK_VALUES = ('useful', 'not_useful')
 
-    # Create table with updated schema
-    cursor.execute('''
+#schema migrations, applied in order to bring PRAGMA user_version up to len(MIGRATIONS).
+#databases created before versioning are at version 0 and already have the table, hence IF NOT EXISTS
+MIGRATIONS = [
+    '''
         CREATE TABLE IF NOT EXISTS prompt_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             prompt TEXT NOT NULL,
@@ -18,12 +30,319 @@ def init_db():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
             feedback TEXT CHECK(feedback IN ('useful', 'not_useful', NULL))
         )
-    ''')
-    conn.commit()
-    conn.close()
+    ''',
+    #history is listed newest first, per dataset or overall, with id breaking timestamp ties
+    '''
+        CREATE INDEX IF NOT EXISTS idx_prompt_history_dataset_timestamp
+            ON prompt_history (dataset_name, timestamp DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_prompt_history_timestamp
+            ON prompt_history (timestamp DESC, id DESC);
+    ''',
+    #a version per dataset, bumped by every insert or feedback change, backs the ETag on /api/history
+    '''
+        CREATE TABLE IF NOT EXISTS history_versions (
+            dataset_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT OR IGNORE INTO history_versions (dataset_name, version)
+            SELECT COALESCE(dataset_name, ''), COUNT(*) FROM prompt_history GROUP BY COALESCE(dataset_name, '');
+        CREATE TRIGGER IF NOT EXISTS prompt_history_insert_version AFTER INSERT ON prompt_history
+        BEGIN
+            INSERT INTO history_versions (dataset_name, version, updated_at)
+                VALUES (COALESCE(NEW.dataset_name, ''), 1, CURRENT_TIMESTAMP)
+                ON CONFLICT (dataset_name) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+        END;
+        CREATE TRIGGER IF NOT EXISTS prompt_history_feedback_version AFTER UPDATE OF feedback ON prompt_history
+        BEGIN
+            UPDATE history_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE dataset_name = COALESCE(NEW.dataset_name, '');
+        END;
+    ''',
+]
+
+
+def connect(database=DATABASE):
+    #WAL lets readers keep going while the background writer commits
+    conn = sqlite3.connect(database, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL") #durable at each checkpoint, safe against corruption in WAL mode
+    return conn
+
+
+def migrate(conn, database=DATABASE):
+    #brings an existing or new database up to the current schema version
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.executescript(f"BEGIN; {script}; PRAGMA user_version = {target}; COMMIT;")
+        print(f"Migrated database '{database}' to schema version {target}")
+
+
+def init_db(database=DATABASE):
+    # Check if DB exists, connect or create, then apply any pending migrations
+    conn = connect(database)
+    try:
+        migrate(conn, database)
+    finally:
+        conn.close()
+
+
+def encode_cursor(timestamp, history_id) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp}|{history_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    #returns (timestamp, id) from encode_cursor, raising ValueError for anything else
+    try:
+        timestamp, history_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return timestamp, int(history_id)
+    except (UnicodeError, ValueError, binascii.Error):
+        raise ValueError(f"Invalid history cursor: {cursor}")
+
+
+class HistoryStore:
+    """Prompt history with write-behind batching.
+
+    Inserts and feedback updates are queued and committed by a background thread in grouped
+    transactions. Ids are handed out from blocks reserved in sqlite_sequence, so callers get their
+    history_id immediately and several server processes can share one database file.
+    """
+
+    def __init__(self, database=DATABASE, batch_size=HISTORY_BATCH_SIZE, flush_seconds=HISTORY_FLUSH_SECONDS,
+                 id_block_size=HISTORY_ID_BLOCK_SIZE):
+        self.database = database
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.id_block_size = max(1, id_block_size)
+        init_db(database)
+        self._start()
+        atexit.register(self.flush)
+
+    def _start(self):
+        self._writes = queue.Queue()
+        self._readers = threading.local()
+        self._id_lock = threading.Lock()
+        self._next_id, self._last_id = 1, 0
+        #writes are numbered in queue order, and the writer commits them in that order, so a read only has to
+        #wait until the number of the last write it depends on is committed, not for the whole queue to drain
+        self._queued_seq, self._committed_seq = 0, 0
+        self._pending_ids = {} #{history_id: (seq, dataset_name)} for inserts the writer hasn't committed yet
+        self._pending_datasets = {} #{dataset_name or '': seq of its last uncommitted write}
+        self._pending_lock = threading.Condition()
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def after_fork(self):
+        #a forked process inherits no writer thread and must not share the parent's connections or id block,
+        #so it starts over with its own. call it in the child before anything else uses the store
+        self._start()
+
+    def reader(self):
+        #one connection per thread, reused across requests instead of reconnecting each time
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = self._readers.conn = connect(self.database)
+        return conn
+
+    # --- Writes ---
+    def _reserve_ids(self):
+        #bumps the AUTOINCREMENT counter by a whole block, so no other process or later insert reuses these ids
+        conn = connect(self.database)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'prompt_history'").fetchone()
+            start = (row[0] if row else 0) + 1
+            end = start + self.id_block_size - 1
+            if row:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'prompt_history'", (end,))
+            else:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('prompt_history', ?)", (end,))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        self._next_id, self._last_id = start, end
+
+    def _allocate_id(self):
+        with self._id_lock:
+            if self._next_id > self._last_id:
+                self._reserve_ids()
+            history_id = self._next_id
+            self._next_id += 1
+            return history_id
+
+    def _queue(self, sql, params, dataset_name, history_id=None):
+        #numbered and queued under the lock, so queue order and numbering agree
+        with self._pending_lock:
+            self._queued_seq += 1
+            seq = self._queued_seq
+            if history_id is not None:
+                self._pending_ids[history_id] = (seq, dataset_name)
+            self._pending_datasets[dataset_name or ''] = seq
+            self._writes.put((sql, params, seq, history_id))
+
+    def add(self, prompt, dataset_name, response_type, timestamp):
+        """Queues a history row and returns its id straight away."""
+        history_id = self._allocate_id()
+        self._queue('''
+            INSERT INTO prompt_history (id, prompt, dataset_name, response_type, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (history_id, prompt, dataset_name, response_type, timestamp), dataset_name, history_id)
+        return history_id
+
+    def _stored_row(self, history_id):
+        return self.reader().execute("SELECT dataset_name FROM prompt_history WHERE id = ?", (history_id,)).fetchone()
+
+    def _locate(self, history_id):
+        #returns (True, dataset_name) if the row is stored or queued, else (False, None)
+        with self._pending_lock:
+            if history_id in self._pending_ids:
+                return True, self._pending_ids[history_id][1]
+        row = self._stored_row(history_id)
+        if row is not None:
+            return True, row[0]
+        #another process may have handed out the id and not committed its row yet. only reserved ids can
+        #still appear, and only until that process's writer next flushes
+        row = self.reader().execute("SELECT seq FROM sqlite_sequence WHERE name = 'prompt_history'").fetchone()
+        if not isinstance(history_id, int) or row is None or history_id > row[0]:
+            return False, None
+        deadline = time.monotonic() + self.flush_seconds * PENDING_WAIT_FLUSHES
+        while time.monotonic() < deadline:
+            time.sleep(self.flush_seconds)
+            row = self._stored_row(history_id)
+            if row is not None:
+                return True, row[0]
+        return False, None
+
+    def exists(self, history_id) -> bool:
+        return self._locate(history_id)[0]
+
+    def set_feedback(self, history_id, feedback) -> bool:
+        """Queues a feedback update, returning False if the history row doesn't exist."""
+        if feedback not in FEEDBACK_VALUES:
+            raise ValueError(f"Feedback must be one of {', '.join(FEEDBACK_VALUES)}")
+        found, dataset_name = self._locate(history_id)
+        if not found:
+            return False
+        #queued after the row's insert, so the update always finds it
+        self._queue("UPDATE prompt_history SET feedback = ? WHERE id = ?", (feedback, history_id), dataset_name)
+        return True
+
+    def _next_batch(self):
+        batch = [self._writes.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._writes.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, conn, batch):
+        try:
+            with conn:
+                for sql, params, _, _ in batch:
+                    conn.execute(sql, params)
+            return
+        except sqlite3.Error as e:
+            print(f"Database Error writing history batch, retrying one by one: {e}")
+        for sql, params, _, _ in batch:
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            except sqlite3.Error as e:
+                print(f"Database Error writing history: {e}")
+
+    def _write_loop(self):
+        conn = connect(self.database)
+        while True:
+            batch = self._next_batch()
+            self._commit(conn, batch)
+            with self._pending_lock:
+                self._committed_seq = batch[-1][2]
+                for _, _, _, history_id in batch:
+                    self._pending_ids.pop(history_id, None)
+                for dataset_name in [name for name, seq in self._pending_datasets.items() if seq <= self._committed_seq]:
+                    del self._pending_datasets[dataset_name]
+                self._pending_lock.notify_all()
+            for _ in batch:
+                self._writes.task_done()
+
+    def flush(self):
+        #blocks until every queued write is committed
+        self._writes.join()
+
+    def _wait_for(self, seq):
+        #blocks until the writes numbered up to seq are committed, later ones don't hold the caller up
+        with self._pending_lock:
+            self._pending_lock.wait_for(lambda: self._committed_seq >= seq)
+
+    def _wait_for_dataset(self, dataset_name=None):
+        #read your own writes: waits for the ones already queued for this dataset, or for any dataset without one
+        with self._pending_lock:
+            seq = self._pending_datasets.get(dataset_name, 0) if dataset_name else self._queued_seq
+        self._wait_for(seq)
+
+    # --- Reads ---
+    def get(self, history_id):
+        #returns one history row as a dict, or None
+        with self._pending_lock:
+            seq = self._pending_ids.get(history_id, (0, None))[0]
+        self._wait_for(seq)
+        row = self.reader().execute('''
+            SELECT id, prompt, dataset_name, timestamp, feedback FROM prompt_history WHERE id = ?
+        ''', (history_id,)).fetchone()
+        return dict(row) if row else None
+
+    def version(self, dataset_name=None):
+        """Returns (version, updated_at UTC text or None) for a dataset's history, or for all of it."""
+        self._wait_for_dataset(dataset_name)
+        if dataset_name:
+            row = self.reader().execute(
+                "SELECT version, updated_at FROM history_versions WHERE dataset_name = ?", (dataset_name,)).fetchone()
+        else:
+            #every write raises one dataset's version, so the sum changes whenever any history does
+            row = self.reader().execute("SELECT SUM(version), MAX(updated_at) FROM history_versions").fetchone()
+        if row is None or row[0] is None:
+            return 0, None
+        return row[0], row[1]
+
+    def outcomes(self, limit):
+        """Returns (prompt, response_type, feedback) for the most recent history rows, oldest first."""
+        #training data, rows still in the queue are picked up by the next retrain
+        rows = self.reader().execute('''
+            SELECT prompt, response_type, feedback FROM prompt_history ORDER BY timestamp DESC, id DESC LIMIT ?
+        ''', (limit,)).fetchall()
+        return [tuple(row) for row in reversed(rows)]
+
+    def page(self, dataset_name=None, limit=HISTORY_PAGE_SIZE, cursor=None):
+        """Returns (rows newest first, next cursor or None), using keyset pagination on (timestamp, id)."""
+        self._wait_for_dataset(dataset_name)
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+        conditions, params = [], []
+        if dataset_name:
+            conditions.append("dataset_name = ?")
+            params.append(dataset_name)
+        if cursor:
+            timestamp, history_id = decode_cursor(cursor)
+            conditions.append("(timestamp, id) < (?, ?)")
+            params.extend([timestamp, history_id])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.reader().execute(f'''
+            SELECT id, prompt, dataset_name, timestamp, feedback FROM prompt_history
+            {where} ORDER BY timestamp DESC, id DESC LIMIT ?
+        ''', (*params, limit + 1)).fetchall()
+
+        history = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = history[-1]
+            next_cursor = encode_cursor(last["timestamp"], last["id"])
+        return history, next_cursor
+
 
 if __name__ == '__main__':
-    # This allows running `python database.py` to initialize the DB
+    # This allows running `python database.py` to initialize or migrate the DB
     print(f"Initializing database '{DATABASE}'...")
     init_db()
-    print("Database initialized successfully.")
\ No newline at end of file
+    print("Database initialized successfully.")
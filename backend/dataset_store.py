@@ -0,0 +1,292 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from columnar import ColumnarDataset, ColumnarEngine, OUT_OF_CORE_MB, parquet_size_bytes
+from sketches import DatasetSketch
+
+# --- Dataset Store Configuration ---
+DATASET_DIR = os.getenv("DATASET_DIR", "datasets")
+MAX_CACHED_DATASETS = int(os.getenv("MAX_CACHED_DATASETS", "8"))
+SKETCH_BATCH_ROWS = 131072 #rows per batch when sketching a stored dataset for the first time
+
+DATASET_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """Content hash of a DataFrame: column names, dtypes and row values."""
+    hasher = hashlib.sha256()
+    hasher.update(schema_signature(df).encode("utf-8"))
+    hasher.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return hasher.hexdigest()[:32]
+
+
+def schema_signature(df: pd.DataFrame) -> str:
+    """Column names and dtypes only, for things that depend on the shape of a dataset but not its rows."""
+    return json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()])
+
+
+def version_id(parent_id, operation, change: pd.DataFrame) -> str:
+    """Id of the version made by applying a change to a stored dataset, hashed from the parent id and
+    the change alone so it costs nothing per stored row. The same change to the same version gets the same id."""
+    raw = f"{parent_id}:{operation}:{dataset_fingerprint(change)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def conform_rows(rows: pd.DataFrame, df) -> pd.DataFrame:
+    #appended rows need exactly the dataset's columns; they take its column types where their values allow
+    columns = [str(column) for column in df.columns]
+    missing = [column for column in columns if column not in rows.columns]
+    extra = [str(column) for column in rows.columns if str(column) not in columns]
+    if missing or extra:
+        raise ValueError(f"Appended rows must have the dataset's columns (missing: {missing}, unexpected: {extra})")
+    rows = rows[columns].reset_index(drop=True)
+    for column, dtype in df.dtypes.items():
+        try:
+            rows[column] = rows[column].astype(dtype)
+        except (ValueError, TypeError):
+            pass #e.g. nulls in an integer column, the new version widens the column instead
+    return rows
+
+
+def is_valid_dataset_id(dataset_id) -> bool:
+    #ids end up in file paths, so only accept the exact format we hand out
+    return isinstance(dataset_id, str) and bool(DATASET_ID_PATTERN.match(dataset_id))
+
+
+class DatasetStore:
+    """Stores each uploaded dataset once on disk and keeps the most recently used ones in memory.
+
+    Datasets over out_of_core_mb are never held in memory: they come back as a ColumnarDataset
+    that queries the stored parquet file through a shared DuckDB engine.
+
+    Rows can be appended and columns replaced in a stored dataset; each change is stored as a new
+    version with its own dataset_id, and the old version stays queryable. Every version keeps a
+    sketch of its column statistics, derived from its parent's rather than by rescanning the rows.
+    """
+
+    def __init__(self, directory=DATASET_DIR, max_cached=MAX_CACHED_DATASETS, out_of_core_mb=OUT_OF_CORE_MB):
+        self.directory = directory
+        self.max_cached = max(1, max_cached)
+        self.out_of_core_bytes = out_of_core_mb * 1024 * 1024
+        self._cache = OrderedDict() #dataset_id -> DataFrame or ColumnarDataset, most recently used last
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock() #one new version written at a time
+        self._engine = None #started with the first out-of-core dataset
+        os.makedirs(self.directory, exist_ok=True)
+
+    def engine(self) -> ColumnarEngine:
+        with self._lock:
+            if self._engine is None:
+                self._engine = ColumnarEngine()
+            return self._engine
+
+    def _parquet_path(self, dataset_id):
+        return os.path.join(self.directory, f"{dataset_id}.parquet")
+
+    def _pickle_path(self, dataset_id):
+        return os.path.join(self.directory, f"{dataset_id}.pkl")
+
+    def _version_path(self, dataset_id):
+        return os.path.join(self.directory, f"{dataset_id}.version.json")
+
+    def _sketch_path(self, dataset_id):
+        return os.path.join(self.directory, f"{dataset_id}.sketch.json")
+
+    def _write_json(self, path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _remember(self, dataset_id, df):
+        with self._lock:
+            self._cache[dataset_id] = df
+            self._cache.move_to_end(dataset_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def _write(self, dataset_id, df):
+        path = self._parquet_path(dataset_id)
+        tmp_path = f"{path}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            #mixed-type object columns can't be written as parquet, keep them as a pickle instead
+            print(f"Falling back to pickle for dataset {dataset_id}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            path = self._pickle_path(dataset_id)
+            tmp_path = f"{path}.tmp"
+            df.to_pickle(tmp_path)
+            os.replace(tmp_path, path)
+
+    def _open(self, dataset_id):
+        #returns a ColumnarDataset if dataset_id is stored as parquet and too large to keep in memory, otherwise None
+        path = self._parquet_path(dataset_id)
+        if self.out_of_core_bytes <= 0 or not os.path.exists(path) or parquet_size_bytes(path) < self.out_of_core_bytes:
+            return None
+        sketch = self._load_sketch(dataset_id)
+        distinct_counts = {name: column.distinct.count() for name, column in sketch.columns.items()} if sketch else None
+        return ColumnarDataset(dataset_id, path, self.engine(), distinct_counts)
+
+    def _read(self, dataset_id):
+        path = self._parquet_path(dataset_id)
+        if os.path.exists(path):
+            dataset = self._open(dataset_id)
+            return pd.read_parquet(path) if dataset is None else dataset
+        path = self._pickle_path(dataset_id)
+        if os.path.exists(path):
+            return pd.read_pickle(path)
+        return None
+
+    def exists(self, dataset_id) -> bool:
+        if not is_valid_dataset_id(dataset_id):
+            return False
+        with self._lock:
+            if dataset_id in self._cache:
+                return True
+        return os.path.exists(self._parquet_path(dataset_id)) or os.path.exists(self._pickle_path(dataset_id))
+
+    def register(self, df: pd.DataFrame) -> str:
+        #stores the dataset if it hasn't been seen before and returns its content id
+        dataset_id = dataset_fingerprint(df)
+        if not self.exists(dataset_id):
+            self._write(dataset_id, df)
+        with self._lock:
+            stored = self._cache.get(dataset_id)
+        if stored is None:
+            stored = self._open(dataset_id) #large uploads aren't kept, queries go to the file instead
+        self._remember(dataset_id, df if stored is None else stored)
+        return dataset_id
+
+    def _remember_version(self, dataset_id, df):
+        #a version that grew past out_of_core_mb is queried from its file from now on
+        stored = self._open(dataset_id)
+        self._remember(dataset_id, df if stored is None else stored)
+
+    def forget(self, dataset_id):
+        #drops a superseded version from memory, it is read from disk again if still queried
+        with self._lock:
+            self._cache.pop(dataset_id, None)
+        if self._engine is not None:
+            self._engine.drop_view(dataset_id)
+
+    def version(self, dataset_id) -> dict:
+        """Lineage of a stored dataset: its version number, parent dataset_id and the change that made it."""
+        path = self._version_path(dataset_id)
+        if is_valid_dataset_id(dataset_id) and os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return {"version": 1, "parent_id": None, "operation": None}
+
+    def _load_sketch(self, dataset_id):
+        path = self._sketch_path(dataset_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                return DatasetSketch.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading sketch for dataset {dataset_id}, rebuilding it: {e}")
+            return None
+
+    def sketch(self, dataset_id):
+        """Column statistics of a stored dataset, built with one pass over its rows the first time they are needed."""
+        sketch = self._load_sketch(dataset_id)
+        if sketch is not None:
+            return sketch
+        df = self.get(dataset_id)
+        if df is None:
+            return None
+        if isinstance(df, ColumnarDataset):
+            #batch by batch from the file, a large dataset is never loaded whole
+            sketch = DatasetSketch()
+            for batch in pq.ParquetFile(df.path, memory_map=True).iter_batches(batch_size=SKETCH_BATCH_ROWS):
+                sketch = sketch.append(DatasetSketch.from_frame(batch.to_pandas()))
+        else:
+            sketch = DatasetSketch.from_frame(df)
+        self._write_json(self._sketch_path(dataset_id), sketch.to_dict())
+        return sketch
+
+    def _store_version(self, parent_id, dataset_id, operation, sketch, df=None, write_columnar=None):
+        #stores the new version's rows (df, or written by write_columnar(path) for an out-of-core parent), its sketch and lineage
+        if df is not None:
+            self._write(dataset_id, df)
+        else:
+            path = self._parquet_path(dataset_id)
+            tmp_path = f"{path}.tmp"
+            try:
+                write_columnar(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self._write_json(self._sketch_path(dataset_id), sketch.to_dict())
+        parent = self.version(parent_id)
+        self._write_json(self._version_path(dataset_id), {"version": parent["version"] + 1, "parent_id": parent_id, "operation": operation})
+
+    def append(self, dataset_id, rows: pd.DataFrame) -> str:
+        """Stores dataset_id with rows added at the end as a new version and returns its dataset_id."""
+        with self._update_lock:
+            df = self.get(dataset_id)
+            if df is None:
+                raise KeyError(dataset_id)
+            rows = conform_rows(rows, df)
+            new_id = version_id(dataset_id, "append", rows)
+            if not self.exists(new_id):
+                sketch = self.sketch(dataset_id).append(DatasetSketch.from_frame(rows))
+                if isinstance(df, ColumnarDataset):
+                    self._store_version(dataset_id, new_id, "append", sketch, write_columnar=lambda path: df.write_appended(rows, path))
+                else:
+                    updated = pd.concat([df, rows], ignore_index=True)
+                    self._store_version(dataset_id, new_id, "append", sketch, df=updated)
+                    self._remember_version(new_id, updated)
+        self.forget(dataset_id)
+        return new_id
+
+    def replace_columns(self, dataset_id, columns: pd.DataFrame) -> str:
+        """Stores dataset_id with whole columns replaced (or added) as a new version and returns its dataset_id.
+
+        columns holds one value per row of the dataset, in row order.
+        """
+        with self._update_lock:
+            df = self.get(dataset_id)
+            if df is None:
+                raise KeyError(dataset_id)
+            if len(columns) != len(df):
+                raise ValueError(f"Replacement columns have {len(columns):,} rows, the dataset has {len(df):,}")
+            columns = columns.reset_index(drop=True)
+            columns.columns = [str(column) for column in columns.columns]
+            new_id = version_id(dataset_id, "replace_columns", columns)
+            if not self.exists(new_id):
+                sketch = self.sketch(dataset_id).replace(DatasetSketch.from_frame(columns))
+                if isinstance(df, ColumnarDataset):
+                    self._store_version(dataset_id, new_id, "replace_columns", sketch, write_columnar=lambda path: df.write_replaced(columns, path))
+                else:
+                    updated = df.reset_index(drop=True).assign(**{column: columns[column] for column in columns.columns})
+                    self._store_version(dataset_id, new_id, "replace_columns", sketch, df=updated)
+                    self._remember_version(new_id, updated)
+        self.forget(dataset_id)
+        return new_id
+
+    def get(self, dataset_id):
+        #returns the DataFrame (or ColumnarDataset) for dataset_id, or None if it was never registered
+        if not is_valid_dataset_id(dataset_id):
+            return None
+        with self._lock:
+            df = self._cache.get(dataset_id)
+            if df is not None:
+                self._cache.move_to_end(dataset_id)
+                return df
+        df = self._read(dataset_id)
+        if df is not None:
+            self._remember(dataset_id, df)
+        return df
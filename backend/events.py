@@ -0,0 +1,34 @@
+import contextlib
+import contextvars
+import json
+
+# --- Progress Events ---
+#the query pipeline reports what it is doing through emit(); only streaming requests install a listener,
+#everywhere else emit() is a no-op. the listener lives in a contextvar, so it follows the work into pool
+#threads that run in a copy of the caller's context (speculative branches, batch prompts)
+_listener = contextvars.ContextVar("progress_listener", default=None)
+
+
+@contextlib.contextmanager
+def listen(callback):
+    """Sends every event emitted inside the block to callback(event, data)."""
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def emit(event, **data):
+    callback = _listener.get()
+    if callback is None:
+        return
+    try:
+        callback(event, data)
+    except Exception as e:
+        print(f"Error delivering progress event '{event}': {e}")
+
+
+def format_sse(event, data) -> str:
+    """One Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,363 @@
+import ast
+import contextlib
+import io
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pyarrow as pa
+
+try:
+    import resource #unix only, CPU limits are skipped elsewhere
+except ImportError:
+    resource = None
+
+# --- Code Executor Configuration ---
+#"process" runs LLM generated chart code in an isolated worker pool, "inline" runs it in the Flask worker
+CODE_EXECUTOR = os.getenv("CODE_EXECUTOR", "process")
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", "2"))
+EXECUTOR_TIMEOUT_SECONDS = float(os.getenv("EXECUTOR_TIMEOUT_SECONDS", "30"))
+EXECUTOR_CPU_SECONDS = int(os.getenv("EXECUTOR_CPU_SECONDS", "20"))
+EXECUTOR_MEMORY_MB = int(os.getenv("EXECUTOR_MEMORY_MB", "1024")) #resident memory per worker, 0 disables the check
+EXECUTOR_SPOOL_DIR = os.getenv("EXECUTOR_SPOOL_DIR", "spool")
+EXECUTOR_SPOOL_MAX_FILES = int(os.getenv("EXECUTOR_SPOOL_MAX_FILES", "32"))
+
+WORKER_TABLE_CACHE_SIZE = 4 #memory-mapped tables each worker keeps open
+OWNER_POLL_SECONDS = 1.0 #how often workers check that the process owning the pool is still alive
+
+#code using any of these reads columns it doesn't name, so it gets the whole table
+WHOLE_FRAME_ATTRIBUTES = {
+    "columns", "dtypes", "select_dtypes", "describe", "corr", "cov", "iloc", "values", "to_numpy",
+    "melt", "stack", "info", "itertuples", "iterrows", "items", "T", "scatter_matrix", "parallel_coordinates",
+    "parallel_categories", "imshow",
+}
+
+
+def referenced_columns(code, columns):
+    """Columns generated code names as strings or attributes, or None if it may need all of them."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            names.add(node.value)
+        elif isinstance(node, ast.Attribute):
+            if node.attr in WHOLE_FRAME_ATTRIBUTES:
+                return None
+            names.add(node.attr)
+        elif isinstance(node, ast.Call) and len(node.args) == 1 and not node.keywords and isinstance(node.args[0], ast.Name):
+            #px.bar(data) and friends plot every column in wide form
+            if isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name) and node.func.value.id == "px":
+                return None
+    used = [col for col in columns if str(col) in names]
+    return used or None
+
+
+class CodeExecutionError(Exception):
+    """Raised when generated code times out, exceeds a resource limit or crashes its worker."""
+
+
+class SpoolError(Exception):
+    """Raised when a DataFrame can't be written as an Arrow file for the workers."""
+
+
+# --- Worker Side ---
+_worker_tables = OrderedDict() #arrow path -> memory-mapped pa.Table
+
+
+def _watch_memory(limit_bytes):
+    #RLIMIT_RSS isn't enforced on Linux, so the worker polls its own resident size and exits when over the limit
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    while True:
+        try:
+            with open("/proc/self/statm") as statm:
+                rss = int(statm.read().split()[1]) * page_size
+        except OSError:
+            return
+        if rss > limit_bytes:
+            print(f"Code executor worker {os.getpid()} exceeded {limit_bytes // (1024 * 1024)} MB, exiting", file=sys.stderr)
+            os._exit(1)
+        time.sleep(0.1)
+
+
+def _watch_owner(owner_pid):
+    #workers are children of the forkserver, not of the server process that owns the pool, so nothing stops them
+    #when that process is killed without shutting the pool down (e.g. a timed out server worker)
+    while True:
+        try:
+            os.kill(owner_pid, 0)
+        except ProcessLookupError:
+            os._exit(0)
+        except OSError:
+            pass #exists, but isn't ours to signal
+        time.sleep(OWNER_POLL_SECONDS)
+
+
+def _init_worker(memory_mb, owner_pid=None):
+    #preload the libraries generated code uses so the first job doesn't pay for the imports
+    import pandas  # noqa: F401
+    import plotly.express  # noqa: F401
+    import plotly.graph_objects  # noqa: F401
+    import plotly.io  # noqa: F401
+    if memory_mb > 0 and os.path.exists("/proc/self/statm"):
+        threading.Thread(target=_watch_memory, args=(memory_mb * 1024 * 1024,), daemon=True).start()
+    if owner_pid is not None:
+        threading.Thread(target=_watch_owner, args=(owner_pid,), daemon=True).start()
+
+
+def _worker_loop(conn, memory_mb, owner_pid):
+    #serves jobs from the parent one at a time: None is a ping, anything else (code, arrow path, cpu seconds)
+    _init_worker(memory_mb, owner_pid)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return #the parent closed the pipe
+        if job is None:
+            conn.send(os.getpid())
+            continue
+        try:
+            reply = (True, _run_chart_code(*job))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            #the exception (or its figure) didn't pickle
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+def _load_table(path):
+    #memory-mapped tables are shared with the page cache, so they cost no private memory until used
+    table = _worker_tables.get(path)
+    if table is None:
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        _worker_tables[path] = table
+        while len(_worker_tables) > WORKER_TABLE_CACHE_SIZE:
+            _worker_tables.popitem(last=False)
+    _worker_tables.move_to_end(path)
+    return table
+
+
+def _limit_cpu(cpu_seconds):
+    #RLIMIT_CPU counts the worker's whole lifetime, so each job gets cpu_seconds on top of what was already used
+    if resource is None or cpu_seconds <= 0:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _run_chart_code(code, arrow_path, cpu_seconds):
+    #runs inside a worker: builds the figure and returns only (figure JSON, reduction), or None if no figure was produced
+    import plotly.graph_objects as go
+
+    from figure_reduce import serialize_figure
+
+    _limit_cpu(cpu_seconds)
+    table = _load_table(arrow_path)
+    #only the columns the code names are converted, the rest of the mapped file is never touched
+    columns = referenced_columns(code, table.column_names)
+    if columns is not None:
+        try:
+            fig = _build_figure(code, table.select(columns).to_pandas())
+        except Exception:
+            fig = _build_figure(code, table.to_pandas()) #it needed a column it didn't name
+    else:
+        fig = _build_figure(code, table.to_pandas()) #a private frame per job, so generated code can modify it freely
+
+    if not isinstance(fig, go.Figure):
+        return None
+    return serialize_figure(fig)
+
+
+def _build_figure(code, data):
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    local_vars = {"pd": pd, "px": px, "go": go, "data": data}
+    #stdout redirection is safe here, each worker runs one job at a time
+    with contextlib.redirect_stdout(io.StringIO()):
+        exec(code, local_vars)
+
+        if 'plot' in local_vars and callable(local_vars['plot']):
+            return local_vars['plot'](data)
+        elif 'fig' in local_vars:
+            return local_vars['fig']
+        elif 'chart' in local_vars:
+            return local_vars['chart']
+    return None
+
+
+# --- Parent Side ---
+class _Worker:
+    """One worker process and the pipe jobs go through. Jobs run one at a time, so a job's timeout
+    starts when it is handed to an idle worker, and a job that overruns takes down only its own process."""
+
+    def __init__(self, context, memory_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(child_conn, memory_mb, os.getpid()), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def ping(self):
+        self.conn.send(None)
+        return self.conn.recv()
+
+    def stop(self):
+        with contextlib.suppress(OSError):
+            self.conn.close()
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=1)
+
+
+class CodeExecutor:
+    """Pre-started worker processes that run generated chart code with time, CPU and memory limits.
+
+    DataFrames are written once per dataset as Arrow IPC files that workers memory-map,
+    instead of being pickled into every job.
+    """
+
+    def __init__(self, workers=EXECUTOR_WORKERS, timeout=EXECUTOR_TIMEOUT_SECONDS, cpu_seconds=EXECUTOR_CPU_SECONDS,
+                 memory_mb=EXECUTOR_MEMORY_MB, spool_dir=EXECUTOR_SPOOL_DIR, spool_max_files=EXECUTOR_SPOOL_MAX_FILES):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.spool_dir = spool_dir
+        self.spool_max_files = max(1, spool_max_files)
+        self._spool_lock = threading.Lock()
+        self._spool_leases = {} #path -> jobs that have it and whose worker may not have opened it yet
+        self._spool_discarded = set() #leased paths to remove once their last job finishes
+        self._idle = queue.Queue() #workers waiting for a job
+        self._closed = False
+        #forkserver/spawn workers start from a clean interpreter, forking a multi-threaded Flask process is unsafe
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        os.makedirs(self.spool_dir, exist_ok=True)
+        #start every worker now rather than on the first request
+        for _ in range(self.workers):
+            worker = _Worker(self._context, self.memory_mb)
+            worker.ping()
+            self._idle.put(worker)
+
+    def _replace(self, worker):
+        #a timed out or crashed worker is stopped and a fresh one takes its place, the others keep running
+        worker.stop()
+        if not self._closed:
+            self._idle.put(_Worker(self._context, self.memory_mb))
+
+    def _prune_spool(self):
+        #oldest first, skipping files a running or queued job still needs
+        paths = [os.path.join(self.spool_dir, name) for name in os.listdir(self.spool_dir) if name.endswith(".arrow")]
+        excess = len(paths) - self.spool_max_files
+        if excess <= 0:
+            return
+        paths = sorted((path for path in paths if path not in self._spool_leases), key=os.path.getmtime)
+        for path in paths[:excess]:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    def _release_spool(self, path):
+        with self._spool_lock:
+            self._spool_leases[path] -= 1
+            if self._spool_leases[path] > 0:
+                return
+            del self._spool_leases[path]
+            if path in self._spool_discarded:
+                self._spool_discarded.discard(path)
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+    def spool(self, df, key):
+        #writes df (a DataFrame or ColumnarDataset) as an uncompressed Arrow file (memory-mappable) once per dataset and
+        #returns its path, leased to the caller: it isn't pruned or discarded until _release_spool(path)
+        from columnar import ColumnarDataset #not at the top, the workers import this module and don't need DuckDB
+
+        path = os.path.join(self.spool_dir, f"{key}.arrow")
+        with self._spool_lock:
+            self._spool_discarded.discard(path)
+            if os.path.exists(path):
+                os.utime(path) #keep recently used datasets out of pruning
+                self._spool_leases[path] = self._spool_leases.get(path, 0) + 1
+                return path
+            tmp_path = f"{path}.tmp"
+            try:
+                if isinstance(df, ColumnarDataset):
+                    df.write_arrow(tmp_path) #streamed from the parquet file, never loaded here
+                else:
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+                os.replace(tmp_path, path)
+            except (pa.ArrowException, ValueError, TypeError) as e:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+                raise SpoolError(f"Can't share dataset {key} with the code executor: {e}")
+            self._spool_leases[path] = self._spool_leases.get(path, 0) + 1
+            self._prune_spool()
+        return path
+
+    def discard(self, key):
+        #removes a dataset's spooled file, once no job still needs it. workers keep a copy they have open until
+        #their table cache drops it, which is safe, a dataset_id's rows never change
+        path = os.path.join(self.spool_dir, f"{key}.arrow")
+        with self._spool_lock:
+            if path in self._spool_leases:
+                self._spool_discarded.add(path)
+                return
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    def _run_job(self, code, df, key):
+        #returns the worker's (ok, result) reply
+        path = self.spool(df, key)
+        try:
+            worker = self._idle.get() #waiting for a free worker doesn't count towards the timeout
+            try:
+                worker.conn.send((code, path, self.cpu_seconds))
+                if not worker.conn.poll(self.timeout):
+                    self._replace(worker)
+                    raise CodeExecutionError(f"Generated code timed out after {self.timeout:g} seconds")
+                reply = worker.conn.recv()
+            except (EOFError, OSError):
+                self._replace(worker)
+                raise CodeExecutionError("Generated code crashed its worker (CPU or memory limit exceeded)")
+            if self._closed:
+                worker.stop()
+            else:
+                self._idle.put(worker)
+            return reply
+        finally:
+            self._release_spool(path)
+
+    def run_chart_code(self, code, df, key):
+        """Runs LIDA generated plotly code against df in a worker and returns (figure JSON, reduction), or None."""
+        ok, result = self._run_job(code, df, key)
+        if not ok and isinstance(result, FileNotFoundError):
+            #leases only cover this process, another server process sharing the spool directory may have pruned the
+            #file before the worker opened it. spooling again writes it back
+            ok, result = self._run_job(code, df, key)
+        if not ok:
+            raise result
+        return result
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
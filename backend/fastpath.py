@@ -0,0 +1,352 @@
+import re
+
+import pandas as pd
+import plotly.express as px
+
+from columnar import ColumnarDataset, SQL_TABLE_NAME, quote_identifier
+
+# --- Fast Path Vocabulary ---
+#simple question shapes (averages, counts, group-by sums, top-N, min/max) are answered with pandas directly.
+#every word in the prompt has to be understood, anything else falls through to the LLM path
+
+AGGREGATION_WORDS = {
+    "average": "mean", "mean": "mean", "avg": "mean",
+    "total": "sum", "sum": "sum",
+    "minimum": "min", "min": "min", "lowest": "min", "smallest": "min",
+    "maximum": "max", "max": "max", "highest": "max", "largest": "max", "biggest": "max",
+    "median": "median",
+    "count": "count", "howmany": "count",
+    "unique": "nunique", "distinct": "nunique",
+}
+AGGREGATION_LABELS = {
+    "mean": "average", "sum": "total", "min": "minimum", "max": "maximum",
+    "median": "median", "count": "count", "nunique": "number of unique values",
+}
+GROUP_WORDS = {"by", "per", "against", "across", "vs", "versus"}
+CHART_WORDS = {
+    "plot": "bar", "chart": "bar", "graph": "bar", "visualize": "bar", "visualise": "bar", "visualization": "bar",
+    "bar": "bar", "line": "line", "pie": "pie", "histogram": "histogram", "scatter": "scatter",
+}
+RANK_WORDS = {"top": "top", "bottom": "bottom"}
+FILLER_WORDS = {
+    "what", "whats", "is", "are", "was", "the", "of", "a", "an", "me", "show", "give", "tell", "list",
+    "find", "calculate", "compute", "get", "display", "please", "in", "for", "all", "data", "dataset",
+    "table", "value", "values", "column", "and", "to", "with", "there", "do", "does", "we", "have",
+    "overall", "draw", "create", "generate", "make", "each", "every", "rows", "records", "entries",
+}
+#multi-word phrases rewritten to a single vocabulary word before tokenizing
+PHRASES = [
+    (r"\b(how many|count of|number of) (unique|distinct)\b", "unique"),
+    #"how many machines" counts machines, not rows, see entity_aggregation
+    (r"\b(how many|number of)\b", "howmany"),
+    (r"\bfor (each|every)\b", "per"),
+    (r"\b(grouped|broken down|split|group) by\b", "by"),
+]
+#abbreviations expanded in both prompts and column names so they can be matched against each other
+ABBREVIATIONS = {"avg": "average", "no": "number", "num": "number", "qty": "quantity", "amt": "amount"}
+
+IDENTIFIER_WORDS = {"id", "code", "name", "number"} #last word of a numeric column that names things rather than measures them
+MAX_GROUPS = 50 #more groups than this is unlikely to be what a "by" question means
+COLUMN_MARKER = "__col" #can't collide with normalized text, which is only [0-9a-z ]
+
+
+def is_vocabulary_word(word) -> bool:
+    return any(word in words for words in (AGGREGATION_WORDS, GROUP_WORDS, CHART_WORDS, RANK_WORDS, FILLER_WORDS))
+
+
+def normalize_text(text: str) -> str:
+    text = re.sub(r"[^0-9a-z]+", " ", str(text).lower())
+    return " ".join(ABBREVIATIONS.get(word, word) for word in text.split())
+
+
+def find_columns(prompt_text, df):
+    #replaces every mentioned column with a marker token and returns (text, columns in mention order).
+    #full column names are matched first, longest first; a single word may also match a column
+    #when it names exactly one column (e.g. "population" for "Area Population")
+    phrases = sorted(((normalize_text(col), col) for col in df.columns), key=lambda item: -len(item[0]))
+    found = []
+    for phrase, col in phrases:
+        if not phrase:
+            continue
+        pattern = re.compile(rf"\b{re.escape(phrase)}\b")
+        if pattern.search(prompt_text):
+            found.append(col)
+            prompt_text = pattern.sub(f" {COLUMN_MARKER}{len(found) - 1} ", prompt_text)
+
+    words_to_columns = {}
+    for phrase, col in phrases:
+        for word in set(phrase.split()):
+            if len(word) >= 4 and not is_vocabulary_word(word):
+                words_to_columns.setdefault(word, set()).add(col)
+
+    tokens = []
+    for word in prompt_text.split():
+        singular = word[:-1] if word.endswith("s") else word
+        candidates = words_to_columns.get(word) or words_to_columns.get(singular)
+        if candidates and len(candidates) == 1:
+            found.append(next(iter(candidates)))
+            word = f"{COLUMN_MARKER}{len(found) - 1}"
+        tokens.append(word)
+    return tokens, found
+
+
+def entity_aggregation(series: pd.Series):
+    #"how many <column>" asks how many different things it names: nunique for an identifier or label column.
+    #a measure ("how many units sold") could mean its sum or its count, so that is left to the LLM
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return None
+    if pd.api.types.is_numeric_dtype(series):
+        words = normalize_text(series.name).split()
+        return "nunique" if words and words[-1] in IDENTIFIER_WORDS else None
+    return "nunique"
+
+
+def plan_query(prompt: str, df: pd.DataFrame, distinct_count=None):
+    """Parses a prompt into a simple query plan, or returns None if it isn't confidently understood.
+
+    Only df's columns and dtypes are read, apart from distinct_count(column), which defaults to
+    counting df's distinct values.
+    """
+    if distinct_count is None:
+        distinct_count = lambda col: df[col].nunique(dropna=True)
+    text = normalize_text(prompt)
+    for pattern, replacement in PHRASES:
+        text = re.sub(pattern, replacement, text)
+    tokens, columns = find_columns(text, df)
+
+    aggregations, chart, rank, limit = set(), None, None, None
+    group_at, column_at = None, []
+    for i, token in enumerate(tokens):
+        if re.fullmatch(rf"{COLUMN_MARKER}\d+", token):
+            column_at.append((i, columns[int(token[len(COLUMN_MARKER):])]))
+        elif token in AGGREGATION_WORDS:
+            aggregations.add(AGGREGATION_WORDS[token])
+        elif token in GROUP_WORDS:
+            if group_at is not None:
+                return None
+            group_at = i
+        elif token in CHART_WORDS:
+            chart = CHART_WORDS[token] if chart in (None, "bar") else chart
+        elif token in RANK_WORDS:
+            rank = RANK_WORDS[token]
+        elif token.isdigit():
+            if limit is not None:
+                return None
+            limit = int(token)
+        elif token not in FILLER_WORDS:
+            return None #unknown word, let the LLM handle it
+
+    if len(aggregations) > 1 or len({col for _, col in column_at}) != len(column_at):
+        return None
+    aggregation = next(iter(aggregations), None)
+    counting_entities = "howmany" in tokens
+    if limit is not None and rank is None:
+        return None
+    if rank is not None:
+        limit = limit or 5
+
+    if group_at is None:
+        cols = [col for _, col in column_at]
+        if chart == "histogram" and len(cols) == 1 and aggregation is None:
+            return {"kind": "histogram", "column": cols[0]}
+        if chart is not None or rank is not None:
+            return None
+        if not cols and aggregation == "count":
+            return {"kind": "row_count"}
+        if len(cols) == 1 and aggregation is not None:
+            if counting_entities:
+                aggregation = entity_aggregation(df[cols[0]])
+                if aggregation is None:
+                    return None
+            try:
+                check_aggregatable(df[cols[0]], aggregation)
+            except TypeError:
+                return None
+            return {"kind": "scalar", "aggregation": aggregation, "column": cols[0]}
+        return None
+
+    before = [col for i, col in column_at if i < group_at]
+    after = [col for i, col in column_at if i > group_at]
+    if len(after) != 1 or len(before) > 1:
+        return None
+    value_col, group_col = (before[0] if before else None), after[0]
+
+    if chart == "scatter":
+        if value_col is None or aggregation is not None or rank is not None:
+            return None
+        return {"kind": "scatter", "x": group_col, "y": value_col}
+
+    if rank is not None:
+        if value_col is None:
+            if pd.api.types.is_numeric_dtype(df[group_col]) and aggregation is None:
+                #"top 5 by price" ranks rows rather than groups
+                return {"kind": "top_rows", "column": group_col, "rank": rank, "limit": limit}
+        else:
+            #"top 5 product name by units sold" names the groups first and the ranking value second
+            value_col, group_col = group_col, value_col
+
+    if rank is None and distinct_count(group_col) > MAX_GROUPS:
+        return None
+    if aggregation is None:
+        aggregation = "sum" if value_col is not None else "count"
+    if value_col is None and aggregation != "count":
+        return None #"average by category" doesn't say what to average
+    if counting_entities and value_col is not None:
+        aggregation = entity_aggregation(df[value_col])
+        if aggregation is None:
+            return None
+    if value_col is not None:
+        try:
+            check_aggregatable(df[value_col], aggregation)
+        except TypeError:
+            return None
+    return {
+        "kind": "group",
+        "aggregation": aggregation,
+        "column": value_col,
+        "by": group_col,
+        "rank": rank,
+        "limit": limit,
+        "chart": chart,
+    }
+
+
+def check_aggregatable(series: pd.Series, aggregation: str):
+    #count and nunique work on anything, min/max also on dates, the rest need numbers
+    if aggregation in ("count", "nunique"):
+        return
+    if pd.api.types.is_bool_dtype(series):
+        raise TypeError(f"Can't take the {aggregation} of boolean column {series.name}")
+    if pd.api.types.is_numeric_dtype(series):
+        return
+    if aggregation in ("min", "max") and pd.api.types.is_datetime64_any_dtype(series):
+        return
+    raise TypeError(f"Can't take the {aggregation} of non-numeric column {series.name}")
+
+
+def format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if isinstance(value, int) or hasattr(value, "dtype") and pd.api.types.is_integer_dtype(value.dtype):
+        return f"{int(value):,}"
+    return str(value)
+
+
+def execute_plan(plan: dict, df: pd.DataFrame):
+    """Runs a plan from plan_query and returns a plotly figure, a DataFrame or an answer string."""
+    kind = plan["kind"]
+    if kind == "row_count":
+        return f"There are {len(df):,} rows."
+
+    if kind == "scalar":
+        series = df[plan["column"]]
+        check_aggregatable(series, plan["aggregation"])
+        value = getattr(series, plan["aggregation"])()
+        return f"The {AGGREGATION_LABELS[plan['aggregation']]} of {plan['column']} is {format_value(value)}."
+
+    if kind == "histogram":
+        return px.histogram(df, x=plan["column"], title=f"Distribution of {plan['column']}")
+
+    if kind == "scatter":
+        return px.scatter(df, x=plan["x"], y=plan["y"], title=f"{plan['y']} against {plan['x']}")
+
+    if kind == "top_rows":
+        method = "nlargest" if plan["rank"] == "top" else "nsmallest"
+        return getattr(df, method)(plan["limit"], plan["column"]).reset_index(drop=True)
+
+    #group
+    by, column, aggregation = plan["by"], plan["column"], plan["aggregation"]
+    if column is None:
+        result = df.groupby(by, observed=True).size()
+        value_name = "Count"
+    else:
+        check_aggregatable(df[column], aggregation)
+        result = df.groupby(by, observed=True)[column].agg(aggregation)
+        value_name = f"{AGGREGATION_LABELS[aggregation].capitalize()} {column}"
+    if plan["rank"] is not None:
+        method = "nlargest" if plan["rank"] == "top" else "nsmallest"
+        result = getattr(result, method)(plan["limit"])
+    result = result.rename(value_name).reset_index()
+    return chart_result(result, plan, value_name)
+
+
+def chart_result(result: pd.DataFrame, plan: dict, value_name: str):
+    #a grouped result as a table, or as the chart the prompt asked for
+    by, chart = plan["by"], plan["chart"]
+    if chart is None:
+        return result
+    title = f"{value_name} by {by}"
+    if chart == "pie":
+        return px.pie(result, names=by, values=value_name, title=title)
+    if chart == "line":
+        return px.line(result, x=by, y=value_name, title=title)
+    return px.bar(result, x=by, y=value_name, title=title)
+
+
+# --- Pushed-Down Plans ---
+#out-of-core datasets run aggregations as SQL, so only the aggregated rows are ever loaded
+SQL_AGGREGATIONS = {
+    "mean": "avg({})", "sum": "sum({})", "min": "min({})", "max": "max({})",
+    "median": "median({})", "count": "count({})", "nunique": "count(DISTINCT {})",
+}
+
+
+def sql_aggregate(aggregation, column, series):
+    expression = SQL_AGGREGATIONS[aggregation].format(quote_identifier(column))
+    if aggregation == "sum" and pd.api.types.is_integer_dtype(series):
+        return f"CAST({expression} AS BIGINT)" #DuckDB sums integers as HUGEINT, which pandas reads as float
+    return expression
+
+
+def execute_plan_sql(plan: dict, dataset: ColumnarDataset):
+    """execute_plan for a ColumnarDataset: aggregations run in DuckDB, charts of raw rows read only their columns."""
+    kind = plan["kind"]
+    if kind == "row_count":
+        return f"There are {len(dataset):,} rows."
+
+    if kind in ("histogram", "scatter"):
+        columns = [plan["column"]] if kind == "histogram" else list(dict.fromkeys([plan["x"], plan["y"]]))
+        return execute_plan(plan, dataset.to_pandas(columns))
+
+    schema = dataset.schema_frame()
+    if kind == "scalar":
+        column = plan["column"]
+        check_aggregatable(schema[column], plan["aggregation"])
+        expression = sql_aggregate(plan["aggregation"], column, schema[column])
+        value = dataset.sql(f"SELECT {expression} FROM {SQL_TABLE_NAME}").iloc[0, 0]
+        return f"The {AGGREGATION_LABELS[plan['aggregation']]} of {column} is {format_value(value)}."
+
+    if kind == "top_rows":
+        column = quote_identifier(plan["column"])
+        order = "DESC" if plan["rank"] == "top" else "ASC"
+        return dataset.sql(f"SELECT * FROM {SQL_TABLE_NAME} WHERE {column} IS NOT NULL ORDER BY {column} {order} LIMIT {int(plan['limit'])}")
+
+    #group, with pandas' defaults: missing keys dropped, groups sorted by key
+    by, column, aggregation = plan["by"], plan["column"], plan["aggregation"]
+    if column is None:
+        expression, value_name = "count(*)", "Count"
+    else:
+        check_aggregatable(schema[column], aggregation)
+        expression = sql_aggregate(aggregation, column, schema[column])
+        value_name = f"{AGGREGATION_LABELS[aggregation].capitalize()} {column}"
+    order = quote_identifier(by)
+    limit = ""
+    if plan["rank"] is not None:
+        order = f"{quote_identifier(value_name)} {'DESC' if plan['rank'] == 'top' else 'ASC'}"
+        limit = f" LIMIT {int(plan['limit'])}"
+    result = dataset.sql(
+        f"SELECT {quote_identifier(by)}, {expression} AS {quote_identifier(value_name)} FROM {SQL_TABLE_NAME} "
+        f"WHERE {quote_identifier(by)} IS NOT NULL GROUP BY 1 ORDER BY {order}{limit}"
+    )
+    return chart_result(result, plan, value_name)
+
+
+def answer_locally(prompt: str, df):
+    #returns a figure, DataFrame or answer string for prompts the planner understands, otherwise None
+    if isinstance(df, ColumnarDataset):
+        plan = plan_query(prompt, df.schema_frame(), df.distinct_count)
+        return None if plan is None else execute_plan_sql(plan, df)
+    plan = plan_query(prompt, df)
+    if plan is None:
+        return None
+    return execute_plan(plan, df)
@@ -0,0 +1,211 @@
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from wire import encode_figure
+
+# --- Point Budgets ---
+#traces above their budget are reduced before the figure is serialized, 0 disables a reduction
+LINE_POINT_BUDGET = int(os.getenv("FIGURE_LINE_POINT_BUDGET", "2000"))
+SCATTER_POINT_BUDGET = int(os.getenv("FIGURE_SCATTER_POINT_BUDGET", "5000"))
+BAR_POINT_BUDGET = int(os.getenv("FIGURE_BAR_POINT_BUDGET", "500"))
+HISTOGRAM_POINT_BUDGET = int(os.getenv("FIGURE_HISTOGRAM_POINT_BUDGET", "5000"))
+
+#per-point trace attributes that have to be subset together with x and y
+POINT_ATTRIBUTES = ["x", "y", "text", "hovertext", "customdata", "ids", "marker.color", "marker.size", "marker.symbol", "marker.opacity"]
+#trace attributes carried over when a histogram is replaced by the pre-binned bar trace
+HISTOGRAM_KEPT_ATTRIBUTES = ["name", "legendgroup", "showlegend", "offsetgroup", "alignmentgroup", "xaxis", "yaxis", "opacity"]
+MAX_GRID_BINS = 512
+
+
+def _numeric(values):
+    #returns values as float64 (dates as epoch nanoseconds), or None for categorical data
+    array = np.asarray(values)
+    if array.dtype.kind in "iuf":
+        return array.astype("float64")
+    if array.dtype.kind == "M":
+        return array.astype("datetime64[ns]").astype("int64").astype("float64")
+    if array.dtype.kind in "OU":
+        try:
+            return pd.to_numeric(pd.Series(array)).to_numpy(dtype="float64")
+        except (ValueError, TypeError):
+            pass
+        try:
+            return pd.to_datetime(pd.Series(array)).astype("int64").to_numpy(dtype="float64")
+        except (ValueError, TypeError):
+            return None
+    return None
+
+
+def _point_count(trace):
+    for attribute in ("x", "y"):
+        values = getattr(trace, attribute, None)
+        if values is not None and not isinstance(values, str):
+            return len(values)
+    return 0
+
+
+def _point_arrays(trace, n):
+    #yields (owner, attribute, values) for every per-point array on the trace
+    for path in POINT_ATTRIBUTES:
+        *parents, attribute = path.split(".")
+        owner = trace
+        for parent in parents:
+            owner = getattr(owner, parent, None)
+        if owner is None or attribute not in owner:
+            continue
+        values = getattr(owner, attribute)
+        if values is not None and not isinstance(values, str) and np.ndim(values) >= 1 and len(values) == n:
+            yield owner, attribute, values
+
+
+def _subset(trace, indices, n):
+    for owner, attribute, values in list(_point_arrays(trace, n)):
+        setattr(owner, attribute, np.asarray(values)[indices])
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of the threshold points that best keep the line's shape."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    bucket_size = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_start, next_end = end, min(int((i + 2) * bucket_size) + 1, n)
+        if next_end <= next_start:
+            next_start, next_end = n - 1, n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def grid_indices(x, y, budget):
+    """One representative point per occupied grid cell, on the finest grid that fits within budget."""
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if finite.size == 0:
+        return finite #nothing drawable, and min/max of an empty array raise
+    x, y = x[finite], y[finite]
+    x_span = (x.max() - x.min()) or 1.0
+    y_span = (y.max() - y.min()) or 1.0
+    bins = MAX_GRID_BINS
+    while bins > 1:
+        xi = ((x - x.min()) / x_span * (bins - 1)).astype(np.int64)
+        yi = ((y - y.min()) / y_span * (bins - 1)).astype(np.int64)
+        _, first = np.unique(xi * bins + yi, return_index=True)
+        if len(first) <= budget:
+            break
+        bins //= 2
+    return finite[np.sort(first)]
+
+
+def _reduce_line(trace, n):
+    x = _numeric(trace.x) if trace.x is not None else np.arange(n, dtype="float64")
+    y = _numeric(trace.y)
+    if x is None:
+        x = np.arange(n, dtype="float64") #categorical x, use the drawing order
+    if y is None or not (np.isfinite(x).all() and np.isfinite(y).all()):
+        return None #gaps in a line are meaningful, leave it alone
+    return lttb_indices(x, y, LINE_POINT_BUDGET)
+
+
+def _reduce_scatter(trace, n):
+    x, y = _numeric(trace.x), _numeric(trace.y)
+    if x is None or y is None:
+        return None
+    return grid_indices(x, y, SCATTER_POINT_BUDGET)
+
+
+def _aggregate_bar(fig, trace, n):
+    #duplicate categories in one bar trace are drawn as stacked segments, so summing them looks the same
+    if fig.layout.barmode not in ("stack", "relative"):
+        return False
+    horizontal = trace.orientation == "h"
+    categories, values = (trace.y, trace.x) if horizontal else (trace.x, trace.y)
+    if categories is None or values is None:
+        return False
+    if any(attribute not in ("x", "y") for _, attribute, _ in _point_arrays(trace, n)):
+        return False #per-bar colours or labels can't be combined
+    numeric_values = _numeric(values)
+    if numeric_values is None:
+        return False
+    totals = pd.Series(numeric_values).groupby(pd.Index(np.asarray(categories)), sort=False).sum()
+    if len(totals) == n:
+        return False
+    if horizontal:
+        trace.y, trace.x = totals.index.to_numpy(), totals.to_numpy()
+    else:
+        trace.x, trace.y = totals.index.to_numpy(), totals.to_numpy()
+    return True
+
+
+def _prebin_histogram(trace):
+    #returns an equivalent bar trace with the counts computed here, or None if the histogram isn't a plain count
+    if trace.y is not None or trace.x is None or trace.histfunc not in (None, "count") or trace.histnorm not in (None, ""):
+        return None
+    if trace.orientation == "h" or trace.cumulative.enabled:
+        return None
+    kept = {attribute: getattr(trace, attribute) for attribute in HISTOGRAM_KEPT_ATTRIBUTES if getattr(trace, attribute) is not None}
+    marker_color = trace.marker.color if isinstance(trace.marker.color, str) else None
+    raw = np.asarray(trace.x)
+    if raw.dtype.kind in "iuf":
+        x = raw.astype("float64")
+        x = x[np.isfinite(x)]
+        counts, edges = np.histogram(x, bins=trace.nbinsx or "auto")
+        return go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), marker_color=marker_color, **kept)
+    if raw.dtype.kind in "OU" and _numeric(raw) is None:
+        counts = pd.Series(raw).value_counts(sort=False)
+        return go.Bar(x=counts.index.to_numpy(), y=counts.to_numpy(), marker_color=marker_color, **kept)
+    return None #dates (and numbers stored as text) keep plotly's own binning
+
+
+def reduce_figure(fig: go.Figure):
+    """Shrinks oversized traces in place and returns a summary of what changed, or None if nothing did."""
+    points_before, points_after, methods = 0, 0, []
+    new_traces, replaced = [], False
+    for trace in fig.data:
+        n = _point_count(trace)
+        points_before += n
+        method, indices = None, None
+        if trace.type in ("scatter", "scattergl"):
+            mode = trace.mode or ("lines" if n > 20 else "lines+markers")
+            if "lines" in mode and LINE_POINT_BUDGET and n > LINE_POINT_BUDGET:
+                method, indices = "lttb", _reduce_line(trace, n)
+            elif "lines" not in mode and SCATTER_POINT_BUDGET and n > SCATTER_POINT_BUDGET:
+                method, indices = "grid", _reduce_scatter(trace, n)
+        elif trace.type == "bar" and BAR_POINT_BUDGET and n > BAR_POINT_BUDGET:
+            if _aggregate_bar(fig, trace, n):
+                methods.append("aggregate")
+        elif trace.type == "histogram" and HISTOGRAM_POINT_BUDGET and n > HISTOGRAM_POINT_BUDGET:
+            binned = _prebin_histogram(trace)
+            if binned is not None:
+                trace, replaced = binned, True
+                methods.append("prebin")
+
+        if indices is not None and len(indices) < n:
+            _subset(trace, indices, n)
+            methods.append(method)
+        points_after += _point_count(trace)
+        new_traces.append(trace)
+
+    if replaced:
+        #plotly only allows removing or reordering existing traces, so rebuild the list
+        fig.data = []
+        fig.add_traces(new_traces)
+    if not methods:
+        return None
+    return {"points_before": points_before, "points_after": points_after, "methods": sorted(set(methods))}
+
+
+def serialize_figure(fig: go.Figure):
+    #reduces the figure and returns (figure JSON, reduction summary or None)
+    reduction = reduce_figure(fig)
+    return encode_figure(fig), reduction
@@ -0,0 +1,343 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import CACHE_DATABASE
+
+# --- Job Queue Configuration ---
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "4"))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "16")) #waiting jobs allowed on top of the running ones
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "600")) #how long finished jobs stay pollable
+#"on" records jobs in the cache database so that any server process can report or cancel them. needed when
+#several worker processes serve the API (serve.py turns it on), as a poll can land on a different worker
+SHARED_JOBS = os.getenv("SHARED_JOBS", "off")
+JOB_DATABASE = CACHE_DATABASE
+JOB_POLL_SECONDS = 0.2 #how often shared state is re-read while waiting on, or checking for cancellation of, a job
+
+# --- LLM Concurrency Configuration ---
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4")) #LLM-bound queries one server process runs at once
+LLM_SLOT_WAIT_SECONDS = float(os.getenv("LLM_SLOT_WAIT_SECONDS", "60")) #how long a query waits for a slot before it's turned away
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is already at capacity."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been asked to stop."""
+
+
+class ServerBusyError(Exception):
+    """Raised when an LLM-bound query can't get a concurrency slot in time."""
+
+
+def check_cancelled(cancel_event):
+    #called by long running work between stages, so cancellation takes effect at the next stage boundary
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled()
+
+
+class Job:
+    """A unit of work in the queue and the state clients poll for."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued" #queued, running, done, failed, cancelled
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.finished_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    @classmethod
+    def from_record(cls, row):
+        #a read-only copy of a job run by another server process
+        job = cls()
+        job.id, job.status, job.error, result, job.created_at, job.started_at, job.finished_at = row
+        job.result = tuple(json.loads(result)) if result is not None else None
+        if job.finished:
+            job.finished_event.set()
+        return job
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobStore:
+    """Job status and results in SQLite, shared by every server process using the same database file."""
+
+    def __init__(self, database=JOB_DATABASE):
+        self.database = database
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        #commits on success and always closes the connection
+        conn = sqlite3.connect(self.database, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, job):
+        #results are JSON, as the routes would send them; cancel_requested belongs to whoever asked for it
+        result = json.dumps(job.result, default=str) if job.result is not None else None
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    INSERT INTO jobs (id, status, error, result, created_at, started_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET status = excluded.status, error = excluded.error, result = excluded.result,
+                        started_at = excluded.started_at, finished_at = excluded.finished_at
+                ''', (job.id, job.status, job.error, result, job.created_at, job.started_at, job.finished_at))
+        except sqlite3.Error as e:
+            print(f"Job store Error saving job {job.id}: {e}")
+
+    def load(self, job_id):
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT id, status, error, result, created_at, started_at, finished_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Job store Error reading job {job_id}: {e}")
+            return None
+        return Job.from_record(row) if row is not None else None
+
+    def request_cancel(self, job_id):
+        try:
+            with self._connect() as conn:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+        except sqlite3.Error as e:
+            print(f"Job store Error cancelling job {job_id}: {e}")
+
+    def cancel_requested(self, job_id) -> bool:
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        except sqlite3.Error:
+            return False
+        return bool(row and row[0])
+
+    def purge(self, cutoff):
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+        except sqlite3.Error as e:
+            print(f"Job store Error purging jobs: {e}")
+
+
+class StoredCancelEvent:
+    """A job's cancel event that also reads as set once another server process asked the store to cancel the job."""
+
+    def __init__(self, store, job_id):
+        self._store = store
+        self._job_id = job_id
+        self._own = threading.Event()
+        self._checked_at = 0.0
+
+    def set(self):
+        self._own.set()
+
+    def is_set(self):
+        #rereads the store at most every JOB_POLL_SECONDS, checkpoints are frequent
+        if not self._own.is_set() and time.monotonic() - self._checked_at >= JOB_POLL_SECONDS:
+            self._checked_at = time.monotonic()
+            if self._store.cancel_requested(self._job_id):
+                self._own.set()
+        return self._own.is_set()
+
+
+class JobQueue:
+    """Bounded worker pool that runs submitted functions in the background and tracks their status.
+
+    With a JobStore, every status change is also recorded there, so other server processes
+    sharing the store can report a job's status and result, and ask for it to be cancelled.
+    """
+
+    def __init__(self, max_workers=QUERY_WORKERS, max_queued=MAX_QUEUED_JOBS, ttl_seconds=JOB_TTL_SECONDS, store=None):
+        self.max_workers = max(1, max_workers)
+        self.max_queued = max(0, max_queued)
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="query-worker")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _active_count(self):
+        return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self.store is not None and expired:
+            self.store.purge(cutoff)
+
+    def depth(self) -> dict:
+        with self._lock:
+            active = [job for job in self._jobs.values() if not job.finished]
+        running = sum(1 for job in active if job.status == "running")
+        return {"running": running, "queued": len(active) - running, "capacity": self.max_workers + self.max_queued}
+
+    def submit(self, fn, *args, **kwargs) -> Job:
+        #fn is called with cancel_event=<threading.Event> so it can stop early when cancelled
+        return self.submit_many([(fn, args, kwargs)])[0]
+
+    def submit_many(self, calls) -> list:
+        """Submits (fn, args, kwargs) calls as one job each, either all of them or none if the queue lacks room."""
+        jobs = [Job() for _ in calls]
+        with self._lock:
+            self._purge_expired()
+            if self._active_count() + len(jobs) > self.max_workers + self.max_queued:
+                raise QueueFullError("Too many queries in progress, try again shortly.")
+            for job in jobs:
+                self._jobs[job.id] = job
+        if self.store is not None:
+            for job in jobs:
+                job.cancel_event = StoredCancelEvent(self.store, job.id)
+                self.store.save(job)
+        for job, (fn, args, kwargs) in zip(jobs, calls):
+            self._executor.submit(self._run, job, fn, args, kwargs)
+        return jobs
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            if job.cancel_event.is_set():
+                if not job.finished:
+                    self._finish(job, "cancelled")
+                return
+            job.status = "running"
+            job.started_at = time.time()
+        if self.store is not None:
+            self.store.save(job)
+        try:
+            result = fn(*args, cancel_event=job.cancel_event, **kwargs)
+        except JobCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            print(f"Error running job {job.id}: {e}")
+            self._finish(job, "failed", error=str(e))
+        else:
+            #a job cancelled after its last checkpoint still finished, but nobody wants the result any more
+            self._finish(job, "cancelled" if job.cancel_event.is_set() else "done", result=result)
+
+    def _finish(self, job, status, result=None, error=None):
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.status = status
+        if self.store is not None:
+            self.store.save(job)
+        job.finished_event.set()
+
+    def get(self, job_id):
+        #jobs submitted to this process, or a snapshot of one another process runs
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    def wait(self, job_id, timeout):
+        #long-poll helper: blocks until the job finishes or the timeout passes
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            if job is not None and timeout > 0:
+                job.finished_event.wait(timeout)
+            return job
+        #another process runs it, so watch the store
+        deadline = time.monotonic() + timeout
+        job = self.store.load(job_id)
+        while job is not None and not job.finished and time.monotonic() < deadline:
+            time.sleep(min(JOB_POLL_SECONDS, max(0.0, deadline - time.monotonic())))
+            job = self.store.load(job_id)
+        return job
+
+    def cancel(self, job_id):
+        #returns the job, or None if it doesn't exist. queued jobs never start, running ones stop at their next checkpoint
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.finished:
+                job.cancel_event.set()
+                if job.status == "queued":
+                    self._finish(job, "cancelled")
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+            if job is not None and not job.finished:
+                self.store.request_cancel(job_id) #the process running it stops at its next checkpoint
+        return job
+
+
+class ConcurrencyLimiter:
+    """Caps how many LLM-bound queries one server process runs at once; the rest wait a bounded time for a slot.
+
+    The backend holds slots through llm_slot() in app.py, which also times the wait.
+    """
+
+    def __init__(self, limit=LLM_CONCURRENCY, wait_seconds=LLM_SLOT_WAIT_SECONDS):
+        self.limit = max(1, limit)
+        self.wait_seconds = wait_seconds
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def acquire(self, cancel_event=None):
+        #raises ServerBusyError after wait_seconds, or JobCancelled if the job is cancelled while it waits
+        with self._lock:
+            self.waiting += 1
+        try:
+            deadline = time.monotonic() + self.wait_seconds
+            while not self._slots.acquire(timeout=min(JOB_POLL_SECONDS, max(0.0, deadline - time.monotonic()))):
+                check_cancelled(cancel_event)
+                if time.monotonic() >= deadline:
+                    with self._lock:
+                        self.rejected += 1
+                    raise ServerBusyError(f"All {self.limit} LLM slots stayed busy for {self.wait_seconds:g} seconds")
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            self.active += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"limit": self.limit, "active": self.active, "waiting": self.waiting, "rejected": self.rejected}
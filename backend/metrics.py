@@ -0,0 +1,194 @@
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+
+# --- Metrics Configuration ---
+#"on" adds a Server-Timing header to every response, otherwise only requests sending "X-Timing: 1" get it
+TIMING_HEADER = os.getenv("TIMING_HEADER", "off")
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024")) #recent observations per series used for quantiles
+METRICS_PREFIX = "dataquery"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Summary:
+    """Per label set: quantiles over a sliding window of recent observations, plus all-time count and sum."""
+
+    type = "summary"
+
+    def __init__(self, name, help_text, window=METRICS_WINDOW):
+        self.name = name
+        self.help = help_text
+        self.window = window
+        self._series = {} #label items -> [deque of recent values, count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [deque(maxlen=self.window), 0, 0.0]
+            series[0].append(value)
+            series[1] += 1
+            series[2] += value
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(dict(key), sorted(values), count, total) for key, (values, count, total) in self._series.items()]
+        for labels, values, count, total in snapshot:
+            for quantile in QUANTILES:
+                value = values[min(len(values) - 1, int(quantile * len(values)))]
+                yield self.name, dict(labels, quantile=quantile), value
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Counter:
+    """Monotonic counts per label set."""
+
+    type = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            snapshot = list(self._values.items())
+        for key, value in snapshot:
+            yield f"{self.name}_total", dict(key), value
+
+
+class Callback:
+    """Values read from another component at scrape time; fn returns [(labels dict, value), ...]."""
+
+    def __init__(self, name, metric_type, help_text, fn):
+        self.name = name
+        self.type = metric_type
+        self.help = help_text
+        self.fn = fn
+
+    def samples(self):
+        for labels, value in self.fn():
+            yield self.name, labels, value
+
+
+class MetricsRegistry:
+    """Collects metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def summary(self, name, help_text):
+        return self._register(Summary(f"{self.prefix}_{name}", help_text))
+
+    def counter(self, name, help_text):
+        return self._register(Counter(f"{self.prefix}_{name}", help_text))
+
+    def callback(self, name, metric_type, help_text, fn):
+        return self._register(Callback(f"{self.prefix}_{name}", metric_type, help_text, fn))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+stage_seconds = registry.summary("stage_seconds", "Time spent in each query pipeline or storage stage.")
+stage_errors = registry.counter("stage_errors", "Exceptions raised inside a stage, including ones handled by a fallback.")
+request_seconds = registry.summary("request_seconds", "HTTP request latency by route.")
+request_bytes = registry.summary("request_bytes", "HTTP request body size by route.")
+response_bytes = registry.summary("response_bytes", "HTTP response body size by route, before compression.")
+branch_outcomes = registry.counter("branch_outcomes", "How each answering branch ended (fast path, LIDA, PandasAI).")
+
+
+# --- Tracing ---
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Stage durations recorded while serving one request, for the Server-Timing header."""
+
+    def __init__(self):
+        self._stages = []
+        self._lock = threading.Lock() #speculative branches record from other threads
+
+    def add(self, name, seconds):
+        with self._lock:
+            self._stages.append((name, seconds))
+
+    def server_timing(self) -> str:
+        with self._lock:
+            return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self._stages)
+
+
+def start_trace():
+    #returns a token for end_trace
+    return _current_trace.set(Trace())
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Times a block into stage_seconds (and the request's trace), counting exceptions that escape it."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
+
+
+def record_branch(branch, outcome):
+    branch_outcomes.inc(branch=branch, outcome=outcome)
@@ -0,0 +1,295 @@
+import copy
+import os
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+from lida import TextGenerationConfig
+from lida.components.summarizer import Summarizer
+
+from metrics import stage
+
+# --- Profiler Configuration ---
+#"local" builds LIDA's dataset summary with pandas alone, "hybrid" also asks the LLM about the columns
+#the profiler couldn't classify, "llm" is LIDA's own summarize(summary_method="llm")
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "hybrid")
+PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "100000")) #larger frames are profiled on a seeded sample
+SUMMARY_MODES = ("local", "hybrid", "llm")
+if SUMMARY_MODE not in SUMMARY_MODES:
+    print(f"Unknown SUMMARY_MODE '{SUMMARY_MODE}', using hybrid")
+    SUMMARY_MODE = "hybrid"
+
+SAMPLE_SEED = 42
+SAMPLE_VALUES = 3 #example values per column, as LIDA sends
+DATE_CANDIDATES = 100 #distinct values tried when deciding whether a text column holds dates
+DATE_MIN_PARSED = 0.9 #share of them that must parse
+CATEGORY_MAX_UNIQUE_RATIO = 0.5 #LIDA's own cut between category and string
+
+#semantic types recognised from column names, matched against the lowercased name with punctuation as spaces
+NAME_SEMANTICS = [
+    (r"\b(lat|latitude)\b", "latitude"),
+    (r"\b(lon|lng|longitude)\b", "longitude"),
+    (r"\b(zip|zipcode|postcode|postal)\b", "zip code"),
+    (r"\be ?mail\b", "email"),
+    (r"\b(url|link|website)\b", "url"),
+    (r"\bip( address)?\b", "ip address"),
+    (r"\b(id|uuid|key|code|sku)\b", "identifier"),
+    (r"\baddress\b", "address"),
+    (r"\b(city|town)\b", "city"),
+    (r"\bcountry\b", "country"),
+    (r"\b(state|province|region)\b", "region"),
+    (r"\b(location|site|place)\b", "location"),
+    (r"\b(company|supplier|vendor|brand)\b", "company"),
+    (r"\b(gender|sex)\b", "gender"),
+    (r"\b(day of week|weekday)\b", "weekday"),
+    (r"\bmonth\b", "month"),
+    (r"\byear\b", "year"),
+    (r"\b(days|hours|minutes|seconds|duration|lead time)\b", "duration"),
+    (r"\b(date|time|timestamp|day)\b", "date"),
+    (r"\b(flag|is|has)\b", "flag"),
+    (r"\b(price|cost|income|revenue|sales|amount|salary|fare)\b", "currency"),
+    (r"\b(units|quantity|qty|count|number|stock|level)\b", "quantity"),
+    (r"\bage\b", "age"),
+    (r"\bpopulation\b", "population"),
+    (r"\b(name|title)\b", "name"),
+]
+#semantic types recognised from text values, when most sample values match
+VALUE_SEMANTICS = [
+    (re.compile(r"^[\w.+-]+@[\w-]+\.[\w.-]+$"), "email"),
+    (re.compile(r"^https?://\S+$"), "url"),
+    (re.compile(r"^\d{1,3}(\.\d{1,3}){3}$"), "ip address"),
+]
+DATE_LIKE = re.compile(r"\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|\d{4}-\d{2}|[A-Za-z]{3,9} \d{1,2},? \d{4}|\d{1,2} [A-Za-z]{3,9} \d{4}")
+
+
+def normalize_name(column) -> str:
+    return re.sub(r"[^0-9a-z]+", " ", str(column).lower()).strip()
+
+
+def name_semantic_type(column):
+    name = normalize_name(column)
+    for pattern, semantic_type in NAME_SEMANTICS:
+        if re.search(pattern, name):
+            return semantic_type
+    return None
+
+
+def value_semantic_type(samples):
+    values = [str(value) for value in samples]
+    for pattern, semantic_type in VALUE_SEMANTICS:
+        if values and sum(bool(pattern.match(value)) for value in values) / len(values) >= DATE_MIN_PARSED:
+            return semantic_type
+    return None
+
+
+def json_value(value):
+    #numpy scalars and timestamps as plain JSON values, the summary is cached as JSON
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def number_value(value, dtype, digits=6):
+    #integers stay integers, as in LIDA's summaries; floats keep a few significant digits, the summary is pasted into prompts
+    if pd.isna(value):
+        return None
+    return int(value) if pd.api.types.is_integer_dtype(dtype) else float(f"{value:.{digits}g}")
+
+
+def parse_dates(series: pd.Series):
+    #returns the series as datetimes if it holds dates written as text, otherwise None
+    candidates = series.dropna().astype(str).drop_duplicates().head(DATE_CANDIDATES)
+    if candidates.empty or candidates.str.contains(DATE_LIKE).mean() < DATE_MIN_PARSED:
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") #"could not infer format" for mixed formats
+        if pd.to_datetime(candidates, errors="coerce").notna().mean() < DATE_MIN_PARSED:
+            return None
+        return pd.to_datetime(series, errors="coerce")
+
+
+def sample_values(series: pd.Series, rng, n=SAMPLE_VALUES) -> list:
+    values = pd.unique(series.dropna())
+    if len(values) > n:
+        values = values[rng.choice(len(values), n, replace=False)]
+    return [json_value(value) for value in values]
+
+
+def describe_field(column, semantic_type, properties) -> str:
+    #a short factual description in place of the one the LLM would write, the statistics are already alongside it
+    description = f"{str(column).replace('_', ' ')} ({semantic_type})"
+    if properties.get("null_rate"):
+        description += f", {properties['null_rate']:.0%} missing"
+    return description
+
+
+def profile_dataframe(df: pd.DataFrame, file_name="", sample_rows=PROFILE_SAMPLE_ROWS) -> dict:
+    """LIDA-compatible dataset summary computed locally, with vectorized per-column statistics.
+
+    Min, max and null rates cover every row; the rest is computed on a seeded sample of
+    sample_rows rows for larger frames. Columns the profiler couldn't give a semantic type are
+    left with an empty semantic_type, which is what hybrid mode sends to the LLM.
+    """
+    rows = len(df)
+    sample = df.sample(sample_rows, random_state=SAMPLE_SEED) if rows > sample_rows else df
+    rng = np.random.default_rng(SAMPLE_SEED)
+
+    null_rates = df.isna().mean() if rows else pd.Series(0.0, index=df.columns)
+    unique_counts = sample.nunique(dropna=True)
+    numeric = df.select_dtypes(include="number").select_dtypes(exclude="bool")
+    numeric_stats = None
+    if not numeric.empty:
+        numeric_sample = sample[numeric.columns]
+        numeric_stats = pd.concat([
+            numeric.min().rename("min"), numeric.max().rename("max"),
+            numeric_sample.std().rename("std"), numeric_sample.quantile([0.25, 0.5, 0.75]).T.add_prefix("q"),
+        ], axis=1)
+
+    fields = []
+    for position, column in enumerate(df.columns):
+        series = sample.iloc[:, position]
+        properties = {}
+        semantic_type = None
+        if numeric_stats is not None and column in numeric_stats.index:
+            stats = numeric_stats.loc[column]
+            properties["dtype"] = "number"
+            properties["std"] = number_value(stats["std"], float, 4)
+            properties["min"] = number_value(stats["min"], df[column].dtype)
+            properties["max"] = number_value(stats["max"], df[column].dtype)
+            properties["quantiles"] = {f"{q:.0%}": number_value(stats[f"q{q}"], float, 4) for q in (0.25, 0.5, 0.75)}
+            semantic_type = name_semantic_type(column)
+            if semantic_type is None:
+                semantic_type = "flag" if unique_counts[column] <= 2 and set(series.dropna().unique()) <= {0, 1} else "number"
+        elif pd.api.types.is_bool_dtype(series):
+            properties["dtype"] = "boolean"
+            semantic_type = name_semantic_type(column) or "flag"
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            properties["dtype"] = "date"
+            properties["min"], properties["max"] = json_value(df[column].min()), json_value(df[column].max())
+            semantic_type = "date"
+        else:
+            dates = parse_dates(series)
+            if dates is not None:
+                properties["dtype"] = "date"
+                properties["min"], properties["max"] = json_value(dates.min()), json_value(dates.max())
+                semantic_type = "date"
+            elif isinstance(series.dtype, pd.CategoricalDtype) or (len(series) and unique_counts[column] / len(series) < CATEGORY_MAX_UNIQUE_RATIO):
+                properties["dtype"] = "category"
+            else:
+                properties["dtype"] = "string"
+
+        properties["samples"] = sample_values(series, rng)
+        properties["num_unique_values"] = int(unique_counts[column])
+        if null_rates[column] > 0:
+            properties["null_rate"] = round(float(null_rates[column]), 4)
+        if semantic_type is None:
+            semantic_type = value_semantic_type(properties["samples"]) or name_semantic_type(column)
+        properties["semantic_type"] = semantic_type or ""
+        properties["description"] = describe_field(column, semantic_type, properties) if semantic_type else ""
+        fields.append({"column": column, "properties": properties})
+
+    return {
+        "name": file_name,
+        "file_name": file_name,
+        "dataset_description": f"{rows:,} rows and {len(df.columns)} columns.",
+        "fields": fields,
+        "field_names": df.columns.tolist(),
+    }
+
+
+def enrich_unclassified(summary: dict, text_gen, textgen_config) -> dict:
+    """Asks the LLM for semantic types and descriptions of the columns the profiler left empty, in one call."""
+    unclassified = [field for field in summary["fields"] if not field["properties"]["semantic_type"]]
+    if not unclassified:
+        return summary
+    partial = {"name": summary["name"], "file_name": summary["file_name"], "dataset_description": "", "fields": unclassified}
+    with stage("profile_enrich"):
+        enriched = Summarizer().enrich(partial, text_gen=text_gen, textgen_config=textgen_config)
+
+    annotations = {field.get("column"): field.get("properties", {}) for field in enriched.get("fields", []) if isinstance(field, dict)}
+    for field in unclassified:
+        annotation = annotations.get(field["column"], {})
+        for key in ("semantic_type", "description"):
+            if annotation.get(key):
+                field["properties"][key] = annotation[key]
+    if enriched.get("dataset_description"):
+        summary["dataset_description"] = enriched["dataset_description"]
+    return summary
+
+
+def merge_date_range(properties, dates: pd.Series):
+    #widens a date field's min and max to cover dates, keeping the format of the bounds already there
+    dates = dates.dropna()
+    if dates.empty:
+        return
+    low, high = dates.min(), dates.max()
+    try:
+        if properties.get("min") is not None:
+            low = min(low, pd.Timestamp(properties["min"]))
+        if properties.get("max") is not None:
+            high = max(high, pd.Timestamp(properties["max"]))
+    except (ValueError, TypeError):
+        pass #bounds LIDA wrote in a form pandas can't read back, the new rows' range replaces them
+    properties["min"], properties["max"] = json_value(low), json_value(high)
+
+
+def refresh_summary(summary: dict, sketch, appended: pd.DataFrame = None, replaced: pd.DataFrame = None) -> dict:
+    """Brings a cached summary up to date with a new version of its dataset without profiling the rows again.
+
+    Distinct counts, null rates and numeric ranges come from the version's merged sketch, date ranges from
+    the appended rows alone, and semantic types and descriptions (including any the LLM wrote) carry over.
+    Replaced or added columns are profiled from their new values. Quantiles can't be merged, so fields the
+    sketch updates lose them.
+    """
+    summary = copy.deepcopy(summary)
+    if replaced is not None:
+        fresh = {field["column"]: field for field in profile_dataframe(replaced)["fields"]}
+        summary["fields"] = [fresh.pop(field["column"], field) for field in summary["fields"]] + list(fresh.values())
+        summary["field_names"] = [field["column"] for field in summary["fields"]]
+
+    for field in summary["fields"]:
+        column, properties = field["column"], field["properties"]
+        stats = sketch.columns.get(str(column))
+        if stats is None or (replaced is not None and column in replaced.columns):
+            continue
+        properties["num_unique_values"] = stats.distinct.count()
+        if stats.nulls:
+            properties["null_rate"] = round(stats.nulls / sketch.rows, 4)
+        else:
+            properties.pop("null_rate", None)
+        if properties.get("dtype") == "number" and stats.kind in ("integer", "number") and stats.count:
+            properties["min"], properties["max"] = stats.minimum, stats.maximum
+            properties["std"] = number_value(stats.std(), float, 4) if stats.std() is not None else None
+            properties.pop("quantiles", None)
+        elif properties.get("dtype") == "date" and appended is not None and column in appended.columns:
+            series = appended[column]
+            dates = series if pd.api.types.is_datetime64_any_dtype(series) else parse_dates(series)
+            if dates is not None:
+                merge_date_range(properties, dates)
+
+    if re.match(r"^[\d,]+ rows and \d+ columns\.$", summary.get("dataset_description", "")):
+        summary["dataset_description"] = f"{sketch.rows:,} rows and {len(summary['fields'])} columns."
+    return summary
+
+
+def summarize_dataset(lida, df: pd.DataFrame, mode=SUMMARY_MODE, textgen_config=None) -> dict:
+    """Returns LIDA's dataset summary for df in the given mode."""
+    if mode == "llm":
+        #summarize() keeps the frame on the Manager, which outlives this request, so it gets its own copy
+        if textgen_config is None:
+            return lida.summarize(df.copy(), summary_method="llm")
+        return lida.summarize(df.copy(), summary_method="llm", textgen_config=textgen_config)
+
+    with stage("profile"):
+        summary = profile_dataframe(df)
+    if mode == "hybrid":
+        try:
+            summary = enrich_unclassified(summary, lida.text_gen, textgen_config or TextGenerationConfig(n=1, temperature=0))
+        except Exception as e:
+            print(f"Error enriching dataset summary, using the local profile: {e}")
+    return summary
@@ -0,0 +1,216 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# --- Intent Router Configuration ---
+#P(chart) at or above this goes to LIDA, at or below ROUTER_PANDASAI_THRESHOLD straight to PandasAI,
+#anything in between is raced when speculative mode is on, as is every prompt that names a chart
+ROUTER_LIDA_THRESHOLD = float(os.getenv("ROUTER_LIDA_THRESHOLD", "0.75"))
+ROUTER_PANDASAI_THRESHOLD = float(os.getenv("ROUTER_PANDASAI_THRESHOLD", "0.25"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20")) #labelled prompts needed before the classifier is used
+ROUTER_PRIOR_WEIGHT = float(os.getenv("ROUTER_PRIOR_WEIGHT", "50")) #the keyword rules count as this many prompts
+ROUTER_RETRAIN_EVERY = int(os.getenv("ROUTER_RETRAIN_EVERY", "50")) #new history rows between retrains
+ROUTER_TRAINING_ROWS = int(os.getenv("ROUTER_TRAINING_ROWS", "5000")) #most recent outcomes used for training
+
+#keywords to identify visualisation prompts
+VISUALIZATION_KEYWORDS = [
+    'plot', 'chart', 'graph', 'visualize', 'visualise', 'visualization', 'visualisation',
+    'histogram', 'scatter', 'bar', 'line', 'pie', 'map',
+    'show me a plot', 'show me a chart', 'show me a graph',
+    'draw a plot', 'draw a chart', 'draw a graph',
+    'create a plot', 'create a chart', 'create a graph',
+    'generate a plot', 'generate a chart', 'generate a graph',
+    'heatmap', 'treemap'
+]
+
+#chart words written as one word: "scatterplot", "boxplot", "piechart", "subplots"
+VISUALIZATION_SUFFIXES = ['plot', 'chart']
+
+#words that may or may not mean a chart
+AMBIGUOUS_KEYWORDS = [
+    'show', 'compare', 'comparison', 'trend', 'distribution', 'against',
+    'over time', 'breakdown', 'relationship', 'correlation'
+]
+
+#confidence from the keyword rules alone, used until there is history to learn from
+RULE_CONFIDENCE = {"visual": 0.9, "ambiguous": 0.5, "none": 0.1}
+
+
+def compile_keywords(keywords, suffixes=()):
+    #whole words or phrases only, with a plural or verb ending: "plot" matches "plots" and "plotting",
+    #"bar" matches "bars" but not "baseline" or "barrier". a suffix also matches as the end of a longer word
+    alternatives = [re.escape(keyword).replace(r"\ ", r"\s+") for keyword in sorted(keywords, key=len, reverse=True)]
+    alternatives += [rf"\w+{re.escape(suffix)}" for suffix in suffixes]
+    return re.compile(rf"\b(?:{'|'.join(alternatives)})(?:s|ed|ing|ted|ting)?\b", re.IGNORECASE)
+
+
+VISUALIZATION_PATTERN = compile_keywords(VISUALIZATION_KEYWORDS, VISUALIZATION_SUFFIXES)
+AMBIGUOUS_PATTERN = compile_keywords(AMBIGUOUS_KEYWORDS)
+
+
+def is_visualization_prompt(prompt: str) -> bool:
+    #checks if the prompt likely asks for a visualization.
+    return VISUALIZATION_PATTERN.search(prompt) is not None
+
+
+def is_ambiguous_prompt(prompt: str) -> bool:
+    #checks if the prompt could reasonably be answered with either a chart or text
+    return AMBIGUOUS_PATTERN.search(prompt) is not None
+
+
+def keyword_class(prompt: str) -> str:
+    if is_visualization_prompt(prompt):
+        return "visual"
+    if is_ambiguous_prompt(prompt):
+        return "ambiguous"
+    return "none"
+
+
+def features(prompt: str) -> list:
+    #words, adjacent word pairs and which keyword rule fired
+    words = re.findall(r"[a-z0-9]+", prompt.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])] + [f"__keywords_{keyword_class(prompt)}"]
+
+
+def outcome_label(response_type, feedback):
+    #True if the prompt was answered with a chart, False for text, None if the outcome doesn't say.
+    #an answer marked not useful is no evidence that its kind was the right one
+    if feedback == "not_useful" or response_type not in ("plot", "text"):
+        return None
+    return response_type == "plot"
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over prompt features, with add-one smoothing."""
+
+    def __init__(self, examples):
+        #examples: (prompt, is_visual) pairs
+        self.counts = {True: Counter(), False: Counter()}
+        self.docs = {True: 0, False: 0}
+        for prompt, is_visual in examples:
+            self.counts[is_visual].update(features(prompt))
+            self.docs[is_visual] += 1
+        self.samples = self.docs[True] + self.docs[False]
+        self.totals = {label: sum(counts.values()) for label, counts in self.counts.items()}
+        self.vocabulary = len(set(self.counts[True]) | set(self.counts[False])) + 1
+
+    def probability(self, prompt: str) -> float:
+        #P(visual | prompt)
+        scores = {}
+        for label in (True, False):
+            score = math.log((self.docs[label] + 1) / (self.samples + 2))
+            denominator = self.totals[label] + self.vocabulary
+            for feature in features(prompt):
+                score += math.log((self.counts[label][feature] + 1) / denominator)
+            scores[label] = score
+        #logistic of the log-odds, stable for large differences
+        odds = max(-50.0, min(50.0, scores[True] - scores[False]))
+        return 1 / (1 + math.exp(-odds))
+
+
+class RouteDecision:
+    """Where a prompt goes and how sure the router is that it wants a chart."""
+
+    def __init__(self, route, confidence, source):
+        self.route = route #"lida", "pandasai" or "speculative"
+        self.confidence = confidence #P(chart)
+        self.source = source #"rules" or "learned"
+
+    @property
+    def visual(self):
+        return self.confidence > 0.5
+
+    def to_dict(self):
+        return {"route": self.route, "confidence": round(self.confidence, 3), "source": self.source}
+
+
+class IntentRouter:
+    """Routes prompts to LIDA, PandasAI or both from keyword rules blended with a classifier.
+
+    The classifier learns from prompt history: prompts answered with a chart count as visual,
+    prompts answered with text as not, skipping errors and answers marked not useful. Its weight
+    grows with the number of examples, so a new install behaves like the keyword rules.
+
+    Those answers come from the routes the router picked, so a prompt sent to PandasAI is only
+    ever seen answered with text. Prompts that name a chart keep the rule confidence as a floor,
+    otherwise a few such answers would steer them away from LIDA for good. That floor is above
+    the LIDA threshold, so in speculative mode those prompts are raced instead of being sent to
+    LIDA alone: the race is what speculative mode is for, and whichever branch wins is an answer
+    the router didn't choose.
+    """
+
+    def __init__(self, speculative=False, lida_threshold=ROUTER_LIDA_THRESHOLD, pandasai_threshold=ROUTER_PANDASAI_THRESHOLD,
+                 min_samples=ROUTER_MIN_SAMPLES, prior_weight=ROUTER_PRIOR_WEIGHT, retrain_every=ROUTER_RETRAIN_EVERY):
+        self.speculative = speculative
+        self.lida_threshold = lida_threshold
+        self.pandasai_threshold = pandasai_threshold
+        self.min_samples = min_samples
+        self.prior_weight = prior_weight
+        self.retrain_every = max(1, retrain_every)
+        self.model = None
+        self._source = None #callable returning (prompt, response_type, feedback) rows
+        self._since_training = 0
+        self._lock = threading.Lock()
+        self._training = False
+
+    def train(self, outcomes):
+        """Fits the classifier to (prompt, response_type, feedback) rows and returns how many were usable."""
+        examples = [(prompt, label) for prompt, response_type, feedback in outcomes
+                    if prompt and (label := outcome_label(response_type, feedback)) is not None]
+        self.model = NaiveBayes(examples) if len(examples) >= self.min_samples else None #swapped in whole
+        return len(examples)
+
+    def train_from(self, source):
+        #source() returns the outcomes to learn from; it's called again every retrain_every saved prompts
+        self._source = source
+        try:
+            return self.train(source())
+        except Exception as e:
+            print(f"Error training intent router, using keyword rules: {e}")
+            return 0
+
+    def observe(self):
+        #called for every saved prompt, retrains in the background once enough new outcomes have accumulated
+        with self._lock:
+            self._since_training += 1
+            if self._source is None or self._training or self._since_training < self.retrain_every:
+                return
+            self._since_training = 0
+            self._training = True
+        threading.Thread(target=self._retrain, name="router-retrain", daemon=True).start()
+
+    def _retrain(self):
+        try:
+            self.train_from(self._source)
+        finally:
+            with self._lock:
+                self._training = False
+
+    def confidence(self, prompt):
+        """Returns (P(chart), "rules" or "learned")."""
+        keywords = keyword_class(prompt)
+        prior = RULE_CONFIDENCE[keywords]
+        model = self.model
+        if model is None:
+            return prior, "rules"
+        weight = model.samples / (model.samples + self.prior_weight)
+        confidence = weight * model.probability(prompt) + (1 - weight) * prior
+        if keywords == "visual":
+            confidence = max(confidence, prior)
+        return confidence, "learned"
+
+    def route(self, prompt) -> RouteDecision:
+        confidence, source = self.confidence(prompt)
+        if self.speculative and keyword_class(prompt) == "visual":
+            route = "speculative"
+        elif confidence >= self.lida_threshold:
+            route = "lida"
+        elif confidence <= self.pandasai_threshold:
+            route = "pandasai"
+        elif self.speculative:
+            route = "speculative"
+        else:
+            route = "lida" if confidence > 0.5 else "pandasai" #LIDA still falls back to PandasAI
+        return RouteDecision(route, confidence, source)
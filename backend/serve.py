@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+# --- Serving Configuration ---
+#production entry point: `python serve.py` from the backend directory, instead of app.py's development server
+BIND = os.getenv("BIND", "0.0.0.0:5000")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(min(4, multiprocessing.cpu_count())))) #server processes
+WEB_THREADS = int(os.getenv("WEB_THREADS", "16")) #requests each process handles at once, most of them wait on an LLM
+WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "300")) #a worker silent this long is restarted, long enough for a slow LLM answer
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "60")) #how long a stopping worker may finish its requests
+WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "0")) #recycle a worker after this many requests, 0 never does
+
+#with several processes a job poll can reach a worker other than the one running the job, so job status
+#goes through the shared store, and PandasAI's single-process cache is off. must be set before the backend is imported
+if WEB_WORKERS > 1:
+    os.environ.setdefault("SHARED_JOBS", "on")
+    os.environ.setdefault("PANDASAI_CACHE", "off")
+
+
+def load_backend():
+    #imports the backend once in the master: lida, pandasai, plotly and the LLM clients are set up and the
+    #local stages warmed, and every forked worker shares those pages instead of importing them again
+    import app as backend
+    backend.warm_up()
+    return backend
+
+
+def post_fork(server, worker):
+    #history's writer thread and connections don't survive the fork, each worker starts its own.
+    #without preload_app the worker imports the backend itself after this, and nothing needs resetting
+    backend = sys.modules.get("app")
+    if backend is not None:
+        backend.after_fork()
+
+
+def worker_exit(server, worker):
+    #queued history writes are committed and the chart executor's processes stopped before the worker goes
+    backend = sys.modules.get("app")
+    if backend is not None:
+        backend.before_exit()
+
+
+class BackendServer(BaseApplication):
+    """Gunicorn application that preloads the backend before forking its workers."""
+
+    def __init__(self, load=load_backend, options=None):
+        self.load_backend = load
+        self.options = {
+            "bind": BIND,
+            "workers": max(1, WEB_WORKERS),
+            "worker_class": "gthread",
+            "threads": max(1, WEB_THREADS),
+            "timeout": WEB_TIMEOUT,
+            "graceful_timeout": GRACEFUL_TIMEOUT,
+            "max_requests": WEB_MAX_REQUESTS,
+            "max_requests_jitter": WEB_MAX_REQUESTS // 10,
+            "preload_app": True,
+            "post_fork": post_fork,
+            "worker_exit": worker_exit,
+            **(options or {}),
+        }
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.load_backend().app
+
+
+if __name__ == '__main__':
+    BackendServer().run()
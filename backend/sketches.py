@@ -0,0 +1,177 @@
+import base64
+import math
+
+import numpy as np
+import pandas as pd
+
+# --- Sketch Configuration ---
+HLL_PRECISION = 12 #2^12 registers per column, about 1.6% error on distinct counts. fixed, stored sketches must agree
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_VALUE_BITS = 64 - HLL_PRECISION #hash bits left after the register index, 52 fit a float64 mantissa exactly
+
+
+def value_hashes(series: pd.Series) -> np.ndarray:
+    #64-bit hashes of a column's non-null values. numbers hash as float64 and dates as nanoseconds, so the same
+    #value hashes alike whether a version stored the column as int, float (with nulls) or a finer date unit
+    values = series.dropna()
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+        values = values.astype("float64")
+    elif pd.api.types.is_datetime64_any_dtype(values):
+        values = values.astype("datetime64[ns]") if values.dt.tz is None else values.dt.tz_convert("UTC").dt.tz_localize(None)
+    return pd.util.hash_array(values.to_numpy())
+
+
+class HyperLogLog:
+    """Distinct value counter in a fixed 4 KB; two counters merge by taking register maxima."""
+
+    def __init__(self, registers=None):
+        self.registers = np.zeros(HLL_REGISTERS, dtype=np.uint8) if registers is None else registers
+
+    def add_hashes(self, hashes):
+        if not len(hashes):
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        index = (hashes >> np.uint64(HLL_VALUE_BITS)).astype(np.intp)
+        rest = hashes & np.uint64((1 << HLL_VALUE_BITS) - 1)
+        #rank is the position of the first set bit in the remaining bits, read off the float exponent
+        _, exponent = np.frexp(rest.astype(np.float64))
+        np.maximum.at(self.registers, index, (HLL_VALUE_BITS + 1 - exponent).astype(np.uint8))
+
+    def merge(self, other) -> "HyperLogLog":
+        return HyperLogLog(np.maximum(self.registers, other.registers))
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+        estimate = alpha * HLL_REGISTERS ** 2 / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * HLL_REGISTERS and zeros:
+            estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / zeros) #linear counting is exact-ish for small counts
+        return int(round(estimate))
+
+    def to_json(self) -> str:
+        return base64.b64encode(self.registers.tobytes()).decode("ascii")
+
+    @classmethod
+    def from_json(cls, data) -> "HyperLogLog":
+        return cls(np.frombuffer(base64.b64decode(data), dtype=np.uint8).copy())
+
+
+class ColumnSketch:
+    """Mergeable statistics of one column: value and null counts, mean and sum of squared deviations
+    (numbers), min and max (numbers and dates) and a HyperLogLog of its values."""
+
+    def __init__(self, kind="other", count=0, nulls=0, mean=None, m2=None, minimum=None, maximum=None, distinct=None):
+        self.kind = kind #"integer", "number", "date" or "other"
+        self.count = count
+        self.nulls = nulls
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+        self.distinct = distinct or HyperLogLog()
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> "ColumnSketch":
+        values = series.dropna()
+        sketch = cls(count=len(values), nulls=len(series) - len(values))
+        sketch.distinct.add_hashes(value_hashes(series))
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            sketch.kind = "integer" if pd.api.types.is_integer_dtype(values) else "number"
+            if len(values):
+                numbers = values.astype("float64")
+                sketch.mean = float(numbers.mean())
+                sketch.m2 = float(((numbers - sketch.mean) ** 2).sum())
+                sketch.minimum, sketch.maximum = sketch.number(values.min()), sketch.number(values.max())
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            sketch.kind = "date"
+            if len(values):
+                sketch.minimum, sketch.maximum = values.min().isoformat(), values.max().isoformat()
+        return sketch
+
+    def number(self, value):
+        return int(value) if self.kind == "integer" else float(value)
+
+    def merge(self, other) -> "ColumnSketch":
+        #the sketch of this column's values followed by other's
+        kind = self.kind if self.kind == other.kind else ("number" if {self.kind, other.kind} <= {"integer", "number"} else "other")
+        merged = ColumnSketch(kind, self.count + other.count, self.nulls + other.nulls, distinct=self.distinct.merge(other.distinct))
+        if kind == "other":
+            return merged
+        present = [sketch for sketch in (self, other) if sketch.count]
+        if kind != "date" and present:
+            #Chan et al.'s pairwise update, stable where summing squares would cancel
+            merged.mean, merged.m2, count = present[0].mean, present[0].m2, present[0].count
+            for sketch in present[1:]:
+                delta = sketch.mean - merged.mean
+                total = count + sketch.count
+                merged.mean += delta * sketch.count / total
+                merged.m2 += sketch.m2 + delta * delta * count * sketch.count / total
+                count = total
+        bounds = [(sketch.minimum, sketch.maximum) for sketch in present]
+        if bounds:
+            #dates are ISO strings of one format, so they order like the timestamps
+            merged.minimum = min(bound[0] for bound in bounds)
+            merged.maximum = max(bound[1] for bound in bounds)
+            if kind != "date":
+                merged.minimum, merged.maximum = merged.number(merged.minimum), merged.number(merged.maximum)
+        return merged
+
+    def std(self):
+        #sample standard deviation, as pandas and LIDA report it
+        if self.m2 is None or self.count < 2:
+            return None
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def stats(self) -> dict:
+        stats = {"count": self.count, "nulls": self.nulls, "distinct": self.distinct.count()}
+        if self.kind != "other":
+            stats.update({"min": self.minimum, "max": self.maximum})
+        if self.kind in ("integer", "number"):
+            stats.update({"mean": self.mean, "std": self.std()})
+        return stats
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "count": self.count, "nulls": self.nulls, "mean": self.mean, "m2": self.m2,
+                "min": self.minimum, "max": self.maximum, "hll": self.distinct.to_json()}
+
+    @classmethod
+    def from_dict(cls, data) -> "ColumnSketch":
+        return cls(data["kind"], data["count"], data["nulls"], data["mean"], data["m2"], data["min"], data["max"],
+                   HyperLogLog.from_json(data["hll"]))
+
+
+class DatasetSketch:
+    """Column sketches of a whole dataset version. An append merges in the sketch of the new rows and a
+    column replacement swaps in sketches of the new columns, so neither rescans the rows already stored."""
+
+    def __init__(self, rows=0, columns=None):
+        self.rows = rows
+        self.columns = columns or {} #str(column) -> ColumnSketch, in column order
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "DatasetSketch":
+        return cls(len(df), {str(column): ColumnSketch.from_series(df.iloc[:, position]) for position, column in enumerate(df.columns)})
+
+    def append(self, other) -> "DatasetSketch":
+        columns = {}
+        for name in self.columns.keys() | other.columns.keys():
+            if name in self.columns and name in other.columns:
+                columns[name] = self.columns[name].merge(other.columns[name])
+            else:
+                columns[name] = self.columns.get(name) or other.columns[name]
+        order = list(self.columns) + [name for name in other.columns if name not in self.columns]
+        return DatasetSketch(self.rows + other.rows, {name: columns[name] for name in order})
+
+    def replace(self, other) -> "DatasetSketch":
+        #other covers every row of the replaced (or added) columns
+        return DatasetSketch(self.rows, {**self.columns, **other.columns})
+
+    def stats(self) -> dict:
+        return {"rows": self.rows, "columns": {name: sketch.stats() for name, sketch in self.columns.items()}}
+
+    def to_dict(self) -> dict:
+        return {"rows": self.rows, "columns": [[name, sketch.to_dict()] for name, sketch in self.columns.items()]}
+
+    @classmethod
+    def from_dict(cls, data) -> "DatasetSketch":
+        return cls(data["rows"], {name: ColumnSketch.from_dict(sketch) for name, sketch in data["columns"]})
@@ -0,0 +1,129 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# --- Speculative Execution Configuration ---
+#"on" runs the LIDA and PandasAI branches side by side for visual or ambiguous prompts, "off" keeps them sequential
+SPECULATIVE_MODE = os.getenv("SPECULATIVE_MODE", "off")
+#how long a finished fallback waits for the preferred branch before it wins
+PREFERRED_GRACE_SECONDS = float(os.getenv("SPECULATIVE_GRACE_SECONDS", "2.0"))
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculative")
+
+
+class CombinedEvent:
+    """Behaves like a threading.Event that also reads as set once any wrapped event is set."""
+
+    def __init__(self, *events):
+        self._events = [event for event in events if event is not None]
+        self._own = threading.Event()
+
+    def set(self):
+        self._own.set()
+
+    def is_set(self):
+        return self._own.is_set() or any(event.is_set() for event in self._events)
+
+
+class SpeculationStats:
+    """Counts which branch won speculative races and how much latency they saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.races = 0
+        self.wins = {}
+        self.latency_saved_ms = 0.0
+
+    def record(self, winner, latency_saved_ms):
+        with self._lock:
+            self.races += 1
+            self.wins[winner] = self.wins.get(winner, 0) + 1
+            self.latency_saved_ms += latency_saved_ms
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "mode": SPECULATIVE_MODE,
+                "races": self.races,
+                "wins": dict(self.wins),
+                "latency_saved_ms_total": round(self.latency_saved_ms, 1),
+            }
+
+
+speculation_stats = SpeculationStats()
+
+
+def is_acceptable(result) -> bool:
+    #a branch result counts if it produced a payload that isn't an error
+    return bool(result) and result.get("response_type") != "error"
+
+
+def race(preferred, fallback, grace_seconds=PREFERRED_GRACE_SECONDS, cancel_event=None):
+    """Runs two (name, fn) branches at once and returns (result, info).
+
+    Each fn is called with cancel_event=... and returns a response payload (or None on failure).
+    The preferred branch wins if it produces an acceptable result first, or within grace_seconds
+    of the fallback finishing; the branch that loses is signalled to stop and its result ignored.
+    """
+    start = time.perf_counter()
+    durations = {}
+    branch_events = {name: CombinedEvent(cancel_event) for name, _ in (preferred, fallback)}
+
+    def timed(name, fn):
+        def run():
+            try:
+                return fn(cancel_event=branch_events[name])
+            finally:
+                durations[name] = time.perf_counter() - start
+        return run
+
+    preferred_name, fallback_name = preferred[0], fallback[0]
+    #each branch runs in a copy of the caller's context, so per-request tracing follows it into the pool thread
+    preferred_future = _executor.submit(contextvars.copy_context().run, timed(*preferred))
+    fallback_future = _executor.submit(contextvars.copy_context().run, timed(*fallback))
+
+    def acceptable_result(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Speculative branch failed: {e}")
+            return None
+        return result if is_acceptable(result) else None
+
+    done, _ = wait([preferred_future, fallback_future], return_when=FIRST_COMPLETED)
+    winner, result = None, None
+    if preferred_future in done:
+        result = acceptable_result(preferred_future)
+        winner = preferred_name if result is not None else None
+    else:
+        fallback_result = acceptable_result(fallback_future)
+        #give the preferred branch a short grace window, or all the time it needs if the fallback failed
+        timeout = grace_seconds if fallback_result is not None else None
+        done, _ = wait([preferred_future], timeout=timeout)
+        if preferred_future in done:
+            result = acceptable_result(preferred_future)
+            winner = preferred_name if result is not None else None
+        if winner is None and fallback_result is not None:
+            winner, result = fallback_name, fallback_result
+
+    if winner is None:
+        #preferred branch failed, the fallback's answer (even an error) is final
+        winner, result = fallback_name, fallback_future.result()
+
+    loser = fallback_name if winner == preferred_name else preferred_name
+    branch_events[loser].set()
+
+    #sequentially the fallback only starts after the preferred branch has finished or failed
+    elapsed = time.perf_counter() - start
+    if winner == preferred_name:
+        sequential = durations.get(preferred_name, elapsed)
+    else:
+        sequential = durations.get(preferred_name, elapsed) + durations.get(fallback_name, elapsed)
+    latency_saved_ms = max(0.0, sequential - elapsed) * 1000
+
+    speculation_stats.record(winner, latency_saved_ms)
+    print(f"Speculative race won by {winner}, saved {latency_saved_ms:.0f} ms")
+    return result, {"winner": winner, "latency_saved_ms": round(latency_saved_ms, 1)}
@@ -0,0 +1,113 @@
+import base64
+import io
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- Wire Formats ---
+#binary dataset payloads travel as the 'data' part of a multipart request
+ARROW_STREAM_MIME = "application/vnd.apache.arrow.stream"
+PARQUET_MIME = "application/vnd.apache.parquet"
+JSON_MIME = "application/json"
+
+SUPPORTED_FORMATS = {
+    "arrow": ARROW_STREAM_MIME,
+    "parquet": PARQUET_MIME,
+    "json": JSON_MIME,
+}
+SUPPORTED_COMPRESSION = (None, "lz4", "zstd")
+
+
+class UnsupportedFormatError(ValueError):
+    """Raised when a dataset payload arrives in a format the backend can't decode."""
+
+
+def encode_dataframe(df: pd.DataFrame, fmt="arrow", compression=None) -> bytes:
+    """Serializes a DataFrame for transfer. Arrow IPC and Parquet keep dtypes, JSON is the fallback."""
+    if compression not in SUPPORTED_COMPRESSION:
+        raise ValueError(f"Unsupported compression: {compression}")
+
+    if fmt == "arrow":
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = io.BytesIO()
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+    if fmt == "parquet":
+        sink = io.BytesIO()
+        df.to_parquet(sink, index=False, compression=compression)
+        return sink.getvalue()
+    if fmt == "json":
+        return df.to_json(orient='records').encode("utf-8")
+    raise UnsupportedFormatError(f"Unsupported wire format: {fmt}")
+
+
+def decode_dataframe(data: bytes, mimetype: str) -> pd.DataFrame:
+    """Rebuilds a DataFrame from a payload produced by encode_dataframe."""
+    if mimetype == ARROW_STREAM_MIME:
+        #compressed IPC buffers are detected and decompressed by the reader
+        with pa.ipc.open_stream(io.BytesIO(data)) as reader:
+            return reader.read_all().to_pandas()
+    if mimetype == PARQUET_MIME:
+        return pq.read_table(io.BytesIO(data)).to_pandas()
+    if mimetype == JSON_MIME:
+        return pd.read_json(io.StringIO(data.decode("utf-8")), orient='records')
+    raise UnsupportedFormatError(f"Unsupported dataset content type: {mimetype}")
+
+
+# --- Figure Encoding ---
+#"string" embeds the figure JSON as a string inside the response (the original format),
+#"object" embeds the figure itself so it isn't escaped and parsed twice
+PLOT_FORMATS = ("string", "object")
+
+#plotly.js never reads these keys as typed arrays
+TYPED_ARRAY_SKIPPED_KEYS = {"geojson", "layer", "layers", "range"}
+MIN_TYPED_ARRAY_LENGTH = 8 #shorter lists are smaller as plain JSON
+#integer lists are packed into the smallest of these that holds them, plotly.js has no 64-bit integers
+TYPED_ARRAY_INTEGER_DTYPES = {"int8": "i1", "int16": "i2", "int32": "i4"}
+
+
+def to_typed_array(values):
+    #returns the plotly.js typed array spec ({"dtype", "bdata"}) for a list of plain numbers, or None
+    if len(values) < MIN_TYPED_ARRAY_LENGTH or not all(type(value) in (int, float) for value in values):
+        return None #bools, None and strings keep the list form
+    array = np.asarray(values)
+    if array.dtype.kind == "f":
+        return {"dtype": "f8", "bdata": base64.b64encode(array.astype("<f8")).decode("ascii")}
+    if array.dtype.kind != "i":
+        return None
+    low, high = array.min(), array.max()
+    for dtype, code in TYPED_ARRAY_INTEGER_DTYPES.items():
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return {"dtype": code, "bdata": base64.b64encode(array.astype(f"<{code}")).decode("ascii")}
+    return None
+
+
+def pack_typed_arrays(obj):
+    """Replaces numeric lists in a plotly JSON structure with base64 typed arrays, in place."""
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key in TYPED_ARRAY_SKIPPED_KEYS:
+                continue
+            if isinstance(value, (list, tuple)):
+                spec = to_typed_array(value)
+                if spec is not None:
+                    obj[key] = spec
+                    continue
+            pack_typed_arrays(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            pack_typed_arrays(value)
+
+
+def encode_figure(fig: go.Figure) -> str:
+    """Serializes a figure with every numeric trace array as a typed array, not just the numpy-backed ones."""
+    fig_dict = fig.to_plotly_json() #numpy arrays are already typed arrays here, lists from generated code aren't
+    pack_typed_arrays(fig_dict["data"])
+    return pio.to_json(fig_dict, validate=False)
@@ -0,0 +1,105 @@
+"""Compares /api/query plot payload encodings on figures built from the bundled CSVs.
+
+"string" is the original format: the figure JSON (numbers as decimal text unless plotly
+already packed a numpy array) embedded as an escaped string. "object" embeds the figure
+itself with every numeric trace array as a base64 typed array. Each is measured raw and
+with the gzip/zstd response compression, decoding the way the Streamlit frontend does.
+Figures are reduced first, as the backend does before sending them.
+
+    python benchmarks/bench_plot_payload.py [--repeat 5]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import pyarrow as pa
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from compression import ENCODERS  # noqa: E402
+from figure_reduce import reduce_figure  # noqa: E402
+from wire import encode_figure  # noqa: E402
+
+
+def housing_figures():
+    df = pd.read_csv(os.path.join(ROOT, "data", "housing_data.csv"))
+    return "housing_data.csv", {
+        #generated code often passes plain lists, which plotly serializes as decimal text
+        "scatter (lists)": go.Figure(go.Scatter(x=df["Area Population"].tolist(), y=df["Price"].tolist(), mode="markers")),
+        "scatter (px)": px.scatter(df, x="Area Population", y="Price"),
+        "histogram (px)": px.histogram(df, x="Price"),
+        #a column that doesn't parse as numbers leaves no finite point to keep, doubled to go over the scatter budget
+        "scatter (no finite)": go.Figure(go.Scatter(x=pd.to_numeric(pd.concat([df["Address"]] * 2), errors="coerce"),
+                                                    y=pd.concat([df["Price"]] * 2), mode="markers")),
+    }
+
+
+def vending_figures():
+    df = pd.read_csv(os.path.join(ROOT, "data", "Vending_Machine_Sales_Data_Singapore.csv"))
+    daily = df.groupby("Date", as_index=False)["Units_Sold"].sum()
+    return "Vending_Machine_Sales_Data_Singapore.csv", {
+        "bar (lists)": go.Figure(go.Bar(x=df["Product_Name"].tolist(), y=df["Units_Sold"].tolist())),
+        "line (px)": px.line(daily, x="Date", y="Units_Sold"),
+        "scatter (lists)": go.Figure(go.Scatter(x=df["Current_Stock_Level"].tolist(), y=df["Units_Sold"].tolist(), mode="markers")),
+    }
+
+
+def response_body(fig, plot_format):
+    #the /api/query body the backend sends for each plot format
+    if plot_format == "string":
+        content = pio.to_json(fig)
+    else:
+        content = json.loads(encode_figure(fig))
+    return json.dumps({"response": {"response_type": "plot", "content": content}}).encode("utf-8")
+
+
+def decode_body(body, encoding, size):
+    #what the frontend does: undo the content coding, parse the body, build the figure
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "zstd":
+        body = pa.decompress(body, decompressed_size=size, codec="zstd", asbytes=True)
+    content = json.loads(body)["response"]["content"]
+    return go.Figure(content if isinstance(content, dict) else json.loads(content))
+
+
+def best_of(repeat, fn):
+    #returns (fastest seconds, last result)
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(repeat):
+    go.Figure(go.Scatter(x=[0])) #load plotly's validators outside the timings
+    header = f"{'dataset':<42} {'figure':<19} {'format':<7} {'encoding':<9} {'bytes':>11} {'decode ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, figures in (housing_figures(), vending_figures()):
+        for label, fig in figures.items():
+            reduce_figure(fig)
+            for plot_format in ("string", "object"):
+                body = response_body(fig, plot_format)
+                for encoding in ("identity", *ENCODERS):
+                    sent = body if encoding == "identity" else ENCODERS[encoding](body)
+                    decode_s, _ = best_of(repeat, lambda: decode_body(sent, encoding, len(body)))
+                    print(f"{name:<42} {label:<19} {plot_format:<7} {encoding:<9} {len(sent):>11,} {decode_s * 1000:>10.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the fastest is reported")
+    args = parser.parse_args()
+    run(args.repeat)
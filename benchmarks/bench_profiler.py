@@ -0,0 +1,80 @@
+"""Compares the local dataset profiler with LIDA's summarizer on the bundled CSVs.
+
+For each CSV at every --scale (rows repeated N times) this times:
+
+    lida-llm    LIDA's summarize(summary_method="llm"): column properties plus one LLM call
+    local       profiler.profile_dataframe, no LLM call
+    hybrid      the profiler plus one LLM call for the columns it couldn't classify, if any
+
+LLM calls go to the offline fake from fake_llm.py with no delay, so the times are compute
+only; "est. total" adds --latency seconds per LLM call. Also reported: how many column dtypes
+agree with LIDA's and the summary's size as it is pasted into visualize prompts; for lida-llm that
+is LIDA's summary before enrichment, a lower bound, since the fake LLM's enrichment is not realistic.
+
+    python benchmarks/bench_profiler.py [--scale 1 10 100] [--repeat 3] [--latency 2.0]
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lida import Manager  # noqa: E402
+from lida.components.summarizer import Summarizer  # noqa: E402
+
+from fake_llm import FakeTextGenerator, Latency  # noqa: E402
+from profiler import summarize_dataset  # noqa: E402
+
+DATASETS = [
+    os.path.join(ROOT, "data", "housing_data.csv"),
+    os.path.join(ROOT, "data", "Vending_Machine_Sales_Data_Singapore.csv"),
+]
+MODES = ["llm", "local", "hybrid"]
+LABELS = {"llm": "lida-llm", "local": "local", "hybrid": "hybrid"}
+
+
+def measure(df, mode, repeat):
+    #returns (fastest seconds, LLM calls per run, summary)
+    best, calls, summary = float("inf"), 0, None
+    for _ in range(repeat):
+        latency = Latency(latency=0, jitter=0)
+        lida = Manager(text_gen=FakeTextGenerator(latency))
+        start = time.perf_counter()
+        summary = summarize_dataset(lida, df, mode)
+        best = min(best, time.perf_counter() - start)
+        calls = latency.calls
+    return best, calls, summary
+
+
+def dtypes(summary):
+    return {field["column"]: field["properties"]["dtype"] for field in summary["fields"]}
+
+
+def run(args):
+    print(f"{'dataset':<46} {'rows':>10} {'mode':<9} {'seconds':>8} {'llm calls':>10} {'est. total':>11} {'dtypes as lida':>15} {'summary chars':>14}")
+    for path in DATASETS:
+        base_df = pd.read_csv(path)
+        for scale in args.scale:
+            df = pd.concat([base_df] * scale, ignore_index=True) if scale > 1 else base_df
+            results = {mode: measure(df, mode, args.repeat) for mode in MODES}
+            reference = dtypes(results["llm"][2])
+            for mode in MODES:
+                seconds, calls, summary = results[mode]
+                size = len(str(Summarizer().summarize(df, text_gen=None, summary_method="default"))) if mode == "llm" else len(str(summary))
+                agree = sum(reference.get(column) == dtype for column, dtype in dtypes(summary).items())
+                label = f"{os.path.basename(path)} x{scale}"
+                print(f"{label:<46} {len(df):>10,} {LABELS[mode]:<9} {seconds:>8.3f} {calls:>10} {seconds + calls * args.latency:>11.2f} "
+                      f"{f'{agree}/{len(reference)}':>15} {size:>14,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100], help="row multipliers for each bundled CSV")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the fastest is reported")
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds per LLM call assumed for the estimated total")
+    run(parser.parse_args())
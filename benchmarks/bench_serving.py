@@ -0,0 +1,214 @@
+"""Compares the development server with the production entry point (backend/serve.py).
+
+Each server mode runs as a separate process with the fake LLMs from fake_llm.py installed:
+
+    dev         app.py's threaded werkzeug server, one process
+    preload     serve.py: gunicorn gthread workers forked from a master that imported and warmed the backend
+    no-preload  the same without preload_app, every worker imports the backend itself
+
+Reported per mode:
+
+    first ready   seconds from process start until /api/ready first answers 200
+    all ready     seconds until every worker has answered /api/ready (distinct pids)
+    respawn       seconds from SIGKILLing one worker until its replacement answers /api/ready
+    pss           proportional set size of the server's processes after the load, shared pages counted once
+
+followed by load_test.py's request mix against a registered bundled CSV: one unreported warm-up pass,
+then one reported pass at each --concurrency level.
+Databases, datasets and spool files go to a fresh temporary directory per mode.
+
+    python benchmarks/bench_serving.py [--modes dev preload no-preload] [--workers 2] [--concurrency 1 4 16]
+                                       [--requests 200] [--latency 0.5] [--jitter 0.2]
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import WORKLOADS, LoadRun, plan_requests, print_level, register_dataset, summarize  # noqa: E402
+
+MODES = ["dev", "preload", "no-preload"]
+DATASET = "housing_data.csv"
+READY_POLL_SECONDS = 0.05
+READY_TIMEOUT_SECONDS = 120
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# --- Server Process ---
+def run_child(args):
+    #the server side of one mode, started by the parent with its scratch environment
+    import fake_llm
+
+    def load():
+        import app as backend
+        fake_llm.install(backend, latency=args.latency, jitter=args.jitter, seed=args.seed)
+        if args.child != "dev": #as serve.load_backend does, app.py's server doesn't warm up
+            backend.warm_up()
+        return backend
+
+    if args.child == "dev":
+        from werkzeug.serving import make_server
+        from load_test import QuietRequestHandler
+
+        backend = load()
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0)) #exit cleanly, stopping the chart executor
+        make_server("127.0.0.1", args.port, backend.app, threaded=True, request_handler=QuietRequestHandler).serve_forever()
+        return
+
+    from serve import BackendServer
+    #workers and bind come from the environment, as serve.py reads them
+    BackendServer(load=load, options={"preload_app": args.child == "preload", "loglevel": "warning"}).run()
+
+
+# --- Measurements ---
+def ready_pid(base_url):
+    #pid of the worker that answered, or None if it isn't ready. a new connection each time, so the
+    #request can reach any worker
+    try:
+        response = requests.get(f"{base_url}/api/ready", headers={"Connection": "close"}, timeout=5)
+    except requests.RequestException:
+        return None
+    return response.json()["pid"] if response.status_code == 200 else None
+
+
+def wait_for_workers(base_url, count, exclude=(), timeout=READY_TIMEOUT_SECONDS):
+    #returns (seconds to the first ready answer, seconds until count distinct pids not in exclude answered, pids)
+    start = time.perf_counter()
+    first, pids = None, set()
+    while len(pids) < count:
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError(f"Only {len(pids)} of {count} workers became ready within {timeout}s")
+        pid = ready_pid(base_url)
+        if pid is None or pid in exclude:
+            time.sleep(READY_POLL_SECONDS)
+            continue
+        if first is None:
+            first = time.perf_counter() - start
+        pids.add(pid)
+    return first, time.perf_counter() - start, pids
+
+
+def process_tree(pid):
+    #pid and all its descendants, from /proc. children are listed per thread that started them
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            threads = os.listdir(f"/proc/{current}/task")
+        except OSError:
+            continue
+        for thread in threads:
+            try:
+                with open(f"/proc/{current}/task/{thread}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+    return pids
+
+
+def pss_bytes(pids):
+    #proportional set size: pages shared by n processes count 1/n towards each, so the sum is the real footprint
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+    return total
+
+
+def run_mode(mode, args):
+    scratch = tempfile.mkdtemp(prefix=f"dataquery-serve-{mode}-")
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    workers = 1 if mode == "dev" else args.workers
+    env = dict(os.environ, OPENAI_API_KEY="sk-offline", HISTORY_DATABASE=os.path.join(scratch, "history.db"),
+               CACHE_DATABASE=os.path.join(scratch, "cache.db"), DATASET_DIR=os.path.join(scratch, "datasets"),
+               EXECUTOR_SPOOL_DIR=os.path.join(scratch, "spool"), BIND=f"127.0.0.1:{port}", WEB_WORKERS=str(workers))
+    log_path = os.path.join(scratch, "server.log")
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--port", str(port),
+               "--latency", str(args.latency), "--jitter", str(args.jitter), "--seed", str(args.seed)]
+    with open(log_path, "w") as log:
+        server = subprocess.Popen(command, cwd=BACKEND, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        try:
+            first_ready, all_ready, pids = wait_for_workers(base_url, workers)
+        except RuntimeError:
+            print(f"{mode}: server didn't start, see {log_path}")
+            raise
+        respawn = None
+        if mode != "dev":
+            victim = sorted(pids)[0]
+            start = time.perf_counter()
+            os.kill(victim, signal.SIGKILL)
+            wait_for_workers(base_url, 1, exclude=pids)
+            respawn = time.perf_counter() - start
+
+        print(f"{mode}: {workers} worker(s), first ready {first_ready:.2f}s, all ready {all_ready:.2f}s"
+              + (f", respawn {respawn:.2f}s" if respawn is not None else ""))
+        df = pd.read_csv(os.path.join(ROOT, "data", DATASET))
+        dataset_id = register_dataset(base_url, df, DATASET)
+        plan = plan_requests(WORKLOADS[DATASET], args.requests, args.seed)
+        #one unreported pass, so every worker has its pooled instances, chart executor and cached code
+        start = time.perf_counter()
+        LoadRun(base_url, dataset_id, DATASET).run(plan, max(args.concurrency))
+        print(f"  warm-up pass: {time.perf_counter() - start:.2f}s")
+        for concurrency in args.concurrency:
+            load = LoadRun(base_url, dataset_id, DATASET)
+            wall_seconds = load.run(plan, concurrency)
+            #llm calls happen in the server processes, so they aren't counted here
+            print_level(f"  {mode}, concurrency {concurrency}:", summarize(load.results, wall_seconds), "n/a",
+                        pss_bytes(process_tree(server.pid)))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=90)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def run(args):
+    print(f"CPUs: {os.cpu_count()}, fake LLM latency: {args.latency}s, {args.requests} requests per level (rss column is PSS)\n")
+    for mode in args.modes:
+        run_mode(mode, args)
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="server modes to compare")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="concurrent clients per run")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds each fake LLM call takes")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency varies by up to this fraction either way")
+    parser.add_argument("--seed", type=int, default=0, help="seeds the request mix and the fake LLM latencies")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+    else:
+        run(args)
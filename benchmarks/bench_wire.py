@@ -0,0 +1,99 @@
+"""Compares dataset wire formats between the Streamlit frontend and the Flask backend.
+
+For each bundled CSV this measures encode time, payload size, loopback HTTP transfer time
+and decode time for the JSON records path and the Arrow IPC / Parquet binary modes.
+
+    python benchmarks/bench_wire.py [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from wire import encode_dataframe, decode_dataframe, SUPPORTED_FORMATS  # noqa: E402
+
+DATASETS = [
+    os.path.join(ROOT, "data", "housing_data.csv"),
+    os.path.join(ROOT, "data", "Vending_Machine_Sales_Data_Singapore.csv"),
+]
+
+#(label, format, compression)
+MODES = [
+    ("json", "json", None),
+    ("arrow", "arrow", None),
+    ("arrow+lz4", "arrow", "lz4"),
+    ("arrow+zstd", "arrow", "zstd"),
+    ("parquet", "parquet", None),
+    ("parquet+zstd", "parquet", "zstd"),
+]
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    #reads and discards the request body so only transfer cost is measured
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_sink_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def best_of(repeat, fn):
+    #returns (fastest seconds, last result)
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def transfer(session, url, fmt, body):
+    #sends the payload the same way the frontend does
+    if fmt == "json":
+        return session.post(url, json={"data_json": body.decode("utf-8")})
+    files = {"data": ("data", body, SUPPORTED_FORMATS[fmt])}
+    return session.post(url, files=files, data={"dataset_name": "bench"})
+
+
+def run(repeat):
+    server, url = start_sink_server()
+    session = requests.Session()
+    header = f"{'dataset':<42} {'mode':<13} {'bytes':>11} {'encode ms':>10} {'transfer ms':>12} {'decode ms':>10} {'total ms':>9}"
+    print(header)
+    print("-" * len(header))
+    try:
+        for path in DATASETS:
+            df = pd.read_csv(path)
+            name = os.path.basename(path)
+            for label, fmt, compression in MODES:
+                encode_s, body = best_of(repeat, lambda: encode_dataframe(df, fmt, compression))
+                transfer_s, _ = best_of(repeat, lambda: transfer(session, url, fmt, body))
+                decode_s, _ = best_of(repeat, lambda: decode_dataframe(body, SUPPORTED_FORMATS[fmt]))
+                total_ms = (encode_s + transfer_s + decode_s) * 1000
+                print(f"{name:<42} {label:<13} {len(body):>11,} {encode_s * 1000:>10.1f} {transfer_s * 1000:>12.1f} {decode_s * 1000:>10.1f} {total_ms:>9.1f}")
+            print()
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the fastest is reported")
+    args = parser.parse_args()
+    run(args.repeat)
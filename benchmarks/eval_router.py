@@ -0,0 +1,193 @@
+"""Offline evaluation of the intent router against the keyword matching it replaced.
+
+Compares three ways of choosing between LIDA (charts) and PandasAI (text):
+
+    legacy    substring scan over the keyword lists ("bar" matches "barrier")
+    rules     the router's word-boundary keyword rules alone
+    learned   rules blended with the classifier trained on past outcomes
+
+Labelled prompts come from a history database (--history, labels from response_type and
+feedback, split chronologically into train and test) or, by default, from the built-in set
+below with k-fold cross-validation. Besides accuracy, each policy is costed in LLM calls,
+assuming the LIDA summary is already cached: a LIDA attempt costs one call, PandasAI one, a
+LIDA attempt on a text question two (the wasted chart plus the fallback), and a speculative
+race two.
+
+    python benchmarks/eval_router.py [--history backend/history.db] [--speculative] [--folds 5]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from router import IntentRouter, VISUALIZATION_KEYWORDS, AMBIGUOUS_KEYWORDS, outcome_label  # noqa: E402
+
+#(prompt, wants a chart), written against the bundled CSVs, including words that only contain a keyword
+LABELLED_PROMPTS = [
+    ("plot the price distribution as a histogram", True),
+    ("show me a bar chart of units sold by product", True),
+    ("scatter plot of area income against price", True),
+    ("draw a line chart of daily sales", True),
+    ("visualize stock levels per location", True),
+    ("pie chart of categories", True),
+    ("graph the number of rooms vs price", True),
+    ("create a chart comparing locations by units sold", True),
+    ("histogram of house age", True),
+    ("bar graph of stockouts per machine", True),
+    ("plot units sold over time", True),
+    ("show the trend of sales over time", True),
+    ("show the distribution of area population", True),
+    ("compare average price across bedroom counts in a chart", True),
+    ("plots of income and price", True),
+    ("visualise the relationship between income and price", True),
+    ("draw the correlation between rooms and price", True),
+    ("give me a boxplot of prices", True),
+    ("heatmap of units sold by day of week and location", True),
+    ("line graph of stock level by date", True),
+    #chart words written as one word
+    ("scatterplot of area income against price", True),
+    ("barplot of units sold per product", True),
+    ("piechart of product categories", True),
+    ("linechart of units sold by date", True),
+    ("subplots of price and house age", True),
+    ("what is the average price", False),
+    ("how many machines are there", False),
+    ("what is the baseline stock level for each machine", False),
+    ("which product has the barrier of lowest sales", False),
+    ("list the top 5 addresses by price", False),
+    ("what is the median house age", False),
+    ("how many rows have a stockout", False),
+    ("which location sold the most units", False),
+    ("what is the deadline lead time on average", False),
+    ("count products sold online", False),
+    ("what percentage of rows are weekend sales", False),
+    ("give me the total units sold", False),
+    ("which products are barely selling", False),
+    ("summarize the timeline of stockouts in words", False),
+    ("what is the correlation between income and price", False),
+    ("compare the mean price of 3 and 4 bedroom houses", False),
+    ("show the first ten rows", False),
+    ("what is the breakdown of units sold by category as a table", False),
+    ("is there a relationship between rooms and price, answer yes or no", False),
+    ("which machine has the highest stockout rate", False),
+    ("what is the mapping of product ids to names", False),
+    ("find the pipeline of products with low stock", False),
+    ("what is the maximum price", False),
+    ("how many unique locations are there", False),
+]
+
+
+def legacy_is_visual(prompt):
+    prompt_lower = prompt.lower()
+    return any(keyword in prompt_lower for keyword in VISUALIZATION_KEYWORDS)
+
+
+def legacy_is_ambiguous(prompt):
+    prompt_lower = prompt.lower()
+    return any(keyword in prompt_lower for keyword in AMBIGUOUS_KEYWORDS)
+
+
+def legacy_route(prompt, speculative):
+    #what run_query_pipeline did before the router
+    visual = legacy_is_visual(prompt)
+    if speculative and (visual or legacy_is_ambiguous(prompt)):
+        return "speculative", visual
+    return ("lida" if visual else "pandasai"), visual
+
+
+def llm_calls(route, wants_chart):
+    if route == "speculative":
+        return 2
+    if route == "lida":
+        return 1 if wants_chart else 2 #a text question costs the failed chart and the PandasAI fallback
+    return 1
+
+
+class Tally:
+    """Accuracy, routes and LLM calls for one policy."""
+
+    def __init__(self):
+        self.total = self.correct = self.calls = self.wasted_lida = self.missed_charts = 0
+        self.routes = {"lida": 0, "pandasai": 0, "speculative": 0}
+
+    def add(self, route, predicted_visual, wants_chart):
+        self.total += 1
+        self.correct += predicted_visual == wants_chart
+        self.routes[route] += 1
+        self.calls += llm_calls(route, wants_chart)
+        self.wasted_lida += route == "lida" and not wants_chart
+        self.missed_charts += route == "pandasai" and wants_chart
+
+
+def evaluate(train, test, speculative, tallies):
+    #train/test: (prompt, response_type, feedback) rows. the learned router is fit on train only
+    rules = IntentRouter(speculative=speculative)
+    learned = IntentRouter(speculative=speculative, min_samples=1)
+    learned.train(train)
+    for prompt, response_type, feedback in test:
+        wants_chart = outcome_label(response_type, feedback)
+        if wants_chart is None:
+            continue
+        tallies["legacy"].add(*legacy_route(prompt, speculative), wants_chart)
+        for name, router in (("rules", rules), ("learned", learned)):
+            decision = router.route(prompt)
+            tallies[name].add(decision.route, decision.visual, wants_chart)
+
+
+def as_outcomes(labelled):
+    return [(prompt, "plot" if wants_chart else "text", None) for prompt, wants_chart in labelled]
+
+
+def load_history(path):
+    #oldest first, so the split trains on the past and tests on what came after
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT prompt, response_type, feedback FROM prompt_history ORDER BY timestamp, id").fetchall()
+    finally:
+        conn.close()
+
+
+def report(tallies):
+    baseline = tallies["legacy"].calls
+    header = f"{'policy':<8} {'accuracy':>9} {'lida':>6} {'pandasai':>9} {'race':>6} {'llm calls':>10} {'avoided':>8} {'wasted lida':>12} {'missed charts':>14}"
+    print(header)
+    print("-" * len(header))
+    for name, tally in tallies.items():
+        accuracy = tally.correct / tally.total if tally.total else float("nan")
+        print(f"{name:<8} {accuracy:>9.1%} {tally.routes['lida']:>6} {tally.routes['pandasai']:>9} {tally.routes['speculative']:>6} "
+              f"{tally.calls:>10} {baseline - tally.calls:>8} {tally.wasted_lida:>12} {tally.missed_charts:>14}")
+
+
+def run(args):
+    tallies = {name: Tally() for name in ("legacy", "rules", "learned")}
+    if args.history:
+        rows = load_history(args.history)
+        split = int(len(rows) * (1 - args.test_fraction))
+        train, test = rows[:split], rows[split:]
+        print(f"{args.history}: {len(train)} rows to train on, {len(test)} to test")
+        evaluate(train, test, args.speculative, tallies)
+    else:
+        rows = as_outcomes(LABELLED_PROMPTS)
+        random.Random(args.seed).shuffle(rows)
+        folds = max(2, min(args.folds, len(rows)))
+        print(f"Built-in prompts: {len(rows)}, {folds}-fold cross-validation")
+        for fold in range(folds):
+            test = rows[fold::folds]
+            train = [row for index, row in enumerate(rows) if index % folds != fold]
+            evaluate(train, test, args.speculative, tallies)
+    print(f"Speculative mode: {'on' if args.speculative else 'off'}\n")
+    report(tallies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", help="history database to evaluate on instead of the built-in prompts")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="newest share of history held out for testing")
+    parser.add_argument("--folds", type=int, default=5, help="cross-validation folds for the built-in prompts")
+    parser.add_argument("--speculative", action="store_true", help="route as with SPECULATIVE_MODE=on")
+    parser.add_argument("--seed", type=int, default=0, help="shuffles the built-in prompts before folding")
+    run(parser.parse_args())
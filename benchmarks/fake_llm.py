@@ -0,0 +1,195 @@
+"""Deterministic stand-ins for the backend's LLM clients, so it can be measured offline.
+
+FakeTextGenerator replaces text_gen_lida and FakePandasAILLM replaces llm_pandasai. Neither
+touches the network: each sleeps for a configurable latency and returns canned code picked
+from the prompt and the dataset's columns, so the rest of the pipeline (summary and code
+caches, chart execution, figure reduction, history) runs for real.
+
+    import fake_llm
+    fake_llm.install(app, latency=0.8, jitter=0.25)
+"""
+import json
+import random
+import re
+import tempfile
+import threading
+import time
+
+from llmx import TextGenerator, TextGenerationConfig, TextGenerationResponse
+from pandasai.llm.base import LLM
+
+#LIDA's plotly scaffold embeds the goal in one sentence of its instructions
+GOAL_PATTERN = re.compile(r"addresses this goal: (.*?)\. DO NOT WRITE ANY CODE", re.DOTALL)
+#column entries of the summary dicts LIDA sends, in both the enrichment and visualize prompts
+FIELD_PATTERN = re.compile(r"""['"]column['"]: ['"](.*?)['"], ['"]properties['"]: \{['"]dtype['"]: ['"](\w+)['"]""")
+
+SCATTER_WORDS = ("scatter", "against", " vs", "relationship", "correlation")
+LINE_WORDS = ("line", "over time", "trend")
+BAR_WORDS = ("bar", " by ", "per ", "each")
+COUNT_WORDS = ("how many rows", "number of rows", "count rows")
+
+
+class Latency:
+    """Seeded latency source: every call sleeps latency * (1 +/- jitter), the same sequence on every run."""
+
+    def __init__(self, latency=0.5, jitter=0.2, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def wait(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+        if delay > 0:
+            time.sleep(delay)
+
+
+def mentioned(columns, text):
+    #columns named in text, in the order they appear there
+    text = text.lower()
+    found = [(text.find(str(col).lower()), col) for col in columns if str(col).lower() in text]
+    return [col for _, col in sorted(found, key=lambda item: item[0])]
+
+
+def chart_code(question, fields):
+    """Plotly code in LIDA's template for a question, given (column, LIDA dtype) pairs."""
+    question_lower = f" {question.lower()} "
+    numeric = [col for col, dtype in fields if dtype == "number"]
+    other = [col for col, dtype in fields if dtype != "number"]
+    named = mentioned([col for col, _ in fields], question)
+    named_numeric = [col for col in named if col in numeric] + [col for col in numeric if col not in named]
+    named_other = [col for col in named if col in other] + [col for col in other if col not in named]
+
+    if any(word in question_lower for word in SCATTER_WORDS) and len(named_numeric) >= 2:
+        body = f"fig = px.scatter(data, x={named_numeric[0]!r}, y={named_numeric[1]!r})"
+    elif any(word in question_lower for word in LINE_WORDS) and named_other and named_numeric:
+        body = (f"series = data.groupby({named_other[0]!r}, as_index=False)[{named_numeric[0]!r}].sum()\n"
+                f"    fig = px.line(series, x={named_other[0]!r}, y={named_numeric[0]!r})")
+    elif any(word in question_lower for word in BAR_WORDS) and named_other and named_numeric:
+        body = (f"means = data.groupby({named_other[0]!r}, as_index=False)[{named_numeric[0]!r}].mean()\n"
+                f"    fig = px.bar(means, x={named_other[0]!r}, y={named_numeric[0]!r})")
+    elif named_numeric:
+        body = f"fig = px.histogram(data, x={named_numeric[0]!r})"
+    else:
+        body = f"fig = px.histogram(data, x={fields[0][0]!r})"
+    return (
+        "```python\n"
+        "import plotly.express as px\n"
+        "import pandas as pd\n"
+        "def plot(data: pd.DataFrame):\n"
+        f"    {body}\n"
+        "    return fig\n"
+        "chart = plot(data)\n"
+        "```"
+    )
+
+
+def pandas_code(question, df):
+    """PandasAI-style code answering a question about dfs[0] with a number, text or table."""
+    question_lower = question.lower()
+    numeric = [col for col in df.columns if df[col].dtype.kind in "iuf"]
+    named = mentioned(df.columns, question)
+    if any(word in question_lower for word in COUNT_WORDS) or not len(df.columns):
+        return "result = {'type': 'number', 'value': len(dfs[0])}"
+    named_other = [col for col in named if col not in numeric]
+    if named_other:
+        col = named_other[0]
+        return (f"counts = dfs[0][{col!r}].value_counts().head(10).reset_index()\n"
+                "result = {'type': 'dataframe', 'value': counts}")
+    col = ([col for col in named if col in numeric] or numeric or [None])[0]
+    if col is None:
+        return f"result = {{'type': 'string', 'value': 'The dataset has {len(df.columns)} columns.'}}"
+    if "max" in question_lower or "highest" in question_lower:
+        return f"result = {{'type': 'number', 'value': dfs[0][{col!r}].max()}}"
+    if "min" in question_lower or "lowest" in question_lower:
+        return f"result = {{'type': 'number', 'value': dfs[0][{col!r}].min()}}"
+    return f"result = {{'type': 'number', 'value': dfs[0][{col!r}].mean()}}"
+
+
+def sql_code(question, df, table="dataset"):
+    """pandas_code's answers as PandasAI direct_sql code, given a few rows of the table for its schema."""
+    question_lower = question.lower()
+    numeric = [col for col in df.columns if df[col].dtype.kind in "iuf"]
+    named = mentioned(df.columns, question)
+    named_other = [col for col in named if col not in numeric]
+
+    def quoted(col):
+        return '"' + str(col).replace('"', '""') + '"'
+
+    if any(word in question_lower for word in COUNT_WORDS) or not len(df.columns):
+        query, kind = f"SELECT count(*) FROM {table}", "number"
+    elif named_other:
+        col = quoted(named_other[0])
+        query, kind = f"SELECT {col}, count(*) AS count FROM {table} GROUP BY 1 ORDER BY 2 DESC LIMIT 10", "dataframe"
+    else:
+        col = ([col for col in named if col in numeric] or numeric or [None])[0]
+        if col is None:
+            return f"result = {{'type': 'string', 'value': 'The dataset has {len(df.columns)} columns.'}}"
+        aggregate = "max" if "max" in question_lower or "highest" in question_lower else \
+            "min" if "min" in question_lower or "lowest" in question_lower else "avg"
+        query, kind = f"SELECT {aggregate}({quoted(col)}) FROM {table}", "number"
+    value = "frame.iloc[0, 0]" if kind == "number" else "frame"
+    return f"frame = execute_sql_query({query!r})\nresult = {{'type': {kind!r}, 'value': {value}}}"
+
+
+class FakeTextGenerator(TextGenerator):
+    """llmx text generator answering LIDA's summary-enrichment and visualize prompts offline."""
+
+    def __init__(self, latency=None, cache_dir=None):
+        #llmx opens a disk cache in __init__, keep it out of the user's real cache directory
+        super().__init__(provider="fake", model_name="fake", cache_dir=cache_dir or tempfile.mkdtemp(prefix="fake-llmx-"))
+        self.latency = latency or Latency()
+
+    def generate(self, messages, config=TextGenerationConfig(), **kwargs):
+        self.latency.wait()
+        contents = [message["content"] for message in messages] if isinstance(messages, list) else [messages]
+        text = "\n".join(contents)
+        fields = FIELD_PATTERN.findall(text)
+        goal = GOAL_PATTERN.search(text)
+        if goal is None:
+            #summary enrichment: LIDA expects the annotated summary back as JSON
+            content = json.dumps({
+                "name": "", "file_name": "", "dataset_description": "Offline benchmark dataset",
+                "fields": [{"column": col, "properties": {"dtype": dtype, "description": ""}} for col, dtype in fields],
+            })
+        else:
+            content = chart_code(goal.group(1), fields) if fields else ""
+        return TextGenerationResponse(text=[{"role": "assistant", "content": content}] * max(1, config.n), config=config)
+
+    def count_tokens(self, text) -> int:
+        return len(str(text).split())
+
+
+class FakePandasAILLM(LLM):
+    """PandasAI LLM returning canned pandas (or direct_sql) code for the last question in the agent's memory."""
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+
+    def call(self, instruction, context=None) -> str:
+        self.last_prompt = instruction.to_string()
+        self.latency.wait()
+        question = context.memory.get_last_message() if context else self.last_prompt
+        if not context or not context.dfs:
+            return "```python\nresult = {'type': 'string', 'value': 'No data.'}\n```"
+        if context.config.direct_sql:
+            #out-of-core datasets: PandasAI only accepts code that queries through execute_sql_query
+            connector = context.dfs[0]
+            return f"```python\n{sql_code(question, connector.head(), connector.cs_table_name)}\n```"
+        return f"```python\n{pandas_code(question, context.dfs[0].pandas_df)}\n```"
+
+    @property
+    def type(self) -> str:
+        return "fake"
+
+
+def install(app_module, latency=0.5, jitter=0.2, seed=0):
+    """Swaps the backend's LLM clients for the fakes and returns their (LIDA, PandasAI) latency sources."""
+    lida_latency = Latency(latency, jitter, seed)
+    pandasai_latency = Latency(latency, jitter, seed + 1)
+    app_module.text_gen_lida = FakeTextGenerator(lida_latency)
+    app_module.llm_pandasai = FakePandasAILLM(pandasai_latency)
+    return lida_latency, pandasai_latency
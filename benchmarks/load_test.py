@@ -0,0 +1,294 @@
+"""Offline load test: drives the Flask backend with fake LLMs over loopback HTTP.
+
+The backend runs in-process on a threaded werkzeug server with text_gen_lida and llm_pandasai
+replaced by the deterministic stubs in fake_llm.py, so no API key or network access is needed.
+Each bundled CSV is registered at every --scale (rows repeated N times), then a seeded mix of
+/api/query (fast-path, chart and text prompts), /api/history and /api/feedback requests is sent
+at every --concurrency level. Reported per level: throughput, p50/p95/p99 latency per request
+kind, errors, LLM calls made, and peak RSS of this process plus the chart executor workers.
+
+Databases, the dataset store and the spool go to a temporary directory unless HISTORY_DATABASE,
+CACHE_DATABASE, DATASET_DIR or EXECUTOR_SPOOL_DIR are set.
+
+    python benchmarks/load_test.py [--scale 1 10 100] [--concurrency 1 4 16] [--requests 200]
+                                   [--latency 0.5] [--jitter 0.2] [--cold] [--json results.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+#prompts per bundled CSV: "fast" ones are answered by the local planner, "chart" ones go to LIDA
+#and "text" ones to PandasAI
+WORKLOADS = {
+    "housing_data.csv": {
+        "fast": ["average Price", "histogram of Price", "max Area Population", "number of rows"],
+        "chart": ["plot the relationship between Avg. Area Income and Price as a scatter chart",
+                  "draw a chart showing the spread of Avg. Area House Age"],
+        "text": ["which Address has the highest Price", "what is the typical Avg. Area Number of Rooms"],
+    },
+    "Vending_Machine_Sales_Data_Singapore.csv": {
+        "fast": ["total Units_Sold by Product_Name", "average Current_Stock_Level", "bar chart of Units_Sold by Category"],
+        "chart": ["plot mean Units_Sold per Location_Type as a bar chart",
+                  "create a chart of the Units_Sold trend over Date with a line"],
+        "text": ["which Location_Type shows up most often in the records", "what is the lowest Current_Stock_Level seen"],
+    },
+}
+#share of requests of each kind
+MIX = {"fast": 0.35, "chart": 0.2, "text": 0.2, "history": 0.15, "feedback": 0.1}
+WORKLOAD_KINDS = ("fast", "chart", "text") #kinds sent to /api/query
+PERCENTILES = (50, 95, 99)
+RSS_SAMPLE_SECONDS = 0.05
+
+
+def configure_environment():
+    #must run before the backend is imported, its modules read their settings at import time
+    scratch = tempfile.mkdtemp(prefix="dataquery-load-")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline")
+    os.environ.setdefault("HISTORY_DATABASE", os.path.join(scratch, "history.db"))
+    os.environ.setdefault("CACHE_DATABASE", os.path.join(scratch, "cache.db"))
+    os.environ.setdefault("DATASET_DIR", os.path.join(scratch, "datasets"))
+    os.environ.setdefault("EXECUTOR_SPOOL_DIR", os.path.join(scratch, "spool"))
+    return scratch
+
+
+def page_size():
+    return os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes(pid):
+    #current resident set size from /proc, or None where that isn't available
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * page_size()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler:
+    """Tracks the peak combined RSS of this process and its live children (the chart executor workers)."""
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        pids = [os.getpid()] + [child.pid for child in multiprocessing.active_children()]
+        sizes = [rss_bytes(pid) for pid in pids]
+        if sizes[0] is None:
+            #no /proc: fall back to this process's own high-water mark (KB on Linux)
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return sum(size for size in sizes if size)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.sample())
+
+    def __enter__(self):
+        self.peak = self.sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.sample())
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass #one access log line per request would drown the report
+
+
+def start_server(flask_app):
+    #threaded werkzeug server on an ephemeral loopback port, the same server `flask run` uses
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def register_dataset(base_url, df, dataset_name):
+    from wire import encode_dataframe, SUPPORTED_FORMATS
+    files = {"data": ("data", encode_dataframe(df, "arrow"), SUPPORTED_FORMATS["arrow"])}
+    response = requests.post(f"{base_url}/api/datasets", files=files, data={"dataset_name": dataset_name}, timeout=300)
+    response.raise_for_status()
+    return response.json()["dataset_id"]
+
+
+def plan_requests(workload, count, seed):
+    #the same request kinds and prompts in the same order for a given seed
+    rng = random.Random(seed)
+    kinds, weights = zip(*MIX.items())
+    plan = []
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        prompt = rng.choice(workload[kind]) if kind in workload else None
+        plan.append((kind, prompt))
+    return plan
+
+
+class LoadRun:
+    """Sends one planned request mix against one dataset at a fixed concurrency."""
+
+    def __init__(self, base_url, dataset_id, dataset_name, cold=False):
+        self.base_url = base_url
+        self.dataset_id = dataset_id
+        self.dataset_name = dataset_name
+        self.cold = cold
+        self.history_ids = []
+        self.results = [] #(kind, seconds, ok)
+        self._lock = threading.Lock()
+        self._sessions = threading.local()
+
+    def session(self):
+        session = getattr(self._sessions, "session", None)
+        if session is None:
+            session = self._sessions.session = requests.Session()
+        return session
+
+    def send(self, index, kind, prompt):
+        session = self.session()
+        if kind == "feedback":
+            with self._lock:
+                history_id = self.history_ids[index % len(self.history_ids)] if self.history_ids else None
+            if history_id is None:
+                kind = "history" #nothing to rate yet
+        start = time.perf_counter()
+        try:
+            if kind == "history":
+                response = session.get(f"{self.base_url}/api/history",
+                                       params={"dataset_name": self.dataset_name, "limit": 50}, timeout=300)
+            elif kind == "feedback":
+                response = session.post(f"{self.base_url}/api/feedback",
+                                        json={"history_id": history_id, "feedback": ("useful", "not_useful")[index % 2]},
+                                        timeout=300)
+            else:
+                if self.cold and kind != "fast":
+                    prompt = f"{prompt} (request {index})" #a new prompt every time, so no code cache hits
+                response = session.post(f"{self.base_url}/api/query", json={
+                    "prompt": prompt, "dataset_id": self.dataset_id, "dataset_name": self.dataset_name,
+                    "plot_format": "object",
+                }, timeout=300)
+            ok = response.ok
+            if ok and kind in WORKLOAD_KINDS:
+                history_id = response.json().get("history_id")
+                if history_id is not None:
+                    with self._lock:
+                        self.history_ids.append(history_id)
+        except requests.RequestException as e:
+            print(f"Request error ({kind}): {e}")
+            ok = False
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.results.append((kind, elapsed, ok))
+
+    def run(self, plan, concurrency):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for index, (kind, prompt) in enumerate(plan):
+                pool.submit(self.send, index, kind, prompt)
+        return time.perf_counter() - start
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(pct / 100 * len(sorted_values)))]
+
+
+def summarize(results, wall_seconds):
+    #per request kind and overall: count, errors, throughput and latency percentiles in ms
+    rows = {}
+    for kind in (*MIX, "all"):
+        latencies = sorted(seconds for k, seconds, _ in results if kind in ("all", k))
+        if not latencies:
+            continue
+        errors = sum(1 for k, _, ok in results if kind in ("all", k) and not ok)
+        row = {"count": len(latencies), "errors": errors, "rps": len(latencies) / wall_seconds}
+        row.update({f"p{pct}_ms": percentile(latencies, pct) * 1000 for pct in PERCENTILES})
+        row["max_ms"] = latencies[-1] * 1000
+        rows[kind] = row
+    return rows
+
+
+def print_level(label, summary, llm_calls, peak_rss):
+    print(f"{label}  llm calls: {llm_calls}  peak rss: {peak_rss / (1024 * 1024):.0f} MB")
+    header = f"  {'kind':<9} {'count':>6} {'errors':>6} {'req/s':>8} " + " ".join(f"{f'p{pct} ms':>9}" for pct in PERCENTILES) + f" {'max ms':>9}"
+    print(header)
+    for kind, row in summary.items():
+        print(f"  {kind:<9} {row['count']:>6} {row['errors']:>6} {row['rps']:>8.1f} "
+              + " ".join(f"{row[f'p{pct}_ms']:>9.1f}" for pct in PERCENTILES) + f" {row['max_ms']:>9.1f}")
+    print()
+
+
+def run(args):
+    scratch = configure_environment()
+    print(f"Scratch directory: {scratch}")
+    import app as backend
+    import fake_llm
+
+    latencies = fake_llm.install(backend, latency=args.latency, jitter=args.jitter, seed=args.seed)
+    server, base_url = start_server(backend.app)
+    results = []
+    try:
+        for file_name, workload in WORKLOADS.items():
+            base_df = pd.read_csv(os.path.join(ROOT, "data", file_name))
+            for scale in args.scale:
+                df = pd.concat([base_df] * scale, ignore_index=True) if scale > 1 else base_df
+                dataset_name = f"{file_name} x{scale}"
+                dataset_id = register_dataset(base_url, df, dataset_name)
+                for concurrency in args.concurrency:
+                    plan = plan_requests(workload, args.requests, args.seed)
+                    calls_before = sum(latency.calls for latency in latencies)
+                    load = LoadRun(base_url, dataset_id, dataset_name, cold=args.cold)
+                    with RssSampler() as rss:
+                        wall_seconds = load.run(plan, concurrency)
+                    llm_calls = sum(latency.calls for latency in latencies) - calls_before
+                    summary = summarize(load.results, wall_seconds)
+                    print_level(f"{dataset_name} ({len(df):,} rows), concurrency {concurrency}:", summary, llm_calls, rss.peak)
+                    results.append({"dataset": file_name, "scale": scale, "rows": len(df), "concurrency": concurrency,
+                                    "wall_seconds": wall_seconds, "llm_calls": llm_calls, "peak_rss_bytes": rss.peak,
+                                    "kinds": summary})
+    finally:
+        server.shutdown()
+        if backend.code_executor is not None:
+            backend.code_executor.shutdown()
+        backend.history_store.flush()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100], help="row multipliers for each bundled CSV")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="concurrent clients per run")
+    parser.add_argument("--requests", type=int, default=200, help="requests per dataset, scale and concurrency level")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds each fake LLM call takes")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency varies by up to this fraction either way")
+    parser.add_argument("--seed", type=int, default=0, help="seeds the request mix and the fake LLM latencies")
+    parser.add_argument("--cold", action="store_true", help="make every LLM-bound prompt unique so the code cache never hits")
+    parser.add_argument("--json", help="also write the results to this file")
+    run(parser.parse_args())
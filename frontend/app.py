@@ -5,12 +5,29 @@ import plotly.express as px
 import plotly.graph_objects as go
 import json
 import os
+import io
+import time
 from datetime import datetime
+import pyarrow as pa
+import ingest
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:5000")
 QUERY_ENDPOINT = f"{BACKEND_URL}/api/query"
 HISTORY_ENDPOINT = f"{BACKEND_URL}/api/history"
 FEEDBACK_ENDPOINT = f"{BACKEND_URL}/api/feedback"
+DATASETS_ENDPOINT = f"{BACKEND_URL}/api/datasets"
+JOBS_ENDPOINT = f"{BACKEND_URL}/api/jobs"
+BATCH_ENDPOINT = f"{BACKEND_URL}/api/query/batch"
+QUERY_TIMEOUT_SECONDS = int(os.getenv("QUERY_TIMEOUT_SECONDS", "300"))
+STREAM_READ_TIMEOUT_SECONDS = 60 #longest silence allowed on a streamed query, the backend sends keep-alives every 15s
+PROGRESS_ROUTES = {"fast_path": "local pandas", "lida": "LIDA", "pandasai": "PandasAI", "speculative": "LIDA and PandasAI"}
+BATCH_POLL_SECONDS = 0.5 #pause between status sweeps over a batch's unfinished jobs
+
+#datasets are uploaded as compressed Arrow IPC by default, JSON records remain the fallback
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "arrow") #"arrow", "parquet" or "json"
+WIRE_COMPRESSION = os.getenv("WIRE_COMPRESSION", "zstd") or None #"zstd", "lz4" or empty for none
+ARROW_STREAM_MIME = "application/vnd.apache.arrow.stream"
+PARQUET_MIME = "application/vnd.apache.parquet"
 
 st.set_page_config(layout="wide")
 st.title("🧿 CSV-ision 🧿")
@@ -18,7 +35,15 @@ st.markdown("[github.com/DwightCJH](https://github.com/DwightCJH)", unsafe_allow
 
 #initialise session state to store dataframes and prevent reprocessing
 if 'dataframes' not in st.session_state:
-    st.session_state.dataframes = {}  #dictionary to store {display_name: df}
+    st.session_state.dataframes = {}  #dictionary to store {display_name: df}, None until an Excel sheet is first selected
+if 'dataset_sources' not in st.session_state:
+    st.session_state.dataset_sources = {} #{display_name: (content_hash, sheet_name)} for sheets parsed on selection
+if 'excel_files' not in st.session_state:
+    st.session_state.excel_files = {} #{content_hash: workbook bytes} kept until their sheets are parsed
+if 'dataset_keys' not in st.session_state:
+    st.session_state.dataset_keys = {} #{display_name: content hash, plus ":sheet" for Excel} identifying cached previews
+if 'memory_usage' not in st.session_state:
+    st.session_state.memory_usage = {} #{display_name: (bytes before compacting, bytes after)}
 if 'display_names' not in st.session_state:
     st.session_state.display_names = []
 if 'last_query' not in st.session_state:
@@ -27,20 +52,288 @@ if 'last_selected_dataset' not in st.session_state:
     st.session_state.last_selected_dataset = None
 if 'prompt_history' not in st.session_state:
     st.session_state.prompt_history = [] #to store fetched history {id, prompt, dataset_name, timestamp}
+if 'history_cursor' not in st.session_state:
+    st.session_state.history_cursor = None #next_cursor for the older history beyond prompt_history, None if there is none
 if 'current_prompt_value' not in st.session_state:
     st.session_state.current_prompt_value = "" #to manage text_area value
+if 'dataset_ids' not in st.session_state:
+    st.session_state.dataset_ids = {} #{display_name: dataset_id} registered with the backend
+if 'batch_results' not in st.session_state:
+    st.session_state.batch_results = {"dataset_name": None, "items": []} #last multi-question run, items like last_query
+if 'history_cache' not in st.session_state:
+    st.session_state.history_cache = {} #{dataset_name: {"etag", "history", "next_cursor"}} revalidated with If-None-Match
+
+
+@st.cache_resource
+def get_http_session():
+    """Returns one keep-alive session shared by all reruns, so backend calls reuse pooled connections."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http = get_http_session()
+
+#parsed files are cached by content hash and shared by every session, so they must be treated as read-only
+INGEST_CACHE_ENTRIES = int(os.getenv("INGEST_CACHE_ENTRIES", "16"))
+
+@st.cache_resource(max_entries=INGEST_CACHE_ENTRIES, show_spinner=False)
+def load_csv(content_hash, _data):
+    """Parses a CSV into compact dtypes once per distinct file content."""
+    return ingest.read_csv(_data)
+
+@st.cache_resource(max_entries=INGEST_CACHE_ENTRIES, show_spinner=False)
+def load_excel_sheet_names(content_hash, _data):
+    return ingest.excel_sheet_names(_data)
+
+@st.cache_resource(max_entries=INGEST_CACHE_ENTRIES, show_spinner=False)
+def load_excel_sheet(content_hash, sheet_name, _data):
+    """Parses one Excel sheet into compact dtypes once per distinct file content."""
+    return ingest.read_excel_sheet(_data, sheet_name)
+
+PREVIEW_PAGE_SIZE = int(os.getenv("PREVIEW_PAGE_SIZE", "500")) #rows sent to the browser at a time
+PREVIEW_DEFAULT_COLUMNS = 30
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def preview_page(dataset_key, start, stop, columns, _df):
+    """Display-ready rows [start, stop) of the chosen columns, memoized per dataset, page and column selection."""
+    return ingest.display_slice(_df, start, stop, columns)
+
+def get_dataframe(display_name):
+    """Returns a dataset's DataFrame, parsing Excel sheets the first time they are selected."""
+    df = st.session_state.dataframes.get(display_name)
+    if df is None and display_name in st.session_state.dataset_sources:
+        content_hash, sheet_name = st.session_state.dataset_sources[display_name]
+        with st.spinner(f"Reading sheet '{sheet_name}'..."):
+            df, before, after = load_excel_sheet(content_hash, sheet_name, st.session_state.excel_files[content_hash])
+        st.session_state.dataframes[display_name] = df
+        st.session_state.memory_usage[display_name] = (before, after)
+        #drop the workbook once every one of its sheets has been parsed
+        if all(st.session_state.dataframes.get(name) is not None
+               for name, (source_hash, _) in st.session_state.dataset_sources.items() if source_hash == content_hash):
+            st.session_state.excel_files.pop(content_hash, None)
+    return df
 
 
 def fetch_history(dataset_name=None):
-    """Fetches prompt history from the backend, optionally filtered by dataset."""
+    """Fetches prompt history from the backend, optionally filtered by dataset, reusing the cached copy if unchanged."""
+    cache_key = dataset_name or ""
+    cached = st.session_state.history_cache.get(cache_key)
     try:
         params = {"dataset_name": dataset_name} if dataset_name else {}
-        response = requests.get(HISTORY_ENDPOINT, params=params, timeout=10)
+        headers = {"If-None-Match": cached["etag"]} if cached else {}
+        response = http.get(HISTORY_ENDPOINT, params=params, headers=headers, timeout=10)
+        if response.status_code == 304:
+            st.session_state.prompt_history = cached["history"]
+            st.session_state.history_cursor = cached["next_cursor"]
+            return
         response.raise_for_status()
-        st.session_state.prompt_history = response.json().get("history", [])
+        body = response.json()
+        history, next_cursor = body.get("history", []), body.get("next_cursor")
+        if response.headers.get("ETag"):
+            st.session_state.history_cache[cache_key] = {"etag": response.headers["ETag"], "history": history, "next_cursor": next_cursor}
+        st.session_state.prompt_history = history
+        st.session_state.history_cursor = next_cursor
     except requests.exceptions.RequestException as e:
         st.error(f"🚨 Error fetching history: {e}")
         st.session_state.prompt_history = [] #clear history on error
+        st.session_state.history_cursor = None
+
+def fetch_older_history(dataset_name=None):
+    """Appends the next page of older history, following the cursor from the last fetch."""
+    try:
+        params = {"cursor": st.session_state.history_cursor}
+        if dataset_name:
+            params["dataset_name"] = dataset_name
+        response = http.get(HISTORY_ENDPOINT, params=params, timeout=10)
+        response.raise_for_status()
+        body = response.json()
+        #the list is shared with the cache entry, so a later 304 restores the older rows too
+        st.session_state.prompt_history.extend(body.get("history", []))
+        st.session_state.history_cursor = body.get("next_cursor")
+        cached = st.session_state.history_cache.get(dataset_name or "")
+        if cached and cached["history"] is st.session_state.prompt_history:
+            cached["next_cursor"] = st.session_state.history_cursor
+    except requests.exceptions.RequestException as e:
+        st.error(f"🚨 Error fetching older history: {e}")
+
+def encode_dataset(df, fmt):
+    """Encodes a DataFrame as an Arrow IPC stream or Parquet file, returning (bytes, mimetype)."""
+    sink = io.BytesIO()
+    if fmt == "parquet":
+        df.to_parquet(sink, index=False, compression=WIRE_COMPRESSION)
+        return sink.getvalue(), PARQUET_MIME
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    options = pa.ipc.IpcWriteOptions(compression=WIRE_COMPRESSION)
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue(), ARROW_STREAM_MIME
+
+def post_frame(url, display_name, df):
+    """Posts a DataFrame in the configured wire format, falling back to JSON records, and returns the response."""
+    #compact in-memory dtypes are for this process, the backend's LLM tooling expects 64-bit numbers
+    df = ingest.widen_numerics(df)
+    response = None
+    if WIRE_FORMAT in ("arrow", "parquet"):
+        try:
+            body, mimetype = encode_dataset(df, WIRE_FORMAT)
+            files = {"data": ("data", body, mimetype)}
+            response = http.post(url, files=files, data={"dataset_name": display_name}, timeout=120)
+            if response.status_code == 415:
+                response = None #backend doesn't accept this format, fall back to JSON
+        except (pa.ArrowException, ValueError, TypeError) as e:
+            print(f"Binary encoding failed for '{display_name}', falling back to JSON: {e}")
+    if response is None:
+        payload = {"data_json": df.to_json(orient='records', date_format='iso'), "dataset_name": display_name}
+        response = http.post(url, json=payload, timeout=120)
+    return response
+
+def register_dataset(display_name, df):
+    """Uploads a dataset to the backend once and remembers its dataset_id."""
+    dataset_id = st.session_state.dataset_ids.get(display_name)
+    if dataset_id:
+        return dataset_id
+    response = post_frame(DATASETS_ENDPOINT, display_name, df)
+    response.raise_for_status()
+    dataset_id = response.json()["dataset_id"]
+    st.session_state.dataset_ids[display_name] = dataset_id
+    return dataset_id
+
+def append_rows(display_name, data):
+    """Adds the rows of a CSV to a dataset. Only the new rows are sent, the backend stores them as a new version."""
+    df = get_dataframe(display_name)
+    content_hash = ingest.content_hash(data)
+    rows, before, _ = load_csv(content_hash, data)
+    try:
+        response = post_frame(f"{DATASETS_ENDPOINT}/{register_dataset(display_name, df)}/rows", display_name, rows)
+        if response.status_code == 404:
+            #the backend no longer has the dataset, upload it again and retry
+            st.session_state.dataset_ids.pop(display_name, None)
+            response = post_frame(f"{DATASETS_ENDPOINT}/{register_dataset(display_name, df)}/rows", display_name, rows)
+        if response.status_code == 400:
+            st.error(f"🚨 Couldn't append rows: {response.json().get('error')}")
+            return False
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        st.error(f"🚨 Error appending rows: {e}")
+        return False
+    updated = pd.concat([df, rows], ignore_index=True)
+    st.session_state.dataframes[display_name] = updated
+    st.session_state.dataset_ids[display_name] = response.json()["dataset_id"]
+    st.session_state.dataset_keys[display_name] = f"{st.session_state.dataset_keys.get(display_name, display_name)}+{content_hash}"
+    previous_before, _ = st.session_state.memory_usage.get(display_name, (0, 0))
+    st.session_state.memory_usage[display_name] = (previous_before + before, ingest.memory_bytes(updated))
+    st.toast(f"Appended {len(rows):,} rows to {display_name}", icon="➕")
+    return True
+
+def read_sse(response):
+    """Yields (event, data) pairs from a text/event-stream response as they arrive."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue #keep-alive comment
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+def stream_query(prompt, display_name, df, on_event):
+    """Sends a prompt to /api/query as a stream, calling on_event(event, data) for each progress event, and returns the answer."""
+    payload = {
+        "prompt": prompt,
+        "dataset_id": register_dataset(display_name, df),
+        "dataset_name": display_name,
+        "plot_format": "object" #figure embedded as JSON with base64 typed arrays, not as an escaped string
+    }
+    request_args = {"headers": {"Accept": "text/event-stream"}, "stream": True, "timeout": (10, STREAM_READ_TIMEOUT_SECONDS)}
+    response = http.post(QUERY_ENDPOINT, json=payload, **request_args)
+    if response.status_code == 404:
+        #backend storage was cleared, upload the data again and retry once
+        response.close()
+        st.session_state.dataset_ids.pop(display_name, None)
+        payload["dataset_id"] = register_dataset(display_name, df)
+        response = http.post(QUERY_ENDPOINT, json=payload, **request_args)
+    if response.status_code == 429:
+        response.close()
+        raise requests.exceptions.RequestException("The backend is busy with other queries, please try again in a few seconds.")
+    response.raise_for_status()
+    deadline = time.monotonic() + QUERY_TIMEOUT_SECONDS
+    #leaving the block closes the stream, which stops the backend from finishing an answer nobody is waiting for
+    with response:
+        for event, data in read_sse(response):
+            if event == "answer":
+                return data
+            if event == "error":
+                raise requests.exceptions.RequestException(data.get("content") or f"Query {data.get('status')}")
+            on_event(event, data)
+            if time.monotonic() > deadline:
+                raise requests.exceptions.Timeout()
+    raise requests.exceptions.RequestException("The backend closed the stream before answering.")
+
+def show_progress(status, event, data):
+    #one line in the progress box per pipeline event
+    if event == "parsed":
+        status.write(f"Dataset ready: {data['rows']:,} rows × {data['columns']} columns")
+    elif event == "intent":
+        status.write(f"Answering with {PROGRESS_ROUTES.get(data['route'], data['route'])}")
+        status.update(label=f"Thinking ({PROGRESS_ROUTES.get(data['route'], data['route'])})...")
+    elif event == "summary":
+        status.write("Dataset summary ready" + (" (cached)" if data.get("cached") else ""))
+    elif event == "code":
+        status.write(f"{'Reusing' if data.get('cached') else 'Generated'} {data['branch']} code:")
+        status.code(data["code"], language="python")
+    elif event == "fallback":
+        status.write(f"No chart from {data['source']}, falling back to {data['target']}")
+
+def post_batch(prompts, display_name, df):
+    """Submits several prompts about one registered dataset as async jobs, returning one job body per prompt."""
+    payload = {
+        "prompts": prompts,
+        "dataset_id": register_dataset(display_name, df),
+        "dataset_name": display_name,
+        "async": True,
+        "plot_format": "object"
+    }
+    response = http.post(BATCH_ENDPOINT, json=payload, timeout=30)
+    if response.status_code == 404:
+        st.session_state.dataset_ids.pop(display_name, None)
+        payload["dataset_id"] = register_dataset(display_name, df)
+        response = http.post(BATCH_ENDPOINT, json=payload, timeout=30)
+    if response.status_code == 429:
+        raise requests.exceptions.RequestException("The backend is busy with other queries, please try fewer questions or try again in a few seconds.")
+    response.raise_for_status()
+    return response.json()["jobs"]
+
+def wait_for_jobs(jobs, on_finished):
+    """Polls a batch's jobs until all finish, calling on_finished(index, job body) as each one does."""
+    pending = {index: job["job_id"] for index, job in enumerate(jobs)}
+    deadline = time.monotonic() + QUERY_TIMEOUT_SECONDS
+    while pending:
+        for index, job_id in list(pending.items()):
+            response = http.get(f"{JOBS_ENDPOINT}/{job_id}", timeout=10)
+            response.raise_for_status()
+            job = response.json()
+            if job["status"] in ("done", "failed", "cancelled"):
+                del pending[index]
+                on_finished(index, job)
+        if not pending:
+            break
+        if time.monotonic() > deadline:
+            for job_id in pending.values():
+                http.delete(f"{JOBS_ENDPOINT}/{job_id}", timeout=10)
+            raise requests.exceptions.Timeout()
+        time.sleep(BATCH_POLL_SECONDS)
+
+def batch_item(prompt, job):
+    #a finished batch job in the same shape as last_query
+    if job["status"] == "done":
+        return {"prompt": prompt, "response": job.get("response"), "history_id": job.get("history_id"), "error": None, "feedback_given": None}
+    return {"prompt": prompt, "response": None, "history_id": None, "error": f"Query {job['status']}: {job.get('error') or 'no details'}", "feedback_given": None}
 
 def submit_feedback(history_id, feedback_value):
     """Submits feedback for a given history ID."""
@@ -49,15 +342,82 @@ def submit_feedback(history_id, feedback_value):
         return
     try:
         payload = {"history_id": history_id, "feedback": feedback_value}
-        response = requests.post(FEEDBACK_ENDPOINT, json=payload, timeout=10)
+        response = http.post(FEEDBACK_ENDPOINT, json=payload, timeout=10)
         response.raise_for_status()
         st.toast(f"Feedback '{feedback_value}' submitted!")
+        #show the feedback in the cached history now; its ETag is kept, so the next fetch still picks up the server copy
+        cached = st.session_state.history_cache.get(response.json().get("dataset_name") or "")
+        for item in cached["history"] if cached else []:
+            if item["id"] == history_id:
+                item["feedback"] = feedback_value
         #update session state to reflect feedback was given for this query
         if st.session_state.last_query.get("history_id") == history_id:
             st.session_state.last_query["feedback_given"] = feedback_value
+        for item in st.session_state.batch_results["items"]:
+            if item.get("history_id") == history_id:
+                item["feedback_given"] = feedback_value
     except requests.exceptions.RequestException as e:
         st.error(f"🚨 Error submitting feedback: {e}")
 
+def render_response(response_content):
+    """Displays a text, plot or error answer from the backend."""
+    response_type = response_content.get("response_type")
+    content = response_content.get("content")
+
+    #display content based on type
+    if response_type == "text":
+        st.markdown(content)
+    elif response_type == "plot":
+        try:
+            #content is the figure itself ("object" plot format) or its JSON string
+            fig_dict = content if isinstance(content, dict) else json.loads(content)
+            #create plotly figure, typed arrays are passed through to plotly.js as they are
+            fig = go.Figure(fig_dict)
+            st.plotly_chart(fig, use_container_width=True)
+            reduction = response_content.get("reduction")
+            if response_content.get("reduced") and reduction:
+                st.caption(f"Large traces were reduced from {reduction['points_before']:,} to "
+                           f"{reduction['points_after']:,} points for display ({', '.join(reduction['methods'])}).")
+        except json.JSONDecodeError:
+             st.error("🚨 Received plot data is not valid JSON.")
+             st.text(content)
+        except Exception as e:
+            st.error(f"🚨 Error displaying plot: {e}")
+            st.text(content)
+    elif response_type == "error":
+        st.error(f"Backend Error: {content}")
+    else:
+        st.warning("Received an unknown response type from backend.")
+        st.json(response_content)
+
+def render_batch_item(item):
+    #one question of a multi-question run with its answer or error
+    st.markdown(f"**Query:** *{item['prompt']}*")
+    if item.get("error"):
+        st.error(f"Query failed: {item['error']}")
+    elif item.get("response"):
+        render_response(item["response"])
+
+def render_feedback(history_id, feedback_given):
+    """Shows the useful / not useful buttons for an answer saved to history."""
+    if history_id is None:
+        return
+    st.markdown("---")
+    fb_col1, fb_col2, fb_col3 = st.columns([1, 1, 5])
+    with fb_col1:
+        st.button("👍 Useful", key=f"useful_{history_id}",
+                  on_click=submit_feedback, args=(history_id, "useful"),
+                  disabled=(feedback_given is not None), #disable if feedback already given
+                  type="primary" if feedback_given == "useful" else "secondary")
+    with fb_col2:
+        st.button("👎 Not Useful", key=f"notuseful_{history_id}",
+                  on_click=submit_feedback, args=(history_id, "not_useful"),
+                  disabled=(feedback_given is not None), #disable if feedback already given
+                  type="primary" if feedback_given == "not_useful" else "secondary")
+    if feedback_given:
+         with fb_col3:
+             st.caption(f"Feedback '{feedback_given}' recorded.")
+
 # --- File Uploader ---
 uploaded_files = st.file_uploader(
     "Upload your CSV or Excel files here",
@@ -80,26 +440,33 @@ if uploaded_files:
                 display_name = uploaded_file.name
                 #check if this specific CSV file display name has already been processed
                 if display_name not in existing_display_names:
-                    df = pd.read_csv(uploaded_file)
+                    data = uploaded_file.getvalue()
+                    content_hash = ingest.content_hash(data)
+                    df, before, after = load_csv(content_hash, data)
                     st.session_state.dataframes[display_name] = df
+                    st.session_state.dataset_keys[display_name] = content_hash
+                    st.session_state.memory_usage[display_name] = (before, after)
                     st.session_state.display_names.append(display_name)
                     existing_display_names.add(display_name) # Add to set
                     new_files_processed = True
                     st.toast(f"Processed CSV: {display_name}", icon="📄")
 
             elif file_type in ["xls", "xlsx"]:
-                #use uploaded_file directly with pd.ExcelFile
-                excel_file = pd.ExcelFile(uploaded_file)
-                for sheet_name in excel_file.sheet_names:
+                #only the sheet names are read now, each sheet is parsed when it is first selected
+                data = uploaded_file.getvalue()
+                content_hash = ingest.content_hash(data)
+                for sheet_name in load_excel_sheet_names(content_hash, data):
                     display_name = f"{uploaded_file.name} - {sheet_name}"
                     #check if this specific excel sheet display name has already been processed
                     if display_name not in existing_display_names:
-                        df = excel_file.parse(sheet_name)
-                        st.session_state.dataframes[display_name] = df
+                        st.session_state.excel_files[content_hash] = data
+                        st.session_state.dataset_sources[display_name] = (content_hash, sheet_name)
+                        st.session_state.dataset_keys[display_name] = f"{content_hash}:{sheet_name}"
+                        st.session_state.dataframes[display_name] = None
                         st.session_state.display_names.append(display_name)
                         existing_display_names.add(display_name) #add to set
                         new_files_processed = True
-                        st.toast(f"Processed Excel Sheet: {display_name}", icon="📊")
+                        st.toast(f"Found Excel Sheet: {display_name}", icon="📊")
             else:
                 #should not happen due to 'type' restriction, but keeping for good practice
                 st.error(f"Unsupported File Type: {uploaded_file.name}")
@@ -146,8 +513,12 @@ else:
 
 
         if selected_display_name and selected_display_name in st.session_state.dataframes:
-            selected_df = st.session_state.dataframes[selected_display_name]
+            selected_df = get_dataframe(selected_display_name)
             st.subheader(f"Preview: {selected_display_name}")
+            if selected_display_name in st.session_state.memory_usage:
+                before, after = st.session_state.memory_usage[selected_display_name]
+                st.caption(f"{len(selected_df):,} rows × {selected_df.shape[1]} columns, {ingest.format_bytes(after)} in memory "
+                           f"({ingest.format_bytes(before)} before dtype compaction)")
 
             max_rows = len(selected_df) #max rows of selected dataset
             default_rows = min(5, max_rows)
@@ -163,20 +534,41 @@ else:
             )
 
             if max_rows > 0:
-                #create a copy to avoid modifying the original DataFrame in session state
-                df_display = selected_df.head(n_rows).copy()
-
-                #iterate through columns and convert 'object' types to string
-                for col in df_display.columns:
-                    if df_display[col].dtype == 'object':
-                        try:
-                            df_display[col] = df_display[col].astype(str)
-                        except Exception as e:
-                            st.warning(f"Could not convert column '{col}' to string for display: {e}")
-
-                st.dataframe(df_display)
+                #only the shown page of the shown columns is converted and sent, and each page is memoized
+                all_columns = selected_df.columns.tolist()
+                shown_columns = st.multiselect(
+                    "Columns to display",
+                    options=all_columns,
+                    default=all_columns[:PREVIEW_DEFAULT_COLUMNS],
+                    key=f"preview_columns_{selected_display_name}"
+                )
+                n_rows = min(n_rows, max_rows)
+                page_count = -(-n_rows // PREVIEW_PAGE_SIZE)
+                page = 1
+                if page_count > 1:
+                    page = st.number_input(
+                        f"Page (of {page_count}, {PREVIEW_PAGE_SIZE} rows each)",
+                        min_value=1,
+                        max_value=page_count,
+                        value=1,
+                        step=1,
+                        key=f"preview_page_{selected_display_name}"
+                    )
+                start = (page - 1) * PREVIEW_PAGE_SIZE
+                stop = min(start + PREVIEW_PAGE_SIZE, n_rows)
+                dataset_key = st.session_state.dataset_keys.get(selected_display_name, selected_display_name)
+                st.dataframe(preview_page(dataset_key, start, stop, tuple(shown_columns), selected_df))
             else:
                 st.warning("The selected dataset is empty.")
+
+            #new rows are sent on their own and stored by the backend as a new version of the dataset
+            with st.expander("Append rows"):
+                new_rows_file = st.file_uploader("CSV with the dataset's columns", type=["csv"], key=f"append_rows_{selected_display_name}")
+                if new_rows_file is not None and st.button("Append", key=f"append_submit_{selected_display_name}"):
+                    with st.spinner("Appending rows..."):
+                        appended = append_rows(selected_display_name, new_rows_file.getvalue())
+                    if appended:
+                        st.rerun()
         else:
              st.warning("Please select a valid dataset from the list.")
 
@@ -196,6 +588,9 @@ else:
             )
             prompt = st.session_state.current_prompt_value #get the current value
 
+            #several questions at once: one per line, answered side by side and shown as each finishes
+            batch_mode = st.toggle("Ask several questions (one per line)", key=f"batch_mode_{selected_display_name}")
+
             #use a unique key for the submit button
             submit_key = f"submit_{selected_display_name}"
             submit_button = st.button("Generate", key=submit_key)
@@ -206,6 +601,10 @@ else:
                     st.caption("No history for this dataset yet.")
                 else:
                     st.caption("Click a prompt to reuse it.")
+                    #only the newest page is fetched at first, this follows the cursor for the page before it
+                    if st.session_state.history_cursor and st.button("Load older prompts", key=f"hist_more_{selected_display_name}"):
+                        fetch_older_history(selected_display_name)
+                        st.rerun()
                     #display history items, most recent first
                     for item in reversed(st.session_state.prompt_history):
                         hist_prompt = item['prompt']
@@ -216,30 +615,55 @@ else:
                             st.rerun() #rerun to update the text area display
 
             #check if the button for the *currently selected* dataset was pressed
-            if submit_button and prompt:
-                current_df = st.session_state.dataframes[selected_display_name] # get the correct df
+            batch_prompts = [line.strip() for line in prompt.splitlines() if line.strip()] if batch_mode else []
+            if submit_button and batch_prompts:
+                current_df = get_dataframe(selected_display_name)
+                if current_df.empty:
+                    st.error("Cannot query an empty dataset.")
+                else:
+                    st.session_state.last_query = {"prompt": "", "response": None, "error": None, "history_id": None, "feedback_given": None}
+                    items = [None] * len(batch_prompts)
+                    placeholders = [st.empty() for _ in batch_prompts]
+                    for placeholder, batch_prompt in zip(placeholders, batch_prompts):
+                        placeholder.caption(f"⏳ {batch_prompt}")
+
+                    def show_finished(index, job):
+                        items[index] = batch_item(batch_prompts[index], job)
+                        with placeholders[index].container():
+                            render_batch_item(items[index])
+
+                    try:
+                        with st.spinner(f"Answering {len(batch_prompts)} questions... "):
+                            jobs = post_batch(batch_prompts, selected_display_name, current_df)
+                            wait_for_jobs(jobs, show_finished)
+                        st.session_state.batch_results = {"dataset_name": selected_display_name, "items": items}
+                        fetch_history(selected_display_name)
+                        st.session_state.current_prompt_value = ""
+                        st.rerun() #redraw with feedback buttons for each answer
+                    except requests.exceptions.Timeout:
+                        st.error(f"🚨 Some questions did not finish within {QUERY_TIMEOUT_SECONDS} seconds and were cancelled.")
+                    except requests.exceptions.RequestException as e:
+                        st.error(f"🚨 Error communicating with backend: {e}")
+                    #only reached when the batch failed part way: keep the answers that did arrive
+                    for placeholder in placeholders:
+                        placeholder.empty()
+                    st.session_state.batch_results = {"dataset_name": selected_display_name, "items": [item for item in items if item]}
+
+            elif submit_button and prompt and not batch_mode:
+                current_df = get_dataframe(selected_display_name) # get the correct df
                 #ensure dataframe is not empty
                 if current_df.empty:
                     st.error("Cannot query an empty dataset.")
                 else:
-                    with st.spinner("Thinking... "):
+                    st.session_state.batch_results = {"dataset_name": None, "items": []}
+                    status = st.status("Thinking...", expanded=True)
+                    with status:
                         try:
-                            #convert dataframe to JSON records format
-                            #ensure correct orientation
-                            data_json = current_df.to_json(orient='records')
-
-                            #prepare payload for backend
-                            payload = {
-                                "prompt": prompt,
-                                "data_json": data_json,
-                                "dataset_name": selected_display_name
-                            }
-
-                            #send request to backend
-                            response = requests.post(QUERY_ENDPOINT, json=payload, timeout=120)
-                            response.raise_for_status()
-
-                            response_data = response.json()
+                            #the dataset is uploaded once, later prompts only send its dataset_id.
+                            #progress is shown as the backend reports it, and the answer as soon as it exists
+                            response_data = stream_query(prompt, selected_display_name, current_df,
+                                                         lambda event, data: show_progress(status, event, data))
+                            status.update(label="Done", state="complete", expanded=False)
                             #store the response associated with the specific prompt and dataset
                             st.session_state.last_query = {
                                 "prompt": prompt,
@@ -254,7 +678,7 @@ else:
                             st.rerun() #rerun to display the new result immediately
 
                         except requests.exceptions.Timeout:
-                            st.error(f"🚨 Request timed out after 120 seconds. The query might be too complex or the backend is slow.")
+                            st.error(f"🚨 Request timed out after {QUERY_TIMEOUT_SECONDS} seconds. The query might be too complex or the backend is slow.")
                             st.session_state.last_query = {"prompt": prompt, "dataset_name": selected_display_name, "response": None, "error": "Request Timed Out", "history_id": None, "feedback_given": None}
                         except requests.exceptions.RequestException as e:
                             st.error(f"🚨 Error communicating with backend: {e}")
@@ -265,58 +689,20 @@ else:
 
             # --- Display results from session state ---
             if st.session_state.last_query.get("dataset_name") == selected_display_name:
-                current_history_id = st.session_state.last_query.get("history_id")
-                feedback_given = st.session_state.last_query.get("feedback_given")
-
                 if st.session_state.last_query.get("error"):
                     st.error(f"Previous query failed: {st.session_state.last_query['error']}")
                 elif st.session_state.last_query.get("response"):
                     st.markdown("---")
                     st.markdown(f"**Query:** *{st.session_state.last_query['prompt']}*") #show the query for context
                     st.subheader("💡 Answer:")
-                    response_content = st.session_state.last_query["response"]
-                    response_type = response_content.get("response_type")
-                    content = response_content.get("content")
-
-                    #display content based on type
-                    if response_type == "text":
-                        st.markdown(content)
-                    elif response_type == "plot":
-                        try:
-                            #content is expected to be a JSON string representation of a plotly figure
-                            fig_dict = json.loads(content)
-                            #create plotly figure
-                            fig = go.Figure(fig_dict)
-                            st.plotly_chart(fig, use_container_width=True)
-                        except json.JSONDecodeError:
-                             st.error("🚨 Received plot data is not valid JSON.")
-                             st.text(content)
-                        except Exception as e:
-                            st.error(f"🚨 Error displaying plot: {e}")
-                            st.text(content)
-                    elif response_type == "error":
-                        st.error(f"Backend Error: {content}")
-                    else:
-                        st.warning("Received an unknown response type from backend.")
-                        st.json(response_content)
-
-                    # --- Feedback Section ---
-                    if current_history_id is not None:
-                        st.markdown("---")
-                        fb_col1, fb_col2, fb_col3 = st.columns([1, 1, 5])
-                        with fb_col1:
-                            st.button("👍 Useful", key=f"useful_{current_history_id}",
-                                      on_click=submit_feedback, args=(current_history_id, "useful"),
-                                      disabled=(feedback_given is not None), #disable if feedback already given
-                                      type="primary" if feedback_given == "useful" else "secondary")
-                        with fb_col2:
-                            st.button("👎 Not Useful", key=f"notuseful_{current_history_id}",
-                                      on_click=submit_feedback, args=(current_history_id, "not_useful"),
-                                      disabled=(feedback_given is not None), #disable if feedback already given
-                                      type="primary" if feedback_given == "not_useful" else "secondary")
-                        if feedback_given:
-                             with fb_col3:
-                                 st.caption(f"Feedback '{feedback_given}' recorded.")
+                    render_response(st.session_state.last_query["response"])
+                    render_feedback(st.session_state.last_query.get("history_id"), st.session_state.last_query.get("feedback_given"))
+
+            elif st.session_state.batch_results["dataset_name"] == selected_display_name:
+                for item in st.session_state.batch_results["items"]:
+                    st.markdown("---")
+                    render_batch_item(item)
+                    render_feedback(item.get("history_id"), item.get("feedback_given"))
 
         else:
             st.info("Select a dataset from the left to start asking questions.")
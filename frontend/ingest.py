@@ -0,0 +1,108 @@
+import hashlib
+import io
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# --- Ingestion Settings ---
+CATEGORY_MAX_UNIQUE_RATIO = 0.5 #string columns with at most this share of distinct values become categories
+DATE_SAMPLE_SIZE = 200 #values tried as dates before converting a whole string column
+
+
+def content_hash(data: bytes) -> str:
+    """Returns the sha256 of an uploaded file, used as its cache key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def memory_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def _parse_dates(series: pd.Series):
+    #returns the column as datetime64 if every value is a date, otherwise None
+    sample = series.dropna().head(DATE_SAMPLE_SIZE)
+    if sample.empty or not all(isinstance(value, str) and any(ch.isdigit() for ch in value) for value in sample):
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") #"could not infer format" warnings for columns that aren't dates
+        if pd.to_datetime(sample, errors="coerce").isna().any():
+            return None
+        parsed = pd.to_datetime(series, errors="coerce")
+    if parsed.isna().sum() > series.isna().sum():
+        return None #some values didn't parse, keep the text rather than lose them
+    return parsed
+
+
+def _compact_column(series: pd.Series) -> pd.Series:
+    kind = series.dtype.kind
+    if kind == "O":
+        dates = _parse_dates(series)
+        if dates is not None:
+            return dates
+        if series.nunique(dropna=True) <= len(series) * CATEGORY_MAX_UNIQUE_RATIO:
+            return series.astype("category")
+        return series
+    if kind == "i":
+        return pd.to_numeric(series, downcast="integer")
+    if kind == "u":
+        return pd.to_numeric(series, downcast="unsigned")
+    if kind == "f":
+        #only when no value changes, float32 would alter prices, averages and so on
+        narrow = series.astype("float32")
+        if np.array_equal(narrow.to_numpy(dtype="float64"), series.to_numpy(), equal_nan=True):
+            return narrow
+    return series
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns df with parsed dates, repetitive strings as categories and numbers downcast without loss."""
+    if df.empty:
+        return df
+    return pd.concat([_compact_column(df.iloc[:, i]) for i in range(df.shape[1])], axis=1)
+
+
+def widen_numerics(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns df with numbers back as int64/float64, which LIDA's summarizer recognizes as numeric."""
+    narrow = [col for col, dtype in df.dtypes.items() if dtype.kind in "iuf" and dtype.itemsize < 8]
+    if not narrow:
+        return df
+    return df.astype({col: "float64" if df[col].dtype.kind == "f" else "int64" for col in narrow})
+
+
+def display_slice(df: pd.DataFrame, start: int, stop: int, columns) -> pd.DataFrame:
+    """Returns rows [start, stop) of the given columns, with object columns as text so Streamlit can render them."""
+    view = df.iloc[start:stop][list(columns)].copy()
+    for col in view.columns[view.dtypes == object]:
+        view[col] = view[col].astype(str)
+    return view
+
+
+def read_csv(data: bytes):
+    """Parses CSV bytes into a compact DataFrame, returning (df, bytes before compacting, bytes after)."""
+    df = pd.read_csv(io.BytesIO(data))
+    before = memory_bytes(df)
+    df = compact_dtypes(df)
+    return df, before, memory_bytes(df)
+
+
+def excel_sheet_names(data: bytes) -> list:
+    #only reads the workbook's sheet list, sheets are parsed when first selected
+    with pd.ExcelFile(io.BytesIO(data)) as excel_file:
+        return excel_file.sheet_names
+
+
+def read_excel_sheet(data: bytes, sheet_name):
+    """Parses one Excel sheet into a compact DataFrame, returning (df, bytes before compacting, bytes after)."""
+    df = pd.read_excel(io.BytesIO(data), sheet_name=sheet_name)
+    before = memory_bytes(df)
+    df = compact_dtypes(df)
+    return df, before, memory_bytes(df)